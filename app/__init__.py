@@ -1,51 +1,119 @@
-import logging
-import os
-
-from logging.handlers import RotatingFileHandler, SMTPHandler
-from threading import main_thread
-from flask import Flask
-from config import Config
-from flask_sqlalchemy import SQLAlchemy
-from flask_migrate import Migrate
+from flask import Flask, current_app
 from flask_login import LoginManager
+from werkzeug.local import LocalProxy
+from config import Config
+from app.bloom import IdentityFilter
+from app.cache import LRUCache, UserCache
+from app.engine import EngineProfile
+from app.explore import ExploreFeed
+from app.fragments import FragmentCache
+from app.last_seen import LastSeenTracker
+from app.live import LiveHub
+from app.logging_pipeline import LogPipeline
+from app.passwords import PasswordHasher
+from app.profiling import SQLProfiler
+from app.replicas import RoutingSQLAlchemy
+
+# extensions that only need to be configured are created once and attached to
+# every app by create_app(). The ones that keep state (caches, background
+# threads, process pools...) get a new instance per app, stored in
+# app.extensions, and the names below are proxies to the instance of the
+# current app, so several apps with different configurations can live in the
+# same process (e.g. tests running in parallel). They are defined after the
+# imports above, as some have the name of the module of their class
+
+# sends the reads of read only views to the replicas, if any
+db = RoutingSQLAlchemy()
+login = LoginManager()
+login.login_view = "auth.login"
+
+
+def _extension(name):
+    return LocalProxy(lambda: current_app.extensions[name])
+
+
+engine_profile = _extension("engine_profile")
+last_seen = _extension("last_seen")
+# ids followed by each user, see User.followed_ids()
+follow_cache = _extension("follow_cache")
+user_cache = _extension("user_cache")
+fragments = _extension("fragments")
+sql_profiler = _extension("sql_profiler")
+passwords = _extension("passwords")
+# usernames and emails in use, see app/auth/forms.py
+identities = _extension("identities")
+# pub/sub of the live updates, see app/live.py
+hub = _extension("hub")
+# newest posts of everyone, see app/explore.py
+explore = _extension("explore")
+
+
+def _init_migrate(app):
+    # Flask-Migrate imports Alembic, which takes about as long to import as
+    # the rest of the app and is only used by the "flask db" commands, so it's
+    # set up the first time they look for it (the commands themselves are
+    # imported lazily too, see app/cli.py)
+    migrate = None
+
+    def load():
+        nonlocal migrate
+        if migrate is None:
+            from flask_migrate import Migrate
+
+            Migrate(app, db)
+            migrate = app.extensions["migrate"]
+        return migrate
+
+    app.extensions["migrate"] = LocalProxy(load)
+
 
-app = Flask(__name__)
-app.config.from_object(Config)
-db = SQLAlchemy(app)
-migrate = Migrate(app, db)
-login = LoginManager(app)
-login.login_view = "login"
-
-if not app.debug:
-    if app.config["MAIL_SERVER"]:
-        auth = None
-        if app.config["MAIL_USERNAME"] or app.config["MAIL_PASSWORD"]:
-            auth = (app.config["MAIL_USERNAME"], app.config["MAIL_PASSWORD"])
-        secure = None
-        if app.config["MAIL_USE_TLS"]:
-            secure = ()
-        mail_handler = SMTPHandler(
-            mailhost=(app.config["MAIL_SERVER"], app.config["MAIL_PORT"]),
-            fromaddr=f"no-reply@{app.config['MAIL_SERVER']}",
-            toaddrs=app.config["ADMINS"],
-            subject="Microblog Failure",
-            credentials=auth,
-            secure=secure,
-        )
-        mail_handler.setLevel(logging.ERROR)
-        # below we attach the SMTPHandler from the logging library to the
-        # logger object of the Flask library
-        app.logger.addHandler(mail_handler)
-
-    if not os.path.exists("logs"):
-        os.mkdir("logs")
-    file_handler = RotatingFileHandler("logs/microblog.log", maxBytes=10240, backupCount=10)
-    file_handler.setFormatter(
-        logging.Formatter("%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]")
+def create_app(config_class=Config):
+    app = Flask(__name__)
+    app.config.from_object(config_class)
+
+    db.init_app(app)
+    EngineProfile(app, db)
+    _init_migrate(app)
+    login.init_app(app)
+    LastSeenTracker(app)
+    app.extensions["follow_cache"] = LRUCache(
+        app.config["FOLLOW_CACHE_SIZE"], app.config["FOLLOW_CACHE_TTL"]
     )
-    file_handler.setLevel(logging.INFO)
-    app.logger.addHandler(file_handler)
-    app.logger.setLevel(logging.INFO)
-    app.logger.info("Microblog setup")
+    UserCache(app)
+    FragmentCache(app)
+    SQLProfiler(app)
+    PasswordHasher(app)
+    IdentityFilter(app)
+    LiveHub(app)
+    ExploreFeed(app)
+
+    from app.errors import bp as errors_bp
+
+    app.register_blueprint(errors_bp)
+
+    from app.auth import bp as auth_bp
+
+    app.register_blueprint(auth_bp)
+
+    from app.main import bp as main_bp
+
+    app.register_blueprint(main_bp)
+
+    from app.api import bp as api_bp
+
+    app.register_blueprint(api_bp)
+
+    from app import cli
+
+    cli.register(app)
+
+    if not app.debug and not app.testing:
+        # file and email handlers run behind a queue, see
+        # app/logging_pipeline.py. They are only set up when the first request
+        # comes in, so CLI commands don't create log files
+        LogPipeline(app)
+
+    return app
+
 
-from app import routes, models, errors
+from app import models
@@ -0,0 +1,7 @@
+from flask import Blueprint
+
+# the version is part of the URLs, an incompatible API would be a new
+# blueprint under /api/v2 while clients of v1 keep working
+bp = Blueprint("api", __name__, url_prefix="/api/v1")
+
+from app.api import errors, routes
@@ -0,0 +1,27 @@
+from flask import jsonify, request
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import HTTP_STATUS_CODES
+
+from app.api import bp
+
+
+def error_response(status_code, message=None):
+    payload = {"error": HTTP_STATUS_CODES.get(status_code, "Unknown error")}
+    if message:
+        payload["message"] = message
+    response = jsonify(payload)
+    response.status_code = status_code
+    return response
+
+
+def wants_json_response():
+    # errors of the API are answered in JSON, including the ones raised before
+    # any view is found, like the 404 of an unknown URL under the API prefix
+    return request.path.startswith(bp.url_prefix + "/")
+
+
+# errors without an application wide handler (400, 401, 405...) raised by the
+# API views, the others go through app/errors/handlers.py
+@bp.errorhandler(HTTPException)
+def http_error(error):
+    return error_response(error.code, error.description)
@@ -0,0 +1,123 @@
+from flask import current_app, jsonify, request, url_for
+from flask_login import current_user
+
+from app import archive, timeline
+from app.api import bp
+from app.api.errors import error_response
+from app.api.rows import (
+    archived_post_rows,
+    post_dict,
+    post_rows,
+    stream_ndjson,
+    user_dict,
+    user_rows,
+)
+from app.models import ArchivedPost, Post, User, followers
+from app.pagination import chain_paginate, keyset_chain
+from app.replicas import read_only
+
+# every list is keyset paginated like the pages of the site: the response has
+# the items of one page and the cursors of the pages before and after it. With
+# "Accept: application/x-ndjson" (or ?format=ndjson) the whole list is
+# streamed instead, one JSON document per line, newest first. Lists of posts
+# continue into the archived posts past the oldest hot one, see app/archive.py
+
+
+@bp.before_request
+def require_login():
+    # the API uses the same session as the pages, without the redirect to the
+    # login page of @login_required
+    if not current_user.is_authenticated:
+        return error_response(401)
+
+
+def wants_ndjson():
+    if request.args.get("format") == "ndjson":
+        return True
+    best = request.accept_mimetypes.best_match(["application/json", "application/x-ndjson"])
+    return best == "application/x-ndjson"
+
+
+def list_response(sources, serialize, per_page):
+    # sources are the (query, sort columns) pairs of the list, see
+    # chain_paginate(), most lists have a single one
+    if wants_ndjson():
+        batch_size = current_app.config["API_STREAM_BATCH_SIZE"]
+        return stream_ndjson(keyset_chain(sources, batch_size), serialize, batch_size)
+    per_page = request.args.get("per_page", per_page, type=int)
+    per_page = max(1, min(per_page, current_app.config["API_MAX_PER_PAGE"]))
+    page = chain_paginate(sources, request.args.get("cursor"), per_page)
+    links = {}
+    for name, cursor in (("next", page.next_cursor), ("prev", page.prev_cursor)):
+        if cursor:
+            links[name] = url_for(
+                request.endpoint, cursor=cursor, per_page=per_page, **request.view_args
+            )
+    return jsonify(
+        {
+            "items": [serialize(row) for row in page.items],
+            "next_cursor": page.next_cursor,
+            "prev_cursor": page.prev_cursor,
+            "_links": links,
+        }
+    )
+
+
+def get_user_or_404(username):
+    return user_rows().filter(User.username == username).first_or_404()
+
+
+@bp.route("/timeline")
+@read_only
+def get_timeline():
+    return list_response(
+        timeline.home_sources(current_user, post_rows(), archived_post_rows()),
+        post_dict,
+        current_app.config["POSTS_PER_PAGE"],
+    )
+
+
+@bp.route("/users/<username>")
+@read_only
+def get_user(username):
+    user = get_user_or_404(username)
+    data = user_dict(user)
+    data["is_following"] = current_user.is_following(user)
+    data["_links"] = {
+        "posts": url_for("api.get_user_posts", username=user.username),
+        "followers": url_for("api.get_followers", username=user.username),
+        "following": url_for("api.get_following", username=user.username),
+    }
+    return jsonify(data)
+
+
+@bp.route("/users/<username>/posts")
+@read_only
+def get_user_posts(username):
+    user = get_user_or_404(username)
+    return list_response(
+        [
+            (post_rows().filter(Post.user_id == user.id), archive.HOT_COLUMNS),
+            (archived_post_rows().filter(ArchivedPost.user_id == user.id), archive.COLD_COLUMNS),
+        ],
+        post_dict,
+        current_app.config["POSTS_PER_PAGE"],
+    )
+
+
+@bp.route("/users/<username>/followers")
+@read_only
+def get_followers(username):
+    user = get_user_or_404(username)
+    query = user_rows().join(followers, followers.c.follower_id == User.id)
+    query = query.filter(followers.c.followed_id == user.id)
+    return list_response([(query, [User.id])], user_dict, current_app.config["USERS_PER_PAGE"])
+
+
+@bp.route("/users/<username>/following")
+@read_only
+def get_following(username):
+    user = get_user_or_404(username)
+    query = user_rows().join(followers, followers.c.followed_id == User.id)
+    query = query.filter(followers.c.follower_id == user.id)
+    return list_response([(query, [User.id])], user_dict, current_app.config["USERS_PER_PAGE"])
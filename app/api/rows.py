@@ -0,0 +1,103 @@
+import json
+
+from flask import Response, stream_with_context
+
+from app import db
+from app.models import ArchivedPost, Post, User, avatar_url
+
+# the API reads plain rows, named tuples with only the columns it returns,
+# instead of ORM objects: no identity map, no instrumented attributes and no
+# relationships to load, the author of a post comes from the same join. Each
+# row is turned into a dict by one of the functions below
+
+POST_COLUMNS = (
+    Post.id,
+    Post.body,
+    Post.timestamp,
+    User.username.label("author"),
+    User.email_hash.label("author_email_hash"),
+)
+
+# the same columns of the archived posts (see app/archive.py)
+ARCHIVED_POST_COLUMNS = (
+    ArchivedPost.id,
+    ArchivedPost.body,
+    ArchivedPost.timestamp,
+    User.username.label("author"),
+    User.email_hash.label("author_email_hash"),
+)
+
+USER_COLUMNS = (
+    User.id,
+    User.username,
+    User.about_me,
+    User.last_seen,
+    User.email_hash,
+    User.followers_count,
+    User.following_count,
+    User.posts_count,
+)
+
+
+def post_rows():
+    return db.session.query(*POST_COLUMNS).join(User, User.id == Post.user_id)
+
+
+def archived_post_rows():
+    return db.session.query(*ARCHIVED_POST_COLUMNS).join(User, User.id == ArchivedPost.user_id)
+
+
+def user_rows():
+    return db.session.query(*USER_COLUMNS)
+
+
+def timestamp(value):
+    # the database stores naive UTC datetimes
+    return None if value is None else value.isoformat() + "Z"
+
+
+def post_dict(row):
+    return {
+        "id": row.id,
+        "body": row.body,
+        "timestamp": timestamp(row.timestamp),
+        "author": {"username": row.author, "avatar": avatar_url(row.author_email_hash, 36)},
+    }
+
+
+def user_dict(row):
+    return {
+        "id": row.id,
+        "username": row.username,
+        "about_me": row.about_me,
+        "last_seen": timestamp(row.last_seen),
+        "avatar": avatar_url(row.email_hash, 128),
+        "followers_count": row.followers_count,
+        "following_count": row.following_count,
+        "posts_count": row.posts_count,
+    }
+
+
+def stream_ndjson(rows, serialize, batch_size):
+    """Return a response with one JSON document per row of rows.
+
+    rows is an iterator fetching them batch_size at a time, like
+    keyset_chain(), and each batch is sent as soon as it is serialized, so the
+    response starts right away and the memory used doesn't depend on the
+    number of rows.
+    """
+    dumps = json.JSONEncoder(separators=(",", ":")).encode
+
+    def generate():
+        lines = []
+        for row in rows:
+            lines.append(dumps(serialize(row)))
+            if len(lines) == batch_size:
+                yield "\n".join(lines) + "\n"
+                lines = []
+        if lines:
+            yield "\n".join(lines) + "\n"
+
+    # the request context (and with it the database session) stays around
+    # until the generator is done
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
@@ -0,0 +1,146 @@
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import func, select, text
+from sqlalchemy.exc import OperationalError
+
+from app import db
+from app.batching import chunks
+from app.models import ArchivedPost, Post, Timeline, followers
+from app.pagination import chain_paginate
+
+# hot/cold tiering of the posts. Pages read the newest posts over and over and
+# almost never the old ones, yet every post makes the indexes of the post table
+# bigger. "flask archive run" moves the posts older than ARCHIVE_AFTER_DAYS to
+# the post_archive table (the cold tier), so the post table (the hot tier) and
+# its indexes only grow with the recent posts:
+#
+# * posts are moved oldest first, in batches of ARCHIVE_BATCH_SIZE that are
+#   each committed on their own with a pause of ARCHIVE_PAUSE seconds between
+#   them, so a large backlog never holds the write lock for long
+# * the timeline rows of the moved posts are deleted with them, the home
+#   timeline reads the archived posts of the followed users instead
+# * lists of posts are paginated by paginate() (or chain_paginate() for the
+#   home timeline): they read the hot tier only and continue into the archive
+#   once a page goes past its oldest post, with the same cursors, so most
+#   pages never touch the archive
+#
+# archived posts keep their ids, still count in posts_count and are found by
+# search, through an index of their own (see app/search.py)
+
+post_table = Post.__table__
+archive_table = ArchivedPost.__table__
+timeline_table = Timeline.__table__
+
+HOT_COLUMNS = [Post.timestamp, Post.id]
+COLD_COLUMNS = [ArchivedPost.timestamp, ArchivedPost.id]
+
+
+def paginate(hot, cold, cursor=None, per_page=25):
+    """Return a Page of the posts of hot (Post) followed by those of cold.
+
+    cold selects the ArchivedPost rows (or columns) of the same list, it's only
+    queried when the page reaches past the oldest post of hot.
+    """
+    return chain_paginate([(hot, HOT_COLUMNS), (cold, COLD_COLUMNS)], cursor, per_page)
+
+
+def _next_batch(cutoff, batch_size):
+    # ids of the oldest posts before cutoff, the timestamp of the newest one
+    # and the inboxes they were pushed to: their authors and their followers
+    rows = db.session.execute(
+        select(Post.id, Post.user_id, Post.timestamp)
+        .where(Post.timestamp < cutoff)
+        .order_by(Post.timestamp, Post.id)
+        .limit(batch_size)
+    ).all()
+    if not rows:
+        return [], None, []
+    authors = {row.user_id for row in rows}
+    inboxes = set(authors)
+    for chunk in chunks(sorted(authors), batch_size):
+        query = select(followers.c.follower_id).where(followers.c.followed_id.in_(chunk))
+        inboxes.update(row[0] for row in db.session.execute(query))
+    return [row.id for row in rows], rows[-1].timestamp, sorted(inboxes)
+
+
+def _move(ids, newest, inboxes, batch_size):
+    db.session.execute(
+        archive_table.insert().from_select(
+            ["id", "body", "timestamp", "user_id"],
+            select(Post.id, Post.body, Post.timestamp, Post.user_id).where(Post.id.in_(ids)),
+        )
+    )
+    # a seek on (user_id, timestamp) per inbox, the rows of these posts are
+    # at their oldest end
+    for chunk in chunks(inboxes, batch_size):
+        db.session.execute(
+            timeline_table.delete()
+            .where(timeline_table.c.user_id.in_(chunk))
+            .where(timeline_table.c.timestamp <= newest)
+            .where(timeline_table.c.post_id.in_(ids))
+        )
+    db.session.execute(post_table.delete().where(post_table.c.id.in_(ids)))
+    db.session.commit()
+
+
+def archive(older_than, batch_size=None, pause=None, limit=None, echo=None):
+    """Move the posts older than older_than (a timedelta) to the archive.
+
+    At most limit posts, by default all of them. Returns how many were moved.
+    """
+    echo = echo or (lambda message: None)
+    config = current_app.config
+    batch_size = batch_size or config["ARCHIVE_BATCH_SIZE"]
+    pause = config["ARCHIVE_PAUSE"] if pause is None else pause
+    cutoff = datetime.utcnow() - older_than
+    moved = 0
+    while limit is None or moved < limit:
+        size = batch_size if limit is None else min(batch_size, limit - moved)
+        ids, newest, inboxes = _next_batch(cutoff, size)
+        # the writes start a new transaction, on SQLite reading first would
+        # make it upgrade a read transaction to a write, see jobs.claim()
+        db.session.rollback()
+        if not ids:
+            break
+        _move(ids, newest, inboxes, batch_size)
+        moved += len(ids)
+        echo(f"Archived {moved} posts, up to {newest.isoformat(' ', 'seconds')}")
+        if pause:
+            # leaves the database to the app between batches
+            time.sleep(pause)
+    return moved
+
+
+def _table_bytes(table):
+    # bytes used by table and its indexes, from the dbstat virtual table of
+    # SQLite when it's compiled in, None elsewhere
+    if db.engine.dialect.name != "sqlite":
+        return None
+    names = db.session.execute(
+        text("SELECT name FROM sqlite_master WHERE tbl_name = :table"), {"table": table.name}
+    ).scalars()
+    try:
+        return sum(
+            db.session.execute(
+                text("SELECT pgsize FROM dbstat WHERE name = :name AND aggregate = 1"), {"name": name}
+            ).scalar()
+            or 0
+            for name in list(names)
+        )
+    except OperationalError:
+        return None
+
+
+def stats():
+    """Return the posts and bytes of the hot and the cold tier.
+
+    Bytes are None when the database can't tell.
+    """
+    tiers = {}
+    for tier, table in (("hot", post_table), ("cold", archive_table)):
+        posts = db.session.execute(select(func.count()).select_from(table)).scalar()
+        tiers[tier] = {"posts": posts, "bytes": _table_bytes(table)}
+    db.session.rollback()
+    return tiers
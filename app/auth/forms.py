@@ -0,0 +1,61 @@
+from flask_wtf import FlaskForm
+from wtforms import StringField, PasswordField, BooleanField, SubmitField
+from wtforms.validators import ValidationError, DataRequired, Email, EqualTo
+from sqlalchemy import or_
+from app import db, identities
+from app.models import User
+
+
+def taken_identities(username=None, email=None):
+    # which of the username and email are already used, in at most one query:
+    # the identity filter rules out the values that were never used, the ones
+    # it isn't sure about are checked together
+    maybe = identities.might_exist(username, email)
+    if not maybe:
+        return set()
+    conditions = []
+    if "username" in maybe:
+        conditions.append(User.username == username)
+    if "email" in maybe:
+        conditions.append(User.email == email)
+    taken = set()
+    for found_username, found_email in db.session.query(User.username, User.email).filter(
+        or_(*conditions)
+    ):
+        if "username" in maybe and found_username == username:
+            taken.add("username")
+        if "email" in maybe and found_email == email:
+            taken.add("email")
+    return taken
+
+
+class LoginForm(FlaskForm):
+    username = StringField("Username", validators=[DataRequired()])
+    password = PasswordField("Password", validators=[DataRequired()])
+    remember_me = BooleanField("Remember Me")
+    submit = SubmitField("Sign In")
+
+
+class RegistrationForm(FlaskForm):
+    username = StringField("Username", validators=[DataRequired()])
+    email = StringField("email", validators=[DataRequired(), Email()])
+    password = StringField("Password", validators=[DataRequired()])
+    password2 = StringField("Repeat password", validators=[DataRequired(), EqualTo("password")])
+    submit = SubmitField("Register")
+
+    # WTForms automagically uses functions name validate_<field> as additional
+    # validators to the field in the name. Both fields are checked by the same
+    # query, made by whichever validator runs first
+
+    def _taken(self):
+        if getattr(self, "_taken_identities", None) is None:
+            self._taken_identities = taken_identities(self.username.data, self.email.data)
+        return self._taken_identities
+
+    def validate_username(self, username):
+        if "username" in self._taken():
+            raise ValidationError("This username is already taken! Please use a different one")
+
+    def validate_email(self, email):
+        if "email" in self._taken():
+            raise ValidationError("This email already has an account! Please use a different one")
@@ -0,0 +1,73 @@
+from flask import render_template, flash, redirect, url_for, request
+from flask_login import current_user, login_user, logout_user
+from sqlalchemy.exc import IntegrityError
+from werkzeug.urls import url_parse
+
+from app import db, identities, passwords
+from app.auth import bp
+from app.auth.forms import LoginForm, RegistrationForm
+from app.models import User
+
+
+@bp.route("/login", methods=["GET", "POST"])
+def login():
+    # if an authenticated gets to the Login page by mistake, redirect to Home
+    if current_user.is_authenticated:
+        return redirect(url_for("main.index"))
+    form = LoginForm()
+    if form.validate_on_submit():
+        user = User.query.filter_by(username=form.username.data).first()
+        if user is None or not user.check_password(form.password.data):
+            flash("Invalid username or password")
+            return redirect(url_for("auth.login"))
+        # upgrade hashes made with older parameters while we have the password
+        if passwords.needs_rehash(user.password_hash):
+            user.set_password(form.password.data)
+            db.session.commit()
+        login_user(user, remember=form.remember_me.data)
+
+        # redirect user to next page, which is useful for redirecting users
+        # back to the login-required page that took them to the login page
+        next_page = request.args.get("next")
+        if not next_page or url_parse(next_page).netloc != "":
+            next_page = url_for("main.index")
+        return redirect(next_page)
+    return render_template("auth/login.html", title="Login", form=form)
+
+    if form.validate_on_submit():
+        flash(f"Login requested for user {form.username.data},\
+                remember_me={form.remember_me.data}")
+        return redirect(url_for("main.index"))
+    return render_template("auth/login.html", title="Sign In", form=form)
+
+
+@bp.route("/logout")
+def logout():
+    logout_user()
+    return redirect(url_for("main.index"))
+
+
+@bp.route("/register", methods=["GET", "POST"])
+def register():
+    if current_user.is_authenticated:
+        return redirect(url_for("main.index"))
+    form = RegistrationForm()
+    if form.validate_on_submit():
+        # create User object using form data
+        user = User(username=form.username.data, email=form.email.data)
+        user.set_password(form.password.data)
+
+        # add and commit new User object to database. The form only checked
+        # the username and email were free, the unique constraints decide if
+        # someone else registered them in the meantime
+        db.session.add(user)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            flash("This username or email was just taken! Please use a different one")
+            return render_template("auth/register.html", title="Register", form=form)
+        identities.add(user.username, user.email)
+        flash("Contratulations, you are now a registered user!")
+        return redirect(url_for("auth.login"))
+    return render_template("auth/register.html", title="Register", form=form)
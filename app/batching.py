@@ -0,0 +1,14 @@
+import itertools
+
+
+def chunks(rows, size):
+    """Yield the rows of an iterable in lists of up to size rows.
+
+    Lazily, so a stream of rows is never loaded in memory all at once.
+    """
+    iterator = iter(rows)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
@@ -0,0 +1,140 @@
+import hashlib
+import math
+import threading
+import time
+
+# Bloom filters answer "is this key in the set?" with either "definitely not"
+# or "maybe", using a few bits per key. The registration forms use them to
+# skip the database when a username or email was never used, which is the
+# common case for a legitimate signup. A "maybe" (a real match or a false
+# positive, ~IDENTITY_FILTER_ERROR_RATE of the time) falls back to a query, and
+# the unique constraints of the user table stay the final word.
+
+
+class BloomFilter(object):
+    def __init__(self, capacity, error_rate=0.01):
+        # optimal number of bits and of hash functions for the capacity
+        self.size = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.capacity = capacity
+        self.count = 0
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, key):
+        # double hashing: the k positions are h1 + i * h2, from one digest
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+
+class IdentityFilter(object):
+    # filters of the usernames and emails in use. They are built from the
+    # database on first use rather than when the app is created, so CLI
+    # commands don't pay for it, and rebuilt every IDENTITY_FILTER_REFRESH
+    # seconds to pick up the users created by other processes and to forget
+    # usernames that were changed (Bloom filters can't remove keys).
+    #
+    # building scans the whole user table, so it runs in a background thread:
+    # until the first build is done every value "may" exist and is checked by
+    # the (indexed) query, and a rebuild keeps answering from the filters it
+    # replaces
+
+    def __init__(self, app=None):
+        self.app = None
+        self.usernames = None
+        self.emails = None
+        self.built = 0.0
+        self._lock = threading.Lock()
+        self._builder = None
+        # (username, email) added while a build runs, which it may miss
+        self._added = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions["identities"] = self
+
+    def build(self):
+        """Build the filters from the database, in the calling thread."""
+        from app import db
+        from app.models import User
+
+        with self.app.app_context():
+            count = db.session.query(db.func.count(User.id)).scalar()
+            capacity = max(self.app.config["IDENTITY_FILTER_CAPACITY"], 2 * count)
+            error_rate = self.app.config["IDENTITY_FILTER_ERROR_RATE"]
+            usernames = BloomFilter(capacity, error_rate)
+            emails = BloomFilter(capacity, error_rate)
+            for username, email in db.session.query(User.username, User.email).yield_per(10000):
+                usernames.add(username)
+                emails.add(email)
+        with self._lock:
+            for username, email in self._added:
+                if username is not None:
+                    usernames.add(username)
+                if email is not None:
+                    emails.add(email)
+            self._added = []
+            self.usernames, self.emails = usernames, emails
+            self.built = time.monotonic()
+
+    def _run_build(self):
+        try:
+            self.build()
+        except Exception:
+            self.app.logger.exception("Failed to build the identity filters")
+        finally:
+            with self._lock:
+                self._builder = None
+
+    def _filters(self):
+        # the current (usernames, emails) filters, None until the first build
+        # is done. Starts a build when they are missing, old or too full to
+        # keep the error rate
+        refresh = self.app.config["IDENTITY_FILTER_REFRESH"]
+        with self._lock:
+            usernames, emails = self.usernames, self.emails
+            stale = (
+                usernames is None
+                or time.monotonic() - self.built > refresh
+                or usernames.count > usernames.capacity
+            )
+            if stale and self._builder is None:
+                self._builder = threading.Thread(
+                    target=self._run_build, name="identity-filter-builder", daemon=True
+                )
+                self._builder.start()
+        if usernames is None:
+            return None
+        return usernames, emails
+
+    def might_exist(self, username=None, email=None):
+        # returns the fields that may be in use, the others are certainly free
+        filters = self._filters()
+        fields = set()
+        if username is not None and (filters is None or username in filters[0]):
+            fields.add("username")
+        if email is not None and (filters is None or email in filters[1]):
+            fields.add("email")
+        return fields
+
+    def add(self, username=None, email=None):
+        with self._lock:
+            if self._builder is not None:
+                self._added.append((username, email))
+            if self.usernames is None:
+                return
+            if username is not None:
+                self.usernames.add(username)
+            if email is not None:
+                self.emails.add(email)
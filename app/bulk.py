@@ -0,0 +1,294 @@
+import csv
+import itertools
+import json
+import os
+import time
+from datetime import datetime
+
+from sqlalchemy import select, text, tuple_
+
+from app import db, search, timeline
+from app.batching import chunks
+from app.models import ArchivedPost, Post, User, followers, reconcile_counters
+
+# bulk export and import of the users, the follow graph and the posts (hot
+# and archived, see app/archive.py), one file per table in NDJSON (one JSON
+# object per line) or CSV (with a header row, an empty field is NULL). Rows
+# are streamed in chunks both ways, so memory use doesn't depend on the size
+# of the tables:
+#
+# * export reads each table ordered by primary key in a single transaction,
+#   a consistent snapshot of the database
+# * import inserts each chunk with one Core executemany and commits it,
+#   recording how many rows of each file are in the database in a progress
+#   file, so an interrupted import resumes where it stopped
+#
+# the timelines and the counters are derived from these tables, import
+# recomputes them at the end instead of reading them from the files
+
+# in the order they are imported, so foreign keys always point to rows that
+# are already there
+TABLES = (User.__table__, followers, Post.__table__, ArchivedPost.__table__)
+
+FORMATS = ("ndjson", "csv")
+
+PROGRESS_FILE = ".import-progress.json"
+
+
+def _filename(table, format):
+    return f"{table.name}.{format}"
+
+
+def get_table(name):
+    for table in TABLES:
+        if table.name == name:
+            return table
+    raise ValueError(f"Unknown table {name!r}, choose from {', '.join(t.name for t in TABLES)}")
+
+
+def _is_datetime(column):
+    return isinstance(column.type, db.DateTime)
+
+
+def _dumpers(table):
+    # value -> JSON or CSV value, for each column
+    return [
+        (lambda value: None if value is None else value.isoformat()) if _is_datetime(column) else None
+        for column in table.columns
+    ]
+
+
+def _loader(column, format):
+    # JSON or CSV value -> value, None when there is nothing to convert
+    if _is_datetime(column):
+        return lambda value: datetime.fromisoformat(value) if value else None
+    if format == "csv":
+        if isinstance(column.type, db.Integer):
+            return lambda value: int(value) if value else None
+        return lambda value: value if value else None
+    return None
+
+
+def export_table(table, directory, format="ndjson", chunk_size=10000):
+    """Write every row of table to a file in directory, return the row count."""
+    names = [column.name for column in table.columns]
+    dumpers = _dumpers(table)
+    query = select(table).order_by(*table.primary_key.columns)
+    result = db.session.execute(query, execution_options={"stream_results": True})
+    count = 0
+    with open(os.path.join(directory, _filename(table, format)), "w", newline="") as f:
+        if format == "csv":
+            writer = csv.writer(f)
+            writer.writerow(names)
+            write = writer.writerow
+        else:
+            encode = json.JSONEncoder(ensure_ascii=False, separators=(",", ":")).encode
+
+            def write(values):
+                f.write(encode(dict(zip(names, values))) + "\n")
+
+        for rows in result.yield_per(chunk_size).partitions():
+            for row in rows:
+                write([dump(value) if dump else value for dump, value in zip(dumpers, row)])
+            count += len(rows)
+    return count
+
+
+def export_tables(directory, format="ndjson", tables=None, chunk_size=10000):
+    os.makedirs(directory, exist_ok=True)
+    counts = {}
+    for table in tables or TABLES:
+        counts[table.name] = export_table(table, directory, format, chunk_size)
+    # a read-only transaction, ended so the snapshot isn't held any longer
+    db.session.rollback()
+    return counts
+
+
+def _read_rows(table, path, format):
+    # yields a dict of column values for each row of the file
+    with open(path, newline="") as f:
+        if format == "csv":
+            reader = csv.reader(f)
+            names = next(reader, [])
+            records = reader
+        else:
+            lines = (json.loads(line) for line in f if line.strip())
+            first = next(lines, None)
+            if first is None:
+                return
+            names = list(first)
+            records = (
+                [record.get(name) for name in names] for record in itertools.chain([first], lines)
+            )
+
+        unknown = set(names) - set(table.columns.keys())
+        if unknown:
+            raise ValueError(f"{path}: unknown columns {', '.join(sorted(unknown))}")
+        missing = set(table.primary_key.columns.keys()) - set(names)
+        if missing:
+            raise ValueError(f"{path}: missing primary key columns {', '.join(sorted(missing))}")
+        loaders = [_loader(table.columns[name], format) for name in names]
+        for values in records:
+            yield {
+                name: load(value) if load else value for name, load, value in zip(names, loaders, values)
+            }
+
+
+def _existing(table, rows):
+    # primary keys of rows that are already in the database, to skip the rows
+    # a resumed import may have committed just before it was interrupted
+    columns = list(table.primary_key.columns)
+    keys = [tuple(row[column.name] for column in columns) for row in rows]
+    if len(columns) == 1:
+        query = select(columns[0]).where(columns[0].in_([key[0] for key in keys]))
+    else:
+        query = select(*columns).where(tuple_(*columns).in_(keys))
+    return {tuple(row) for row in db.session.execute(query)}
+
+
+def _deferrable_indexes(table):
+    # unique indexes stay, they reject duplicates while the rows go in
+    return [index for index in table.indexes if not index.unique]
+
+
+def _reset_sequences(tables):
+    # rows are imported with their ids, PostgreSQL sequences have to be moved
+    # past them by hand
+    if db.engine.dialect.name != "postgresql":
+        return
+    for table in tables:
+        columns = list(table.primary_key.columns)
+        if len(columns) == 1 and isinstance(columns[0].type, db.Integer):
+            name, column = table.name, columns[0].name
+            db.session.execute(
+                text(
+                    f"SELECT setval(pg_get_serial_sequence('\"{name}\"', '{column}'), "
+                    f'coalesce(max("{column}"), 1)) FROM "{name}"'
+                )
+            )
+
+
+def _triggers(table):
+    # {name: sql} of the triggers of table, on SQLite the full text index of
+    # the posts is kept up to date by triggers (see app/search.py)
+    if db.engine.dialect.name != "sqlite":
+        return {}
+    query = text("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = :table")
+    return dict(db.session.execute(query, {"table": table.name}).all())
+
+
+class _Progress(object):
+    # how many rows of each file are already imported and the SQL of the
+    # triggers dropped while importing, saved atomically after every change so
+    # an interrupted import knows what to do when it runs again
+    def __init__(self, path, restart=False):
+        self.path = path
+        self.rows = {}
+        self.triggers = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                state = json.load(f)
+            # dropped triggers are remembered even when starting over
+            self.triggers = state.get("triggers", {})
+            if not restart:
+                self.rows = state.get("rows", {})
+
+    def save(self):
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as f:
+            json.dump({"rows": self.rows, "triggers": self.triggers}, f)
+        os.replace(temporary, self.path)
+
+
+def _insert_rows(table, rows, chunk_size, progress, echo):
+    done = progress.rows.get(table.name, 0)
+    inserted = 0
+    for i, chunk in enumerate(chunks(itertools.islice(rows, done, None), chunk_size)):
+        if i == 0 and done:
+            existing = _existing(table, chunk)
+            if existing:
+                keys = [column.name for column in table.primary_key.columns]
+                chunk = [row for row in chunk if tuple(row[key] for key in keys) not in existing]
+                done += len(existing)
+        if chunk:
+            db.session.execute(table.insert(), chunk)
+        db.session.commit()
+        inserted += len(chunk)
+        done += len(chunk)
+        progress.rows[table.name] = done
+        progress.save()
+        echo(f"{table.name}: {done} rows")
+    return inserted
+
+
+def import_tables(
+    directory,
+    format="ndjson",
+    tables=None,
+    chunk_size=10000,
+    defer_indexes=False,
+    progress_file=None,
+    restart=False,
+    echo=None,
+):
+    """Insert the rows of the files in directory, return the rows inserted.
+
+    With defer_indexes the non-unique indexes and the triggers of each table
+    are dropped before its rows are inserted and created again after, which
+    is much faster than updating them row by row. echo is called with
+    progress messages.
+    """
+    echo = echo or (lambda message: None)
+    progress = _Progress(progress_file or os.path.join(directory, PROGRESS_FILE), restart)
+    counts = {}
+    for table in tables or TABLES:
+        path = os.path.join(directory, _filename(table, format))
+        if not os.path.exists(path):
+            continue
+        if defer_indexes:
+            for index in _deferrable_indexes(table):
+                index.drop(db.session.connection(), checkfirst=True)
+            for name, sql in _triggers(table).items():
+                progress.triggers[name] = [table.name, sql]
+                progress.save()
+                db.session.execute(text(f'DROP TRIGGER "{name}"'))
+            db.session.commit()
+
+        start = time.perf_counter()
+        counts[table.name] = _insert_rows(
+            table, _read_rows(table, path, format), chunk_size, progress, echo
+        )
+        echo(f"{table.name}: inserted {counts[table.name]} rows in {time.perf_counter() - start:.1f}s")
+
+        # an earlier run that deferred them may have been interrupted, so
+        # they are restored even if nothing was deferred this time
+        start = time.perf_counter()
+        for index in _deferrable_indexes(table):
+            index.create(db.session.connection(), checkfirst=True)
+        triggers = {name: sql for name, (owner, sql) in progress.triggers.items() if owner == table.name}
+        for name, sql in triggers.items():
+            if name not in _triggers(table):
+                db.session.execute(text(sql))
+        db.session.commit()
+        if triggers:
+            for name in triggers:
+                del progress.triggers[name]
+            progress.save()
+            # the rows inserted without the triggers aren't in the index
+            if table in (Post.__table__, ArchivedPost.__table__):
+                search.reindex()
+        echo(f"{table.name}: indexes ready in {time.perf_counter() - start:.1f}s")
+
+    _reset_sequences(tables or TABLES)
+    # denormalized data is derived in bulk once everything is in place
+    start = time.perf_counter()
+    reconcile_counters()
+    db.session.commit()
+    echo(f"Reconciled the counters in {time.perf_counter() - start:.1f}s")
+    start = time.perf_counter()
+    timeline.rebuild_all()
+    echo(f"Rebuilt the timelines in {time.perf_counter() - start:.1f}s")
+    # the follow suggestions are recomputed by the next "flask suggestions refresh"
+    User.query.update({User.suggestions_stale: User.suggestions_stale + 1}, synchronize_session=False)
+    db.session.commit()
+    return counts
@@ -0,0 +1,109 @@
+import threading
+import time
+from collections import OrderedDict
+
+from werkzeug.utils import import_string
+
+# small in-process caches shared by the request threads of a worker. Every
+# process has its own copy, so entries are only invalidated in the process
+# that made the change, the ttl bounds how stale the other processes can be
+
+
+class LRUCache(object):
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expiration time, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                expires, value = entry
+                if expires is None or expires > time.monotonic():
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+            self.misses += 1
+            return default
+
+    def set(self, key, value):
+        expires = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class NullCache(object):
+    # drop-in backend that never caches anything, useful to disable a cache
+    # from the configuration
+    def __init__(self, maxsize=None, ttl=None):
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, default=None):
+        self.misses += 1
+        return default
+
+    def set(self, key, value):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+
+class UserCache(object):
+    # cache of the columns of User rows, so login.user_loader can populate
+    # current_user without querying the database. Flask-Login already keeps
+    # current_user for the rest of the request, this cache spans requests.
+    #
+    # the backend is configured with USER_CACHE_BACKEND as the import path of
+    # a class built with (maxsize, ttl) and implementing get/set/delete, the
+    # values stored are plain dicts so out of process backends can be used
+
+    def __init__(self, app=None):
+        self.backend = None
+        self.hits = 0
+        self.misses = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = import_string(app.config["USER_CACHE_BACKEND"])
+        self.backend = backend(app.config["USER_CACHE_SIZE"], app.config["USER_CACHE_TTL"])
+        app.extensions["user_cache"] = self
+
+    def get(self, user_id):
+        values = self.backend.get(user_id)
+        if values is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return values
+
+    def set(self, user_id, values):
+        self.backend.set(user_id, values)
+
+    def invalidate(self, *user_ids):
+        for user_id in user_ids:
+            self.backend.delete(user_id)
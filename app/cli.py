@@ -0,0 +1,338 @@
+import random
+import time
+from datetime import datetime, timedelta
+
+import click
+from flask import current_app
+from flask.cli import AppGroup, with_appcontext
+from werkzeug.utils import import_string
+
+from app import archive as post_archive
+from app import bulk, db, profiling, suggestions as follow_suggestions
+from app import jobs as job_queue
+from app import search as post_search
+from app import timeline as timelines
+from app.models import User, reconcile_counters
+
+# custom "flask" commands, grouped by the subsystem they maintain and added
+# to the app by register(). The commands of an AppGroup run within an app
+# context, like the ones of app.cli
+
+
+@click.group(cls=AppGroup)
+def timeline():
+    """Home timeline maintenance commands."""
+    pass
+
+
+@timeline.command()
+@click.option("--user", "username", help="Only rebuild the timeline of this user.")
+def rebuild(username):
+    """Rebuild materialized home timelines from the followers graph."""
+    if username:
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            raise click.ClickException(f"User {username} not found")
+        timelines.rebuild(user)
+        db.session.commit()
+        click.echo(f"Rebuilt the timeline of {username}")
+    else:
+        count = timelines.rebuild_all()
+        click.echo(f"Rebuilt {count} timelines")
+
+
+@click.group(cls=AppGroup)
+def counters():
+    """Denormalized counters maintenance commands."""
+    pass
+
+
+@counters.command()
+def reconcile():
+    """Recompute the follower, following and post counters of every user."""
+    fixed = reconcile_counters()
+    db.session.commit()
+    for name, count in fixed.items():
+        click.echo(f"{name}: fixed {count} users")
+
+
+@click.command()
+@click.option("--users", default=100, show_default=True, help="Number of users to create.")
+@click.option("--posts", default=1000, show_default=True, help="Number of posts to create.")
+@click.option(
+    "--follows", default=10, show_default=True, help="Average number of users each user follows."
+)
+@click.option("--days", default=30, show_default=True, help="Age in days of the oldest posts.")
+@click.option(
+    "--seed", "random_seed", type=int, help="Seed of the random generator, for reproducible data."
+)
+@with_appcontext
+def seed(users, posts, follows, days, random_seed):
+    """Fill the database with synthetic users, posts and followers."""
+    from app.seed import PASSWORD, seed as seed_data
+
+    start = time.perf_counter()
+    counts = seed_data(users, posts, follows, days, rng=random.Random(random_seed))
+    elapsed = time.perf_counter() - start
+    click.echo(
+        f"Created {counts['users']} users, {counts['followers']} follows and {counts['posts']} posts "
+        f"in {elapsed:.1f}s, every user has the password {PASSWORD!r}"
+    )
+
+
+@click.group(cls=AppGroup)
+def search():
+    """Full text search commands."""
+    pass
+
+
+@search.command()
+def reindex():
+    """Rebuild the full text index of the posts."""
+    if not post_search.reindex():
+        raise click.ClickException("The database has no full text index, searches use LIKE")
+    click.echo("Rebuilt the full text index")
+
+
+@click.group(cls=AppGroup)
+def profile():
+    """SQL profiling commands."""
+    pass
+
+
+@profile.command()
+@click.option(
+    "--sort",
+    type=click.Choice(["time", "queries", "requests"]),
+    default="time",
+    show_default=True,
+    help="Total to sort the endpoints by.",
+)
+def report(sort):
+    """Show the SQL profile of each endpoint, aggregated over every process."""
+    stats = profiling.load_stats(current_app.config["SQL_PROFILING_DIR"])
+    if not stats:
+        raise click.ClickException("No profile recorded yet, is SQL_PROFILING set?")
+    key = {"time": "time_ms", "queries": "queries", "requests": "requests"}[sort]
+    click.echo(
+        f"{'endpoint':24} {'requests':>8} {'queries':>8} {'q p95':>6} "
+        f"{'db ms':>8} {'ms p50':>7} {'ms p95':>7}"
+    )
+    for endpoint, endpoint_stats in sorted(stats.items(), key=lambda item: item[1][key], reverse=True):
+        requests = endpoint_stats["requests"]
+        time_p50, time_p95 = [
+            profiling.histogram_percentile(profiling.TIME_BUCKETS, endpoint_stats["time_histogram"], p)
+            for p in (50, 95)
+        ]
+        queries_p95 = profiling.histogram_percentile(
+            profiling.COUNT_BUCKETS, endpoint_stats["count_histogram"], 95
+        )
+        click.echo(
+            f"{endpoint:24} {requests:8} {endpoint_stats['queries'] / requests:8.1f} {queries_p95:6} "
+            f"{endpoint_stats['time_ms'] / requests:8.2f} "
+            f"{'<=' + str(time_p50):>7} {'<=' + str(time_p95):>7}"
+        )
+        for statement, count in endpoint_stats["repeated"].items():
+            click.echo(f"    possible N+1, up to {count}x: {' '.join(statement.split())[:80]}")
+
+
+@click.group(cls=AppGroup)
+def data():
+    """Bulk export and import of users, posts and followers."""
+    pass
+
+
+def _tables(names):
+    if not names:
+        return None
+    try:
+        return [bulk.get_table(name) for name in names.split(",")]
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--tables")
+
+
+@data.command()
+@click.argument("directory", type=click.Path(file_okay=False))
+@click.option("--format", type=click.Choice(bulk.FORMATS), default="ndjson", show_default=True)
+@click.option("--tables", help="Comma separated tables to export, by default all of them.")
+@click.option("--chunk-size", default=10000, show_default=True, help="Rows read at a time.")
+def export(directory, format, tables, chunk_size):
+    """Write every row of the tables to one file per table in DIRECTORY."""
+    start = time.perf_counter()
+    counts = bulk.export_tables(directory, format, _tables(tables), chunk_size)
+    elapsed = time.perf_counter() - start
+    for name, count in counts.items():
+        click.echo(f"{name}: exported {count} rows")
+    click.echo(f"Exported {sum(counts.values())} rows in {elapsed:.1f}s")
+
+
+@data.command("import")
+@click.argument("directory", type=click.Path(exists=True, file_okay=False))
+@click.option("--format", type=click.Choice(bulk.FORMATS), default="ndjson", show_default=True)
+@click.option("--tables", help="Comma separated tables to import, by default all of them.")
+@click.option("--chunk-size", default=10000, show_default=True, help="Rows inserted per transaction.")
+@click.option(
+    "--defer-indexes",
+    is_flag=True,
+    help="Drop the non-unique indexes and the triggers while importing, create them after.",
+)
+@click.option("--progress-file", help="Where to record the progress, by default in DIRECTORY.")
+@click.option("--restart", is_flag=True, help="Ignore the progress of a previous import.")
+def import_(directory, format, tables, chunk_size, defer_indexes, progress_file, restart):
+    """Insert the rows of the files written by "flask data export" in DIRECTORY.
+
+    An interrupted import continues where it stopped when run again.
+    """
+    start = time.perf_counter()
+    try:
+        counts = bulk.import_tables(
+            directory,
+            format,
+            _tables(tables),
+            chunk_size,
+            defer_indexes,
+            progress_file,
+            restart,
+            echo=click.echo,
+        )
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    elapsed = time.perf_counter() - start
+    for name, count in counts.items():
+        click.echo(f"{name}: imported {count} rows")
+    click.echo(f"Imported {sum(counts.values())} rows in {elapsed:.1f}s")
+
+
+@click.group(cls=AppGroup)
+def suggestions():
+    """Follow suggestions commands."""
+    pass
+
+
+@suggestions.command()
+@click.option("--all", "full", is_flag=True, help="Recompute every user, not only the stale ones.")
+@click.option("--workers", type=int, help="Processes computing them, by default SUGGESTIONS_WORKERS.")
+@click.option("--interval", type=float, help="Keep running, refreshing every INTERVAL seconds.")
+def refresh(full, workers, interval):
+    """Recompute the follow suggestions of the users whose follows changed."""
+    while True:
+        start = time.perf_counter()
+        counts = follow_suggestions.refresh(full, workers, echo=click.echo)
+        click.echo(
+            f"Refreshed the suggestions of {counts['users']} users ({counts['stale']} stale) "
+            f"in {time.perf_counter() - start:.1f}s"
+        )
+        if interval is None:
+            return
+        full = False
+        time.sleep(interval)
+
+
+@click.command()
+@click.option(
+    "--queues",
+    help='Queues to run and their concurrency, e.g. "default:2,timeline:4", by default JOB_QUEUES.',
+)
+@click.option("--burst", is_flag=True, help="Exit once the queues are empty.")
+@with_appcontext
+def worker(queues, burst):
+    """Run the background jobs queued by the app until interrupted."""
+    app = current_app._get_current_object()
+    try:
+        queues = job_queue.parse_queues(queues or app.config["JOB_QUEUES"])
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="--queues")
+    click.echo(f"Running {', '.join(f'{name} ({limit})' for name, limit in queues.items())}")
+    stats = job_queue.Worker(app, queues, burst).run()
+    click.echo(f"Ran {stats['done']} jobs, {stats['failed']} failed")
+
+
+@click.group(cls=AppGroup)
+def jobs():
+    """Background jobs commands."""
+    pass
+
+
+@jobs.command()
+def status():
+    """Show how many jobs of each queue are in each state."""
+    Job = job_queue.Job
+    counts = db.session.query(Job.queue, Job.state, db.func.count()).group_by(Job.queue, Job.state)
+    click.echo(f"{'queue':16} {'state':8} {'jobs':>8}")
+    for queue, state, count in counts.order_by(Job.queue, Job.state):
+        click.echo(f"{queue:16} {state:8} {count:8}")
+
+
+@jobs.command()
+@click.option("--queue", help="Only retry the jobs of this queue.")
+def retry(queue):
+    """Queue the failed jobs again, with all their attempts."""
+    Job = job_queue.Job
+    query = Job.query.filter_by(state=job_queue.FAILED)
+    if queue:
+        query = query.filter_by(queue=queue)
+    count = query.update(
+        {Job.state: job_queue.QUEUED, Job.attempts: 0, Job.run_at: datetime.utcnow()},
+        synchronize_session=False,
+    )
+    db.session.commit()
+    click.echo(f"Queued {count} failed jobs again")
+
+
+@click.group(cls=AppGroup)
+def archive():
+    """Post archive commands."""
+    pass
+
+
+def _echo_tiers():
+    for tier, stats in post_archive.stats().items():
+        size = "unknown size" if stats["bytes"] is None else f"{stats['bytes'] / 2**20:.1f} MiB"
+        click.echo(f"{tier}: {stats['posts']} posts, {size}")
+
+
+@archive.command()
+@click.option(
+    "--older-than", type=float, help="Age in days of the posts to move, by default ARCHIVE_AFTER_DAYS."
+)
+@click.option(
+    "--batch-size", type=int, help="Posts moved per transaction, by default ARCHIVE_BATCH_SIZE."
+)
+@click.option("--pause", type=float, help="Seconds to wait between batches, by default ARCHIVE_PAUSE.")
+@click.option("--limit", type=int, help="Stop after moving this many posts.")
+def run(older_than, batch_size, pause, limit):
+    """Move the posts older than the horizon from the post table to the archive."""
+    if older_than is None:
+        older_than = current_app.config["ARCHIVE_AFTER_DAYS"]
+    _echo_tiers()
+    start = time.perf_counter()
+    count = post_archive.archive(timedelta(days=older_than), batch_size, pause, limit, echo=click.echo)
+    click.echo(
+        f"Archived {count} posts older than {older_than:g} days in {time.perf_counter() - start:.1f}s"
+    )
+    _echo_tiers()
+
+
+@archive.command("status")
+def archive_status():
+    """Show the posts and size of the hot and the archived tier."""
+    _echo_tiers()
+
+
+class LazyGroup(click.Command):
+    # stands for a group of commands that is imported when it's used, see
+    # create_app() for why "flask db" is one
+    def __init__(self, name, import_name, **kwargs):
+        super(LazyGroup, self).__init__(name, **kwargs)
+        self.import_name = import_name
+
+    def make_context(self, info_name, args, parent=None, **extra):
+        # the context is made by the real group, which then runs it
+        group = import_string(self.import_name)
+        return group.make_context(info_name, args, parent=parent, **extra)
+
+
+def register(app):
+    for command in (timeline, counters, seed, search, profile, data, suggestions, worker, jobs, archive):
+        app.cli.add_command(command)
+    app.cli.add_command(LazyGroup("db", "flask_migrate.cli:db", help="Perform database migrations."))
@@ -0,0 +1,69 @@
+import hashlib
+import time
+from functools import wraps
+
+from flask import current_app, make_response, request, session
+from flask_login import current_user
+
+# conditional GET support: a view decorated with @conditional(validators) first
+# calls validators with the same arguments as the view. It should return a
+# list of values computed with cheap queries that change whenever the page
+# would change (counters, versions, timestamps of the newest posts...).
+#
+# when the client already has the page (If-None-Match matches the ETag built
+# from these values) the answer is an empty 304 Not Modified, skipping the
+# queries and the rendering of the view. Returning None from validators
+# disables the check for that request.
+#
+# pages have no Last-Modified: most of what they depend on (e.g. the counters
+# of followers) has no date, so the date of the newest post would answer 304
+# to an If-Modified-Since after those changed
+
+
+def _common_parts():
+    # besides what validators return, a page depends on who is looking at it,
+    # on the URL (e.g. pagination cursors) and on the CSRF tokens embedded in
+    # its forms, which depend on the session and expire after a while, so a
+    # page is never reused for more than half of the token lifetime
+    limit = current_app.config.get("WTF_CSRF_TIME_LIMIT", 3600)
+    period = int(time.time() // (limit / 2)) if limit else 0
+    viewer = current_user.get_id() if current_user.is_authenticated else None
+    return [viewer, request.full_path, session.get("csrf_token"), period]
+
+
+def make_etag(parts):
+    data = repr(_common_parts() + list(parts)).encode("utf-8")
+    return hashlib.sha1(data).hexdigest()
+
+
+def _set_validators(response, etag):
+    response.set_etag(etag)
+    # pages are personal, and must be revalidated before being reused
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    response.vary.add("Cookie")
+    return response
+
+
+def conditional(validators):
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            # pages with flashed messages consume them when rendered, so they
+            # must always be rendered
+            if request.method not in ("GET", "HEAD") or session.get("_flashes"):
+                return f(*args, **kwargs)
+            parts = validators(*args, **kwargs)
+            if parts is None:
+                return f(*args, **kwargs)
+            etag = make_etag(parts)
+            if request.if_none_match.contains(etag):
+                return _set_validators(make_response("", 304), etag)
+            response = make_response(f(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            return _set_validators(response, etag)
+
+        return decorated_function
+
+    return decorator
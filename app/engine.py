@@ -0,0 +1,126 @@
+import sqlite3
+import threading
+
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
+
+# production settings of the database engine
+#
+# SQLite defaults are made for embedded use: writers lock the whole database
+# (readers included) while they commit and a locked database fails right away
+# with "database is locked". Every new connection gets:
+#
+# * journal_mode=WAL, readers no longer block writers nor the other way round
+# * synchronous=NORMAL, with WAL it only fsyncs at checkpoints, a power loss
+#   can lose the last commits but never corrupts the database
+# * busy_timeout, writers wait for the lock instead of failing
+# * cache_size, mmap_size and temp_store, more of the database is read from
+#   memory
+#
+# and SQLite files are pooled like any other database instead of opening a
+# connection per request, so that page cache survives between requests. The
+# pool is per process, DATABASE_POOL_SIZE should match the threads of a worker
+#
+# SQLITE_TUNING=0 leaves SQLite with its own defaults (used by the benchmark)
+
+
+def engine_options(config):
+    url = make_url(config["SQLALCHEMY_DATABASE_URI"])
+    options = {
+        "pool_size": config["DATABASE_POOL_SIZE"],
+        "max_overflow": config["DATABASE_MAX_OVERFLOW"],
+        "pool_timeout": config["DATABASE_POOL_TIMEOUT"],
+        "pool_recycle": config["DATABASE_POOL_RECYCLE"],
+    }
+    if url.get_backend_name() != "sqlite":
+        options["pool_pre_ping"] = True
+        return options
+    if url.database in (None, "", ":memory:") or not config["SQLITE_TUNING"]:
+        # in memory databases need the single connection Flask-SQLAlchemy
+        # sets up for them
+        return {}
+    # pooled connections move between threads, SQLAlchemy makes sure only one
+    # uses them at a time
+    options["poolclass"] = QueuePool
+    options["connect_args"] = {"check_same_thread": False}
+    return options
+
+
+def sqlite_pragmas(config):
+    if not config["SQLITE_TUNING"]:
+        return []
+    return [
+        ("journal_mode", config["SQLITE_JOURNAL_MODE"]),
+        ("synchronous", config["SQLITE_SYNCHRONOUS"]),
+        ("busy_timeout", config["SQLITE_BUSY_TIMEOUT"]),
+        ("cache_size", config["SQLITE_CACHE_SIZE"]),
+        ("mmap_size", config["SQLITE_MMAP_SIZE"]),
+        ("temp_store", config["SQLITE_TEMP_STORE"]),
+    ]
+
+
+class EngineProfile(object):
+    def __init__(self, app=None, db=None):
+        self.app = None
+        self.db = None
+        self.pragmas = []
+        self.counters = {"connects": 0, "checkouts": 0, "checkins": 0, "invalidations": 0}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        self.app = app
+        self.db = db
+        app.extensions["engine_profile"] = self
+        # the engine is created on first use, options set explicitly in
+        # SQLALCHEMY_ENGINE_OPTIONS win. The listeners are given to the pools
+        # of this app's engines only (replicas included)
+        options = engine_options(app.config)
+        options["pool_events"] = [
+            (self._on_connect, "connect"),
+            (self._count("checkouts"), "checkout"),
+            (self._count("checkins"), "checkin"),
+            (self._count("invalidations"), "invalidate"),
+        ]
+        options.update(app.config["SQLALCHEMY_ENGINE_OPTIONS"])
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = options
+        self.pragmas = sqlite_pragmas(app.config)
+        if app.config["SQL_PROFILING"]:
+            app.after_request(self._add_header)
+
+    def _count(self, name):
+        def listener(*args):
+            with self._lock:
+                self.counters[name] += 1
+
+        return listener
+
+    def _on_connect(self, dbapi_connection, connection_record):
+        with self._lock:
+            self.counters["connects"] += 1
+        if not isinstance(dbapi_connection, sqlite3.Connection):
+            return
+        cursor = dbapi_connection.cursor()
+        for name, value in self.pragmas:
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+    def stats(self):
+        # the counters are for every engine of the app, the state of the pool
+        # for the primary
+        with self._lock:
+            stats = dict(self.counters)
+        pool = self.db.get_engine(self.app).pool
+        if isinstance(pool, QueuePool):
+            stats.update(
+                size=pool.size(),
+                checked_out=pool.checkedout(),
+                checked_in=pool.checkedin(),
+                overflow=pool.overflow(),
+            )
+        return stats
+
+    def _add_header(self, response):
+        response.headers["X-DB-Pool"] = "; ".join(f"{k}={v}" for k, v in self.stats().items())
+        return response
@@ -0,0 +1,33 @@
+from flask import render_template
+from app import db
+from app.api.errors import error_response as api_error_response, wants_json_response
+from app.errors import bp
+
+# error functions work very similar to view functions, but instead of taking a
+# relative url via the route decorator, they take an error number via the
+# errorhandler decorator (app_errorhandler handles the errors of every
+# blueprint, not only this one). Errors of the API are answered in JSON
+
+
+@bp.app_errorhandler(404)
+def not_found_error(error):
+    if wants_json_response():
+        return api_error_response(404)
+    return render_template("errors/404.html"), 404
+
+
+# raised when too many passwords are waiting to be hashed, see app/passwords.py
+@bp.app_errorhandler(429)
+def too_many_requests_error(error):
+    if wants_json_response():
+        return api_error_response(429), {"Retry-After": "5"}
+    return render_template("errors/429.html", error=error), 429, {"Retry-After": "5"}
+
+
+@bp.app_errorhandler(500)
+def internal_error(error):
+    # undo database change that caused the internal error
+    db.session.rollback()
+    if wants_json_response():
+        return api_error_response(500)
+    return render_template("errors/500.html"), 500
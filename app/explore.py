@@ -0,0 +1,251 @@
+import atexit
+import bisect
+import threading
+from collections import namedtuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+
+from app.pagination import NEXT, make_page, parse_cursor
+
+# the explore page lists the latest posts of everyone, newest first. Its first
+# pages are what everybody reads, so each process keeps the EXPLORE_BUFFER_SIZE
+# newest posts in memory and serves them without touching the database:
+#
+# * posts are kept as compact ExplorePost tuples with the few author columns
+#   the page shows, loaded from the database on first use, added as they are
+#   written (after their transaction commits, see app/live.py) and reloaded
+#   every EXPLORE_REFRESH seconds to pick up the posts of other processes
+# * the buffer is an immutable snapshot, sorted by (timestamp, id): writers
+#   build a new one under a lock and swap it in, readers take the current one
+#   without locking, so reads never wait for each other nor for writers
+# * the buffer has every post newer than its oldest one, so pages inside it
+#   are answered from it and pages that reach past it fall back to a keyset
+#   query on the post timestamps, with the same cursors, which continues into
+#   the archived posts (see app/archive.py)
+#
+# posts written by other processes show up within EXPLORE_REFRESH seconds
+
+
+class Author(namedtuple("Author", ["username", "email_hash", "version"])):
+    # stands for post.author in the templates
+    __slots__ = ()
+
+    def avatar(self, size):
+        from app.models import avatar_url
+
+        return avatar_url(self.email_hash, size)
+
+
+class ExplorePost(
+    namedtuple(
+        "ExplorePost", ["id", "user_id", "username", "email_hash", "version", "body", "timestamp"]
+    )
+):
+    __slots__ = ()
+
+    @classmethod
+    def from_post(cls, post):
+        author = post.author
+        return cls(
+            post.id,
+            author.id,
+            author.username,
+            author.email_hash,
+            author.version,
+            post.body,
+            post.timestamp,
+        )
+
+    @property
+    def author(self):
+        return Author(self.username, self.email_hash, self.version)
+
+    @property
+    def key(self):
+        return (self.timestamp, self.id)
+
+
+def _key(post):
+    return [post.timestamp, post.id]
+
+
+class _Snapshot(namedtuple("_Snapshot", ["posts", "keys", "complete"])):
+    # posts oldest first and their keys, complete when there are no older
+    # posts in the database
+    __slots__ = ()
+
+
+class ExploreFeed(object):
+    def __init__(self, app=None):
+        self.app = None
+        self._snapshot = None
+        self._write_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._refresher = None
+        self._stopping = threading.Event()
+        # hits: pages served from memory, misses: pages that queried the
+        # database, loads: times the buffer was (re)loaded from it
+        self.stats = {"hits": 0, "misses": 0, "loads": 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions["explore"] = self
+        atexit.register(self.stop)
+
+    def _query(self):
+        from app.models import Post, User
+
+        return (
+            select(
+                Post.id,
+                Post.user_id,
+                User.username,
+                User.email_hash,
+                User.version,
+                Post.body,
+                Post.timestamp,
+            )
+            .join(User, User.id == Post.user_id)
+            .order_by(Post.timestamp.desc(), Post.id.desc())
+            .limit(self.app.config["EXPLORE_BUFFER_SIZE"])
+        )
+
+    def load(self):
+        """Load the newest posts from the database into the buffer."""
+        from app.models import ArchivedPost
+
+        db = self.app.extensions["sqlalchemy"].db
+        with self.app.app_context():
+            with db.get_engine().connect() as connection:
+                loaded = [ExplorePost(*row) for row in connection.execute(self._query())]
+                archived = connection.execute(select(ArchivedPost.id).limit(1)).first() is not None
+        loaded.reverse()
+        size = self.app.config["EXPLORE_BUFFER_SIZE"]
+        with self._write_lock:
+            posts = loaded
+            if self._snapshot is not None and loaded:
+                # keep the posts added since the query ran
+                newest = loaded[-1].key
+                posts = loaded + [post for post in self._snapshot.posts if post.key > newest]
+            self._swap(posts, len(loaded) < size and not archived)
+            self.stats["loads"] += 1
+            if self._refresher is None and not self._stopping.is_set():
+                # started lazily, like the last_seen flusher, so CLI commands
+                # and forked workers don't inherit a thread they never use
+                self._refresher = threading.Thread(
+                    target=self._run, name="explore-refresher", daemon=True
+                )
+                self._refresher.start()
+
+    def _run(self):
+        interval = self.app.config["EXPLORE_REFRESH"]
+        while not self._stopping.wait(interval):
+            try:
+                self.load()
+            except Exception:
+                self.app.logger.exception("Failed to reload the explore feed")
+
+    def stop(self):
+        """Stop reloading the buffer, e.g. before the engine is disposed."""
+        self._stopping.set()
+        refresher = self._refresher
+        if refresher is not None and refresher is not threading.current_thread():
+            refresher.join()
+
+    def _swap(self, posts, complete):
+        # posts oldest first, trimmed to EXPLORE_BUFFER_SIZE. Called with the
+        # write lock held
+        excess = len(posts) - self.app.config["EXPLORE_BUFFER_SIZE"]
+        if excess > 0:
+            posts = posts[excess:]
+            complete = False
+        posts = tuple(posts)
+        self._snapshot = _Snapshot(posts, tuple(post.key for post in posts), complete)
+
+    def _ensure_loaded(self):
+        snapshot = self._snapshot
+        if snapshot is None:
+            # the first requests wait for a single load
+            with self._load_lock:
+                if self._snapshot is None:
+                    self.load()
+            snapshot = self._snapshot
+        return snapshot
+
+    def add_post(self, post):
+        """Add a committed ExplorePost."""
+        with self._write_lock:
+            snapshot = self._snapshot
+            if snapshot is None:
+                # loaded with it on first use
+                return
+            posts = list(snapshot.posts)
+            if snapshot.keys and post.key < snapshot.keys[0] and not snapshot.complete:
+                # older than the buffer, the database has it
+                return
+            if snapshot.keys and post.key <= snapshot.keys[-1]:
+                # out of order, e.g. a slow transaction committed late
+                posts.insert(bisect.bisect_left(snapshot.keys, post.key), post)
+            else:
+                posts.append(post)
+            self._swap(posts, snapshot.complete)
+
+    def update_author(self, user):
+        """Show the new username and avatar of user on its buffered posts."""
+        with self._write_lock:
+            snapshot = self._snapshot
+            if snapshot is None:
+                return
+            posts = [
+                (
+                    post._replace(
+                        username=user.username, email_hash=user.email_hash, version=user.version
+                    )
+                    if post.user_id == user.id
+                    else post
+                )
+                for post in snapshot.posts
+            ]
+            self._swap(posts, snapshot.complete)
+
+    def _from_buffer(self, snapshot, direction, values, cursor, per_page):
+        # the page from the buffer, None if it reaches past it
+        posts, keys = snapshot.posts, snapshot.keys
+        if direction == NEXT:
+            end = bisect.bisect_left(keys, tuple(values)) if cursor else len(keys)
+            start = end - (per_page + 1)
+            if start < 0 and not snapshot.complete:
+                return None
+            rows = posts[max(start, 0) : end][::-1]
+        else:
+            if not keys or (tuple(values) < keys[0] and not snapshot.complete):
+                return None
+            start = bisect.bisect_right(keys, tuple(values))
+            rows = posts[start : start + per_page + 1]
+        return make_page(rows, direction, cursor, per_page, _key)
+
+    def page(self, cursor=None, per_page=25):
+        """Return a Page of the newest posts, after cursor.
+
+        Its items are ExplorePost tuples when they come from the buffer and
+        Post or ArchivedPost objects when they come from the database.
+        """
+        from app import archive
+        from app.models import ArchivedPost, Post
+
+        direction, values = parse_cursor(cursor, [Post.timestamp, Post.id])
+        page = self._from_buffer(self._ensure_loaded(), direction, values, cursor, per_page)
+        with self._stats_lock:
+            self.stats["hits" if page is not None else "misses"] += 1
+        if page is not None:
+            return page
+        return archive.paginate(
+            Post.query.options(selectinload(Post.author)),
+            ArchivedPost.query.options(selectinload(ArchivedPost.author)),
+            cursor,
+            per_page,
+        )
@@ -1,56 +0,0 @@
-from flask_wtf import FlaskForm
-from wtforms import StringField, PasswordField, BooleanField, SubmitField, TextAreaField
-from wtforms.validators import Length, ValidationError, DataRequired, Email, EqualTo
-from app.models import User
-
-
-class LoginForm(FlaskForm):
-    username = StringField("Username", validators=[DataRequired()])
-    password = PasswordField("Password", validators=[DataRequired()])
-    remember_me = BooleanField("Remember Me")
-    submit = SubmitField("Sign In")
-
-
-class RegistrationForm(FlaskForm):
-    username = StringField("Username", validators=[DataRequired()])
-    email = StringField("email", validators=[DataRequired(), Email()])
-    password = StringField("Password", validators=[DataRequired()])
-    password2 = StringField("Repeat password", validators=[DataRequired(), EqualTo("password")])
-    submit = SubmitField("Register")
-
-    # WTForms automagically uses functions name validate_<field> as additional
-    # validators to the field in the name
-
-    def validate_username(self, username):
-        user = User.query.filter_by(username=username.data).first()
-        if user is not None:
-            raise ValidationError("This username is already taken! Please use a different one")
-
-    def validate_email(self, email):
-        user = User.query.filter_by(email=email.data).first()
-        if user is not None:
-            raise ValidationError("This email already has an account! Please use a different one")
-
-
-class EditProfileForm(FlaskForm):
-    username = StringField("Username", validators=[DataRequired()])
-    about_me = TextAreaField("About me", validators=[Length(min=0, max=140)])
-    submit = SubmitField("Submit")
-
-    # this is an overriden constructor, for the class EditProfileForm it is
-    # meant to accept a new username (username) that is the same as the current
-    # one (original_username)
-    def __init__(self, original_username, *args, **kwargs):
-        super(EditProfileForm, self).__init__(*args, **kwargs)
-        self.original_username = original_username
-
-    # validates the new username in case it is not already used by another user
-    def validate_username(self, username):
-        if username.data != self.original_username:
-            user = User.query.filter_by(username=self.username.data).first()
-            if user is not None:
-                raise ValidationError("This username is already taken! Please use a different one")
-
-
-class EmptyForm(FlaskForm):
-    submit = SubmitField("Submit")
@@ -0,0 +1,70 @@
+import time
+
+from flask import g, render_template
+from markupsafe import Markup
+from werkzeug.utils import import_string
+
+# cache of rendered _post.html fragments. A post never changes after it's
+# written, but its fragment shows the author's username and avatar, so the key
+# includes User.version, which is bumped whenever the profile is edited and
+# makes every fragment of the old version unreachable (they age out of the LRU)
+#
+# the backend is configured like USER_CACHE_BACKEND, with the import path of a
+# class built with (maxsize, ttl) and implementing get/set/delete
+
+
+class FragmentCache(object):
+    def __init__(self, app=None):
+        self.backend = None
+        self.hits = 0
+        self.misses = 0
+        # average time it takes to render a fragment, used to estimate the time
+        # a cache hit saves
+        self.render_time = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        backend = import_string(app.config["FRAGMENT_CACHE_BACKEND"])
+        self.backend = backend(app.config["FRAGMENT_CACHE_SIZE"], app.config["FRAGMENT_CACHE_TTL"])
+        app.extensions["fragments"] = self
+        app.jinja_env.globals["render_post"] = self.render_post
+        app.after_request(self._report)
+
+    @property
+    def hit_ratio(self):
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+
+    def render_post(self, post, avatars=None):
+        stats = g.setdefault("fragment_stats", {"hits": 0, "misses": 0, "saved": 0.0})
+        key = f"post:{post.id}:{post.author.version}"
+        html = self.backend.get(key)
+        if html is not None:
+            self.hits += 1
+            stats["hits"] += 1
+            stats["saved"] += self.render_time
+            return Markup(html)
+
+        start = time.perf_counter()
+        if avatars is None:
+            html = render_template("_post.html", post=post)
+        else:
+            html = render_template("_post.html", post=post, avatars=avatars)
+        elapsed = time.perf_counter() - start
+        self.backend.set(key, html)
+        self.misses += 1
+        stats["misses"] += 1
+        # exponential moving average, so it follows changes in the templates
+        # or the load of the machine
+        self.render_time = elapsed if self.misses == 1 else 0.9 * self.render_time + 0.1 * elapsed
+        return Markup(html)
+
+    def _report(self, response):
+        stats = g.get("fragment_stats")
+        if stats:
+            saved = stats["saved"] * 1000
+            response.headers["X-Fragment-Cache"] = (
+                f"hits={stats['hits']}; misses={stats['misses']}; saved={saved:.2f}ms"
+            )
+        return response
@@ -0,0 +1,310 @@
+import json
+import random
+import signal
+import threading
+import time
+import traceback
+import uuid
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import and_, event, func, or_, select
+from sqlalchemy.orm import Session
+from werkzeug.utils import import_string
+
+from app import db
+from app.models import Job
+
+# background jobs for the side effects views don't need to wait for. A job is
+# a row of the job table, inserted by enqueue() in the transaction of the view,
+# so it exists if and only if what the view did was committed, and run by the
+# threads of "flask worker" processes. No broker is involved, the database is
+# the queue:
+#
+# * a worker claims a job with a single UPDATE that only succeeds if it's still
+#   ready to run and its queue runs fewer jobs than its limit (JOB_QUEUES), so
+#   workers in several processes never run the same job at the same time.
+#   Nor do they exceed the limit on SQLite, which runs one write at a time;
+#   where writes run concurrently (e.g. PostgreSQL in READ COMMITTED) two
+#   claims may both count the same free slot, so the limit can be exceeded
+#   by the claims racing for it. The claim expires after JOB_TIMEOUT
+#   seconds, the job of a worker that died is then claimed again
+# * the job commits its work together with being marked done, only if its
+#   claim is still its own: otherwise the job was claimed again by another
+#   worker and its work is rolled back. A failed job is rolled back and
+#   retried after an exponential backoff with jitter, up to its max
+#   attempts, then it stays in the table as failed
+# * jobs queued with an idempotency key are queued only once, until the done
+#   job is purged after JOB_RETENTION seconds
+#
+# a job runs at least once: it may run again when its claim expires, so jobs
+# should be safe to repeat
+#
+# with JOB_EAGER set, jobs run right away in the transaction that queues them,
+# for development and tests without a worker. It's the default in debug mode
+# and tests, elsewhere queued jobs wait for "flask worker". Eager jobs with an
+# idempotency key run once per transaction, not once until they're purged
+
+EAGER_KEYS = "eager_job_keys"
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+job_table = Job.__table__
+
+
+def task(queue="default", max_attempts=None):
+    """Decorator for the functions that run as jobs of queue.
+
+    Their arguments are stored as JSON, so they should be ids rather than
+    objects.
+    """
+
+    def decorator(function):
+        function.queue = queue
+        function.max_attempts = max_attempts
+        return function
+
+    return decorator
+
+
+def enqueue(function, *args, key=None, delay=0):
+    """Queue a call of function(*args) in the current transaction.
+
+    Returns the Job, or the job already queued with the idempotency key.
+    Eager jobs are run instead and None is returned.
+    """
+    config = current_app.config
+    if is_eager():
+        if key is not None:
+            keys = db.session.info.setdefault(EAGER_KEYS, set())
+            if key in keys:
+                return None
+            keys.add(key)
+        function(*args)
+        return None
+    if key is not None:
+        existing = Job.query.filter_by(key=key).first()
+        if existing is not None:
+            # the unique constraint on key is the final word if two
+            # transactions queue the same key at the same time
+            return existing
+    job = Job(
+        queue=function.queue,
+        name=f"{function.__module__}:{function.__name__}",
+        args=json.dumps(args),
+        key=key,
+        state=QUEUED,
+        max_attempts=function.max_attempts or config["JOB_MAX_ATTEMPTS"],
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+    )
+    db.session.add(job)
+    return job
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _forget_eager_keys(session, transaction):
+    if transaction.parent is None:
+        session.info.pop(EAGER_KEYS, None)
+
+
+def is_eager():
+    value = current_app.config["JOB_EAGER"]
+    if value is None:
+        return current_app.debug or current_app.testing
+    if isinstance(value, str):
+        return value.lower() not in ("", "0", "false", "no")
+    return bool(value)
+
+
+def parse_queues(value):
+    # "default:2,timeline:4" -> {"default": 2, "timeline": 4}, the concurrency
+    # is 1 when left out
+    queues = {}
+    for item in value.split(","):
+        name, _, concurrency = item.strip().partition(":")
+        if name:
+            queues[name] = int(concurrency or 1)
+    return queues
+
+
+def _ready(now):
+    # queued and due, or running with a claim that expired
+    return or_(
+        and_(job_table.c.state == QUEUED, job_table.c.run_at <= now),
+        and_(job_table.c.state == RUNNING, job_table.c.locked_until <= now),
+    )
+
+
+def claim(queue, limit):
+    """Claim the next job of queue for this thread, None if there is none.
+
+    At most limit jobs of the queue run at the same time.
+    """
+    timeout = current_app.config["JOB_TIMEOUT"]
+    while True:
+        now = datetime.utcnow()
+        query = (
+            select(job_table.c.id)
+            .where(job_table.c.queue == queue)
+            .where(_ready(now))
+            .order_by(job_table.c.run_at, job_table.c.id)
+            .limit(1)
+        )
+        id = db.session.execute(query).scalar()
+        # the UPDATE starts a new transaction, on SQLite reading first would
+        # make it upgrade a read transaction to a write, which fails at once
+        # if another connection wrote in between instead of waiting
+        db.session.rollback()
+        if id is None:
+            return None
+        running = (
+            select(func.count())
+            .where(job_table.c.queue == queue)
+            .where(job_table.c.state == RUNNING)
+            .where(job_table.c.locked_until > now)
+            .scalar_subquery()
+        )
+        lock = uuid.uuid4().hex
+        claimed = db.session.execute(
+            job_table.update()
+            .where(job_table.c.id == id)
+            .where(_ready(now))
+            .where(running < limit)
+            .values(
+                state=RUNNING,
+                attempts=job_table.c.attempts + 1,
+                lock=lock,
+                locked_until=now + timedelta(seconds=timeout),
+            )
+        ).rowcount
+        db.session.commit()
+        if claimed:
+            return db.session.get(Job, id)
+        if db.session.execute(select(running)).scalar() >= limit:
+            db.session.rollback()
+            return None
+        # another worker took it first, try the next one
+
+
+def _backoff(attempts):
+    config = current_app.config
+    delay = min(config["JOB_RETRY_BACKOFF"] * 2 ** (attempts - 1), config["JOB_RETRY_MAX_DELAY"])
+    return delay * random.uniform(0.5, 1.5)
+
+
+def _finish(id, lock, **values):
+    # only if the claim is still ours, an expired one may belong to another
+    # worker by now
+    return db.session.execute(
+        job_table.update()
+        .where(job_table.c.id == id)
+        .where(job_table.c.lock == lock)
+        .values(lock=None, locked_until=None, **values)
+    ).rowcount
+
+
+def perform(job):
+    """Run a claimed job, return True if it succeeded."""
+    id, name, lock, attempts, max_attempts = job.id, job.name, job.lock, job.attempts, job.max_attempts
+    args = json.loads(job.args)
+    # the job starts a transaction of its own, see claim()
+    db.session.rollback()
+    try:
+        if attempts > max_attempts:
+            # its last attempt never finished
+            raise RuntimeError(f"Gave up after {max_attempts} attempts that timed out")
+        import_string(name)(*args)
+        if not _finish(id, lock, state=DONE, finished_at=datetime.utcnow(), error=None):
+            # the claim expired and the job was claimed again, its work is
+            # left to the worker that holds it now
+            db.session.rollback()
+            current_app.logger.warning(f"Job {id} {name} lost its claim, its work was rolled back")
+            return False
+        db.session.commit()
+        return True
+    except Exception:
+        db.session.rollback()
+        error = traceback.format_exc()
+        current_app.logger.exception(f"Job {id} {name} failed, attempt {attempts} of {max_attempts}")
+        if attempts < max_attempts:
+            run_at = datetime.utcnow() + timedelta(seconds=_backoff(attempts))
+            _finish(id, lock, state=QUEUED, run_at=run_at, error=error)
+        else:
+            _finish(id, lock, state=FAILED, finished_at=datetime.utcnow(), error=error)
+        db.session.commit()
+        return False
+
+
+def purge(retention):
+    """Delete the jobs done more than retention seconds ago, return how many."""
+    cutoff = datetime.utcnow() - timedelta(seconds=retention)
+    count = db.session.execute(
+        job_table.delete().where(job_table.c.state == DONE).where(job_table.c.finished_at < cutoff)
+    ).rowcount
+    db.session.commit()
+    return count
+
+
+class Worker(object):
+    # runs the jobs of each queue in as many threads as its concurrency, until
+    # stop() is called (on SIGINT or SIGTERM when run by "flask worker")
+    def __init__(self, app, queues, burst=False):
+        self.app = app
+        self.queues = queues
+        # in burst mode threads exit when their queue is empty
+        self.burst = burst
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self.stats = {"done": 0, "failed": 0}
+
+    def _run(self, queue, limit):
+        poll = self.app.config["JOB_POLL_INTERVAL"]
+        while not self._stopping.is_set():
+            with self.app.app_context():
+                try:
+                    job = claim(queue, limit)
+                    if job is not None:
+                        succeeded = perform(job)
+                        with self._lock:
+                            self.stats["done" if succeeded else "failed"] += 1
+                        continue
+                except Exception:
+                    self.app.logger.exception(f"Worker of queue {queue} failed")
+            if self.burst:
+                return
+            self._stopping.wait(poll)
+
+    def stop(self, *args):
+        self._stopping.set()
+
+    def run(self):
+        threads = [
+            threading.Thread(target=self._run, args=(queue, limit), name=f"worker-{queue}-{i}")
+            for queue, limit in self.queues.items()
+            for i in range(limit)
+        ]
+        if threading.current_thread() is threading.main_thread():
+            signal.signal(signal.SIGTERM, self.stop)
+        for thread in threads:
+            thread.start()
+        purged = time.monotonic()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(1)
+                if time.monotonic() - purged > 60:
+                    purged = time.monotonic()
+                    with self.app.app_context():
+                        try:
+                            purge(self.app.config["JOB_RETENTION"])
+                        except Exception:
+                            self.app.logger.exception("Failed to purge the done jobs")
+        except KeyboardInterrupt:
+            self.stop()
+            # the jobs being run are finished
+            for thread in threads:
+                thread.join()
+        return self.stats
@@ -0,0 +1,96 @@
+import atexit
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import bindparam
+
+# records when users were last active without writing to the database on every
+# request: activity is kept in memory, throttled to one update per user every
+# LAST_SEEN_GRANULARITY seconds, and a background thread writes the pending
+# updates every LAST_SEEN_FLUSH_INTERVAL seconds as one batched UPDATE (the
+# remaining ones are written when the process exits)
+
+
+class LastSeenTracker(object):
+    def __init__(self, app=None):
+        self.app = None
+        self._pending = {}  # user id -> last_seen waiting to be written
+        self._accepted = {}  # user id -> last accepted last_seen, for throttling
+        self._lock = threading.Lock()
+        self._flusher = None
+        # touches: activity reported, coalesced: activity that didn't turn into
+        # a database write, written: rows updated, flushes: batched UPDATEs
+        self.stats = {"touches": 0, "coalesced": 0, "written": 0, "flushes": 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions["last_seen"] = self
+        atexit.register(self.flush)
+
+    def touch(self, user_id, when=None):
+        when = when or datetime.utcnow()
+        granularity = self.app.config["LAST_SEEN_GRANULARITY"]
+        with self._lock:
+            self.stats["touches"] += 1
+            accepted = self._accepted.get(user_id)
+            if accepted is not None and (when - accepted).total_seconds() < granularity:
+                self.stats["coalesced"] += 1
+                return
+            if user_id in self._pending:
+                # overwrites an update that was never written
+                self.stats["coalesced"] += 1
+            self._pending[user_id] = when
+            self._accepted[user_id] = when
+            if self._flusher is None:
+                # started lazily, so CLI commands and forked workers don't
+                # inherit a thread they never use
+                self._flusher = threading.Thread(target=self._run, name="last-seen-flusher", daemon=True)
+                self._flusher.start()
+
+    def _run(self):
+        interval = self.app.config["LAST_SEEN_FLUSH_INTERVAL"]
+        while True:
+            time.sleep(interval)
+            try:
+                self.flush()
+            except Exception:
+                self.app.logger.exception("Failed to flush last_seen updates")
+
+    def flush(self):
+        with self._lock:
+            batch, self._pending = self._pending, {}
+            # forget throttling state that can no longer suppress an update
+            now = datetime.utcnow()
+            granularity = self.app.config["LAST_SEEN_GRANULARITY"]
+            self._accepted = {
+                user_id: when
+                for user_id, when in self._accepted.items()
+                if (now - when).total_seconds() < granularity
+            }
+        if not batch:
+            return 0
+
+        db = self.app.extensions["sqlalchemy"].db
+        user = db.metadata.tables["user"]
+        statement = (
+            user.update().where(user.c.id == bindparam("user_id")).values(last_seen=bindparam("when"))
+        )
+        params = [{"user_id": user_id, "when": when} for user_id, when in batch.items()]
+        try:
+            with self.app.app_context():
+                with db.get_engine().begin() as connection:
+                    connection.execute(statement, params)
+        except Exception:
+            # put the batch back so it's retried by the next flush, unless a
+            # newer update was recorded meanwhile
+            with self._lock:
+                for user_id, when in batch.items():
+                    self._pending.setdefault(user_id, when)
+            raise
+        with self._lock:
+            self.stats["written"] += len(batch)
+            self.stats["flushes"] += 1
+        return len(batch)
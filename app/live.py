@@ -0,0 +1,246 @@
+import atexit
+import itertools
+import json
+import threading
+from collections import deque
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# live updates of the home page over Server-Sent Events. Every open /stream
+# response is a Subscriber of the LiveHub of its process, which knows the ids
+# its user follows and routes each new post to the subscribers of its author's
+# followers (and of the author, for its other tabs):
+#
+# * events are published after the transaction that wrote them commits: the
+#   models queue them in the session with after_commit() and they are dropped
+#   on rollback. They are also how the explore feed (app/explore.py) learns
+#   about new posts
+# * an event carries everything the page shows, so the stream never touches
+#   the database, the view releases its connection before streaming
+# * each subscriber buffers at most LIVE_QUEUE_SIZE events. A client that reads
+#   slower than posts arrive doesn't make the buffer grow: when it's full the
+#   buffered events are replaced by a single "resync" event, telling the page
+#   to reload instead of receiving a partial list
+#
+# the hub only knows about the posts written by its own process, with several
+# workers each one should subscribe to a shared broker to publish them all
+
+PENDING_KEY = "live_events"
+
+# how long browsers wait before reconnecting a dropped stream, in milliseconds
+RETRY = 3000
+
+RESYNC = "event: resync\ndata: null\n\n"
+
+# the extensions events are published to, each one gets the events it has a
+# method for, named like their kind
+RECEIVERS = ("hub", "explore")
+
+
+def after_commit(session, kind, *args):
+    # queue an event to be published once the transaction of session commits
+    session.info.setdefault(PENDING_KEY, []).append((kind, args))
+
+
+def post_data(post):
+    # the same fields as the posts of the API
+    return {
+        "id": post.id,
+        "body": post.body,
+        "timestamp": post.timestamp.isoformat() + "Z",
+        "author": {"username": post.author.username, "avatar": post.author.avatar(36)},
+    }
+
+
+@event.listens_for(Session, "after_commit")
+def _publish_pending(session):
+    pending = session.info.pop(PENDING_KEY, None)
+    app = getattr(session, "app", None)
+    if not pending or app is None:
+        return
+    receivers = [app.extensions.get(name) for name in RECEIVERS]
+    for kind, args in pending:
+        for receiver in receivers:
+            method = getattr(receiver, kind, None)
+            if method is not None:
+                method(*args)
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _discard_pending(session, transaction):
+    # after a rollback or a close, a commit has already popped them
+    if transaction.parent is None:
+        session.info.pop(PENDING_KEY, None)
+
+
+class Subscriber(object):
+    def __init__(self, user_id, followed, maxsize):
+        self.user_id = user_id
+        self.followed = set(followed)
+        self.maxsize = maxsize
+        self.closed = False
+        self._events = deque()
+        self._condition = threading.Condition()
+
+    def push(self, event):
+        # returns False when the buffer overflowed and was replaced by a resync
+        with self._condition:
+            if self._events and self._events[0] is RESYNC:
+                # the page reloads anyway
+                return False
+            overflow = len(self._events) >= self.maxsize
+            if overflow:
+                self._events.clear()
+                event = RESYNC
+            self._events.append(event)
+            self._condition.notify()
+        return not overflow
+
+    def close(self):
+        with self._condition:
+            self.closed = True
+            self._condition.notify()
+
+    def wait(self, timeout):
+        # every buffered event, an empty list after timeout seconds without
+        # any or None once closed
+        with self._condition:
+            self._condition.wait_for(lambda: self._events or self.closed, timeout)
+            if self.closed:
+                return None
+            events = list(self._events)
+            self._events.clear()
+            return events
+
+
+class LiveHub(object):
+    def __init__(self, app=None):
+        self.app = None
+        self._lock = threading.Lock()
+        self._by_user = {}  # user id -> its subscribers
+        self._by_followed = {}  # user id -> subscribers of users following it
+        self._ids = itertools.count(1)
+        # delivered: events buffered for a subscriber, resyncs: buffers that
+        # overflowed, rejected: subscriptions over LIVE_MAX_SUBSCRIBERS
+        self.stats = {"subscribers": 0, "delivered": 0, "resyncs": 0, "rejected": 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions["hub"] = self
+        # streams would otherwise keep their threads waiting at exit
+        atexit.register(self.close)
+
+    def subscribe(self, user_id, followed):
+        """Return a new Subscriber, or None if the process has too many."""
+        with self._lock:
+            if self.stats["subscribers"] >= self.app.config["LIVE_MAX_SUBSCRIBERS"]:
+                self.stats["rejected"] += 1
+                return None
+            subscriber = Subscriber(user_id, followed, self.app.config["LIVE_QUEUE_SIZE"])
+            self._by_user.setdefault(user_id, set()).add(subscriber)
+            for id in subscriber.followed:
+                self._by_followed.setdefault(id, set()).add(subscriber)
+            self.stats["subscribers"] += 1
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            subscribers = self._by_user.get(subscriber.user_id, set())
+            if subscriber not in subscribers:
+                return
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._by_user[subscriber.user_id]
+            for id in subscriber.followed:
+                self._discard(id, subscriber)
+            self.stats["subscribers"] -= 1
+        subscriber.close()
+
+    def _discard(self, followed_id, subscriber):
+        subscribers = self._by_followed.get(followed_id)
+        if subscribers is not None:
+            subscribers.discard(subscriber)
+            if not subscribers:
+                del self._by_followed[followed_id]
+
+    def post(self, author_id, data):
+        # a new post, data is what the page shows about it
+        with self._lock:
+            recipients = self._by_followed.get(author_id, set()) | self._by_user.get(author_id, set())
+            id = next(self._ids)
+        # formatted once, every subscriber gets the same text
+        message = f"id: {id}\nevent: post\ndata: {json.dumps(data)}\n\n"
+        delivered = resyncs = 0
+        for subscriber in recipients:
+            if subscriber.push(message):
+                delivered += 1
+            else:
+                resyncs += 1
+        with self._lock:
+            self.stats["delivered"] += delivered
+            self.stats["resyncs"] += resyncs
+
+    def follow(self, user_id, followed_ids):
+        with self._lock:
+            for subscriber in self._by_user.get(user_id, ()):
+                for id in followed_ids:
+                    subscriber.followed.add(id)
+                    self._by_followed.setdefault(id, set()).add(subscriber)
+
+    def unfollow(self, user_id, followed_ids):
+        with self._lock:
+            for subscriber in self._by_user.get(user_id, ()):
+                for id in followed_ids:
+                    subscriber.followed.discard(id)
+                    self._discard(id, subscriber)
+
+    def stream(self, subscriber):
+        """Return the text/event-stream body of subscriber.
+
+        It's unsubscribed when the body is closed, which the server does even
+        if it never iterated it (e.g. a HEAD request, or a client gone before
+        the first chunk), or when the client goes away.
+        """
+        return _Stream(self, subscriber)
+
+    def _events(self, subscriber):
+        heartbeat = self.app.config["LIVE_HEARTBEAT"]
+        try:
+            yield f"retry: {RETRY}\n\n"
+            while True:
+                events = subscriber.wait(heartbeat)
+                if events is None:
+                    return
+                if not events:
+                    # comments keep proxies from closing an idle connection,
+                    # and fail once the client is gone, which ends the stream
+                    yield ": keepalive\n\n"
+                    continue
+                yield "".join(events)
+        finally:
+            self.unsubscribe(subscriber)
+
+    def close(self):
+        with self._lock:
+            subscribers = [s for subscribers in self._by_user.values() for s in subscribers]
+        for subscriber in subscribers:
+            self.unsubscribe(subscriber)
+
+
+class _Stream(object):
+    # the body of a /stream response, see LiveHub.stream(). A generator alone
+    # wouldn't do: closing one that never started doesn't run its finally
+    def __init__(self, hub, subscriber):
+        self.hub = hub
+        self.subscriber = subscriber
+        self._events = hub._events(subscriber)
+
+    def __iter__(self):
+        return self._events
+
+    def close(self):
+        self._events.close()
+        self.hub.unsubscribe(self.subscriber)
@@ -0,0 +1,162 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, SMTPHandler
+
+# production logging without blocking requests: app.logger only puts records
+# in a bounded in-memory queue, and a background listener thread hands them to
+# the handlers that do slow I/O (rotating log file and error emails). Error
+# emails are collected into deduplicated digests, at most one every
+# LOG_MAIL_INTERVAL seconds, so an exception raised by every request doesn't
+# turn into one email per request
+
+
+class DroppingQueueHandler(QueueHandler):
+    # never blocks the logging thread, when the queue is full (the handlers
+    # can't keep up) records are dropped and counted instead
+    def __init__(self, queue):
+        super(DroppingQueueHandler, self).__init__(queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class DigestSMTPHandler(SMTPHandler):
+    def __init__(self, *args, interval=60, **kwargs):
+        super(DigestSMTPHandler, self).__init__(*args, **kwargs)
+        self.interval = interval
+        self.pending = {}  # (level, location, first line) -> [count, first record]
+        self.timer = None
+        self.last_sent = 0.0
+        self.digest_lock = threading.Lock()
+
+    def emit(self, record):
+        message = self.format(record)
+        key = (record.levelname, record.pathname, record.lineno, message.split("\n", 1)[0])
+        with self.digest_lock:
+            if key in self.pending:
+                self.pending[key][0] += 1
+            else:
+                self.pending[key] = [1, record]
+            if self.timer is None:
+                # the first error after a quiet period is sent right away
+                delay = max(0.0, self.last_sent + self.interval - time.monotonic())
+                self.timer = threading.Timer(delay, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        with self.digest_lock:
+            pending, self.pending = self.pending, {}
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            self.last_sent = time.monotonic()
+        if not pending:
+            return
+        occurrences = sum(count for count, record in pending.values())
+        parts = [f"{len(pending)} distinct errors, {occurrences} occurrences\n"]
+        for count, record in pending.values():
+            parts.append(f"--- {count}x {record.levelname} in {record.pathname}:{record.lineno}")
+            parts.append(self.format(record))
+        digest = logging.makeLogRecord({"msg": "\n".join(parts), "levelno": logging.ERROR})
+        digest.levelname = "ERROR"
+        # SMTPHandler.emit formats with the default formatter, which only
+        # uses the message
+        formatter, self.formatter = self.formatter, None
+        try:
+            super(DigestSMTPHandler, self).emit(digest)
+        finally:
+            self.formatter = formatter
+
+    def close(self):
+        self.flush()
+        super(DigestSMTPHandler, self).close()
+
+
+class LogPipeline(object):
+    # the handlers are set up by the first request, so processes that never
+    # serve one (CLI commands) don't create log files nor start the listener
+
+    def __init__(self, app=None):
+        self.app = None
+        self.listener = None
+        self.queue_handler = None
+        self.handlers = []
+        self._started = False
+        self._start_lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions["log_pipeline"] = self
+        app.before_request(self._start_once)
+
+    def _start_once(self):
+        if self._started:
+            return
+        with self._start_lock:
+            if not self._started:
+                self.start()
+                self._started = True
+
+    def start(self):
+        app = self.app
+        if app.config["MAIL_SERVER"]:
+            auth = None
+            if app.config["MAIL_USERNAME"] or app.config["MAIL_PASSWORD"]:
+                auth = (app.config["MAIL_USERNAME"], app.config["MAIL_PASSWORD"])
+            secure = None
+            if app.config["MAIL_USE_TLS"]:
+                secure = ()
+            mail_handler = DigestSMTPHandler(
+                mailhost=(app.config["MAIL_SERVER"], app.config["MAIL_PORT"]),
+                fromaddr=f"no-reply@{app.config['MAIL_SERVER']}",
+                toaddrs=app.config["ADMINS"],
+                subject="Microblog Failure",
+                credentials=auth,
+                secure=secure,
+                timeout=app.config["LOG_MAIL_TIMEOUT"],
+                interval=app.config["LOG_MAIL_INTERVAL"],
+            )
+            mail_handler.setLevel(logging.ERROR)
+            self.handlers.append(mail_handler)
+
+        if not os.path.exists("logs"):
+            os.mkdir("logs")
+        file_handler = RotatingFileHandler(
+            "logs/microblog.log", maxBytes=app.config["LOG_MAX_BYTES"], backupCount=10
+        )
+        file_handler.setFormatter(
+            logging.Formatter("%(asctime)s %(levelname)s: %(message)s [in %(pathname)s:%(lineno)d]")
+        )
+        file_handler.setLevel(logging.INFO)
+        self.handlers.append(file_handler)
+
+        # below we attach the queue to the logger object of the Flask library,
+        # the handlers only see the records in the listener thread
+        self.queue_handler = DroppingQueueHandler(queue.Queue(app.config["LOG_QUEUE_SIZE"]))
+        app.logger.addHandler(self.queue_handler)
+        app.logger.setLevel(logging.INFO)
+        self.listener = QueueListener(
+            self.queue_handler.queue, *self.handlers, respect_handler_level=True
+        )
+        self.listener.start()
+        atexit.register(self.stop)
+        app.logger.info("Microblog startup")
+
+    def stop(self):
+        # write whatever is still queued and send the pending digest
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+            for handler in self.handlers:
+                handler.close()
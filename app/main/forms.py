@@ -0,0 +1,44 @@
+from flask import request
+from flask_wtf import FlaskForm
+from wtforms import StringField, SubmitField, TextAreaField
+from wtforms.validators import Length, ValidationError, DataRequired
+from app.auth.forms import taken_identities
+
+
+class EditProfileForm(FlaskForm):
+    username = StringField("Username", validators=[DataRequired()])
+    about_me = TextAreaField("About me", validators=[Length(min=0, max=140)])
+    submit = SubmitField("Submit")
+
+    # this is an overriden constructor, for the class EditProfileForm it is
+    # meant to accept a new username (username) that is the same as the current
+    # one (original_username)
+    def __init__(self, original_username, *args, **kwargs):
+        super(EditProfileForm, self).__init__(*args, **kwargs)
+        self.original_username = original_username
+
+    # validates the new username in case it is not already used by another user
+    def validate_username(self, username):
+        if username.data != self.original_username:
+            if taken_identities(username=username.data):
+                raise ValidationError("This username is already taken! Please use a different one")
+
+
+class EmptyForm(FlaskForm):
+    submit = SubmitField("Submit")
+
+
+class PostForm(FlaskForm):
+    post = TextAreaField("Say something", validators=[DataRequired(), Length(min=1, max=140)])
+    submit = SubmitField("Submit")
+
+
+class SearchForm(FlaskForm):
+    # submitted with GET, so results have shareable URLs and there is no CSRF
+    # token to check
+    q = StringField("Search", validators=[DataRequired()])
+
+    def __init__(self, *args, **kwargs):
+        kwargs.setdefault("formdata", request.args)
+        kwargs.setdefault("meta", {"csrf": False})
+        super(SearchForm, self).__init__(*args, **kwargs)
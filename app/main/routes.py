@@ -0,0 +1,281 @@
+from app import archive, db, hub, identities, last_seen, timeline, user_cache
+from app import explore as explore_feed
+from flask import Response, abort, current_app, g, render_template, flash, redirect, url_for, request
+from flask_login import current_user, login_required
+from sqlalchemy import func, select
+from sqlalchemy.exc import IntegrityError
+
+from app.conditional import conditional
+from app.main import bp
+from app.main.forms import EditProfileForm, EmptyForm, PostForm, SearchForm
+from app.models import ArchivedPost, Post, User, avatar_urls, followers as followers_table
+from app.pagination import chain_paginate, keyset_paginate
+from app.replicas import read_only
+from app.search import search as search_posts
+from app.suggestions import for_user as suggestions_for, version as suggestions_version
+
+
+def index_validators():
+    # the home page changes when the user posts, (un)follows someone, a post
+    # arrives in the timeline, a followed user edits its profile or its follow
+    # suggestions are refreshed
+    followed = select(followers_table.c.followed_id).where(
+        followers_table.c.follower_id == current_user.id
+    )
+    versions = db.session.query(func.sum(User.version)).filter(User.id.in_(followed)).scalar()
+    parts = [
+        current_user.version,
+        current_user.posts_count,
+        current_user.following_count,
+        versions,
+        timeline.latest(current_user),
+        tuple(suggestions_version(current_user)),
+    ]
+    return parts
+
+
+@bp.route("/", methods=["GET", "POST"])
+@bp.route("/index", methods=["GET", "POST"])
+@read_only
+@login_required
+@conditional(index_validators)
+def index():
+    form = PostForm()
+    if form.validate_on_submit():
+        current_user.add_post(form.post.data)
+        db.session.commit()
+        flash("Your post is now live!")
+        # redirect after POST, so refreshing the page doesn't resubmit the form
+        return redirect(url_for("main.index"))
+    page = chain_paginate(
+        timeline.home_sources(current_user),
+        request.args.get("cursor"),
+        current_app.config["POSTS_PER_PAGE"],
+    )
+    return render_template(
+        "index.html",
+        title="Home",
+        form=form,
+        posts=page.items,
+        avatars=avatar_urls(page.items, 36),
+        page=page,
+        suggestions=suggestions_for(current_user, current_app.config["SUGGESTIONS_SHOWN"]),
+    )
+
+
+@bp.route("/edit_profile", methods=["GET", "POST"])
+@login_required
+def edit_profile():
+    form = EditProfileForm(current_user.username)
+    if form.validate_on_submit():
+        if (form.username.data, form.about_me.data) != (current_user.username, current_user.about_me):
+            current_user.version += 1
+        current_user.username = form.username.data
+        current_user.about_me = form.about_me.data
+        try:
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            flash("This username was just taken! Please use a different one")
+            return render_template("edit_profile.html", title="Edit profile", form=form)
+        identities.add(username=current_user.username)
+        user_cache.invalidate(current_user.id)
+        explore_feed.update_author(current_user)
+        flash("Your changes have been saved")
+        return redirect(url_for("main.edit_profile"))  # reload same page
+    # when the browser first sends a GET request, populate the form fields
+    # with the user's current data
+    elif request.method == "GET":
+        form.username.data = current_user.username
+        form.about_me.data = current_user.about_me
+    return render_template("edit_profile.html", title="Edit profile", form=form)
+
+
+def user_validators(username):
+    user = User.query.filter_by(username=username).first()
+    if user is None:
+        return None
+    latest = db.session.query(func.max(Post.timestamp)).filter(Post.user_id == user.id).scalar()
+    parts = [
+        user.id,
+        user.version,
+        user.followers_count,
+        user.following_count,
+        user.posts_count,
+        user.last_seen,
+        current_user.is_following(user),
+        latest,
+        # its own profile shows its follow suggestions
+        tuple(suggestions_version(user)) if user == current_user else None,
+    ]
+    return parts
+
+
+# to use URL parameters, include its name in between <> in the route string
+@bp.route("/user/<username>")
+@read_only
+@login_required
+@conditional(user_validators)
+def user(username):
+    user = User.query.filter_by(username=username).first_or_404()
+    page = archive.paginate(
+        user.posts,
+        ArchivedPost.query.filter_by(user_id=user.id),
+        request.args.get("cursor"),
+        current_app.config["POSTS_PER_PAGE"],
+    )
+    form = EmptyForm()
+    suggestions = []
+    if user == current_user:
+        suggestions = suggestions_for(user, current_app.config["SUGGESTIONS_SHOWN"])
+    return render_template(
+        "user.html",
+        user=user,
+        posts=page.items,
+        avatars=avatar_urls(page.items, 36),
+        page=page,
+        form=form,
+        suggestions=suggestions,
+    )
+
+
+@bp.route("/user/<username>/followers")
+@read_only
+@login_required
+def followers(username):
+    user = User.query.filter_by(username=username).first_or_404()
+    page = keyset_paginate(
+        user.followers, [User.id], request.args.get("cursor"), current_app.config["USERS_PER_PAGE"]
+    )
+    return render_template(
+        "follow_list.html",
+        title=f"Followers of {username}",
+        user=user,
+        users=page.items,
+        following=current_user.is_following_many(page.items),
+        page=page,
+    )
+
+
+@bp.route("/user/<username>/following")
+@read_only
+@login_required
+def following(username):
+    user = User.query.filter_by(username=username).first_or_404()
+    page = keyset_paginate(
+        user.followed, [User.id], request.args.get("cursor"), current_app.config["USERS_PER_PAGE"]
+    )
+    return render_template(
+        "follow_list.html",
+        title=f"Followed by {username}",
+        user=user,
+        users=page.items,
+        following=current_user.is_following_many(page.items),
+        page=page,
+    )
+
+
+@bp.route("/explore")
+@read_only
+@login_required
+def explore():
+    # the first pages come from memory, see app/explore.py
+    page = explore_feed.page(request.args.get("cursor"), current_app.config["POSTS_PER_PAGE"])
+    return render_template(
+        "explore.html",
+        title="Explore",
+        posts=page.items,
+        avatars=avatar_urls(page.items, 36),
+        page=page,
+    )
+
+
+@bp.route("/search")
+@read_only
+@login_required
+def search():
+    form = g.search_form
+    if not form.validate():
+        return redirect(url_for("main.index"))
+    page = search_posts(form.q.data, request.args.get("cursor"), current_app.config["POSTS_PER_PAGE"])
+    return render_template(
+        "search.html",
+        title="Search",
+        posts=page.items,
+        avatars=avatar_urls(page.items, 36),
+        page=page,
+    )
+
+
+@bp.route("/stream")
+@login_required
+def stream():
+    # Server-Sent Events with the new posts of the home timeline, see
+    # app/live.py. HEAD is routed here with GET, it would hold a subscription
+    # without reading it
+    if request.method != "GET":
+        abort(405)
+    subscriber = hub.subscribe(current_user.id, current_user.followed_ids())
+    if subscriber is None:
+        abort(503)
+    # the stream isn't wrapped in stream_with_context(), so the request ends
+    # and the database session is removed before it starts: subscribers don't
+    # hold a connection
+    return Response(
+        hub.stream(subscriber),
+        mimetype="text/event-stream",
+        # proxies shouldn't buffer the events nor cache the stream
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@bp.before_app_request
+def before_request():
+    # only recorded in memory, the tracker writes it to the database in
+    # batches so requests don't have to commit anything
+    if current_user.is_authenticated:
+        last_seen.touch(current_user.id)
+        # the search box of the navigation bar
+        g.search_form = SearchForm()
+
+
+@bp.route("/follow/<username>", methods=["Post"])
+@login_required
+def follow(username):
+    form = EmptyForm()
+    # the only invalid form in this case is when the CSRF token is missing
+    # so we include this conditional for security reasons
+    if form.validate_on_submit():
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            flash(f"User {username} not found")
+            return redirect(url_for("main.index"))
+        if user == current_user:
+            flash("You cannot follow yourself!")
+            return redirect(url_for("main.user", username=username))
+        current_user.follow(user)
+        db.session.commit()
+        flash(f"You are now following {username}")
+        return redirect(url_for("main.user", username=username))
+    else:
+        return redirect(url_for("main.index"))
+
+
+@bp.route("/unfollow/<username>", methods=["Post"])
+@login_required
+def unfollow(username):
+    form = EmptyForm()
+    if form.validate_on_submit():
+        user = User.query.filter_by(username=username).first()
+        if user is None:
+            flash(f"User {username} not found")
+            return redirect(url_for("main.index"))
+        if user == current_user:
+            flash("You cannot unfollow yourself!")
+            return redirect(url_for("main.user", username=username))
+        current_user.unfollow(user)
+        db.session.commit()
+        flash(f"You unfollowed {username}")
+        return redirect(url_for("main.user", username=username))
+    else:
+        return redirect(url_for("main.index"))
@@ -1,19 +1,60 @@
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
 from datetime import datetime
-from app import db, login
+from app import db, live, login, follow_cache, passwords, user_cache
+from app.explore import ExplorePost
 from hashlib import md5
-
+from sqlalchemy import bindparam, exists, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import make_transient_to_detached, validates
 
 # the definition below is for an auxiliary table (a self referential one, to be
-# more specific) so we won't make an entire Model class for it
+# more specific) so we won't make an entire Model class for it. The primary key
+# makes duplicate follows impossible and serves "who does X follow" lookups,
+# the index serves the reverse "who follows X" ones
 followers = db.Table(
     "followers",
-    db.Column("follower_id", db.Integer, db.ForeignKey("user.id")),
-    db.Column("followed_id", db.Integer, db.ForeignKey("user.id")),
+    db.Column("follower_id", db.Integer, db.ForeignKey("user.id"), primary_key=True),
+    db.Column("followed_id", db.Integer, db.ForeignKey("user.id"), primary_key=True),
+    db.Index("ix_followers_followed_id", "followed_id", "follower_id"),
 )
 
 
+def email_hash(email):
+    return md5(email.lower().encode("utf-8")).hexdigest()
+
+
+def avatar_url(digest, size):
+    return f"https://www.gravatar.com/avatar/{digest}?d=identicon&s={size}"
+
+
+def avatar_urls(posts, size):
+    # avatar URLs for the authors of a list of posts in a single pass, as a
+    # dict indexed by user id. The authors should have been eager loaded
+    urls = {}
+    for post in posts:
+        if post.user_id not in urls:
+            urls[post.user_id] = post.author.avatar(size)
+    return urls
+
+
+def _insert_follow():
+    # INSERT of a follower_id, followed_id row that does nothing when the
+    # follow already exists, instead of failing on the primary key
+    dialect = db.engine.dialect.name
+    if dialect == "sqlite":
+        return sqlite.insert(followers).on_conflict_do_nothing()
+    if dialect == "postgresql":
+        return postgresql.insert(followers).on_conflict_do_nothing()
+    already = exists().where(
+        followers.c.follower_id == bindparam("follower_id"),
+        followers.c.followed_id == bindparam("followed_id"),
+    )
+    return followers.insert().from_select(
+        ["follower_id", "followed_id"],
+        select(bindparam("follower_id"), bindparam("followed_id")).where(~already),
+    )
+
+
 class User(UserMixin, db.Model):
     # the UserMixin class provided by flask_login has generic implementations
     # for the methods and fields necessary to add login functionality to the
@@ -21,10 +62,30 @@ class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(64), index=True, unique=True)
     email = db.Column(db.String(64), index=True, unique=True)
+    # md5 of the lowercased email, as Gravatar expects it. Stored so avatar
+    # URLs don't need hashing on every render, it's kept in sync by
+    # validate_email() whenever the email is assigned
+    email_hash = db.Column(db.String(32))
     password_hash = db.Column(db.String(128))
     about_me = db.Column(db.String(140))
     last_seen = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # denormalized counters, kept up to date in the same transaction as the
+    # follows and posts they count so profiles don't need COUNT queries, they
+    # can be recomputed with "flask counters reconcile"
+    followers_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    following_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    posts_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
+    # bumped whenever the public profile changes, invalidates anything rendered
+    # from it, like the fragments cached by app.fragments
+    version = db.Column(db.Integer, nullable=False, default=1, server_default="1")
+
+    # incremented when the user (un)follows someone, its follow suggestions
+    # and its followers' are recomputed by the next "flask suggestions
+    # refresh", which resets it unless it was incremented again meanwhile
+    suggestions_stale = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
     # db.relationship is used for one-to-many relationships. In this case,
     # the "one" side is the User class and the "many" side is the Post class.
     # The backref argument creates in the Post objects named "author, that
@@ -46,33 +107,155 @@ class User(UserMixin, db.Model):
         return f"<User {self.username}>"
 
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = passwords.hash(password)
+        if self.id is not None:
+            user_cache.invalidate(self.id)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return passwords.verify(self.password_hash, password)
+
+    @validates("email")
+    def validate_email(self, key, email):
+        if self.email is not None and email != self.email:
+            # the avatar is part of the public profile
+            self.version = (self.version or 1) + 1
+        self.email_hash = email_hash(email)
+        return email
 
     def avatar(self, size):
-        digest = md5(self.email.lower().encode("utf-8")).hexdigest()
-        return f"https://www.gravatar.com/avatar/{digest}?d=identicon&s={size}"
+        return avatar_url(self.email_hash or email_hash(self.email), size)
 
     def follow(self, user):
-        if not self.is_following(user):
-            self.followed.append(user)
+        return bool(self.follow_many([user]))
 
     def unfollow(self, user):
-        if self.is_following(user):
-            self.followed.remove(user)
+        return bool(self.unfollow_many([user]))
+
+    def follow_many(self, users):
+        # follows every user in users that isn't followed yet (nor self) and
+        # returns them. Whether a user was followed is told by the rowcount of
+        # its insert, neither by the follow cache, which is per process and
+        # may be stale, nor by an earlier read, which a concurrent follow
+        # could make wrong
+        from app import jobs, timeline
+
+        candidates = {user.id: user for user in users if user.id != self.id}
+        statement = _insert_follow()
+        new = [
+            user
+            for user in candidates.values()
+            if db.session.execute(statement, {"follower_id": self.id, "followed_id": user.id}).rowcount
+        ]
+        if new:
+            self._update_follow_counters(new, 1)
+            follow_cache.delete(self.id)
+            # the timeline is filled in the background
+            for user in new:
+                jobs.enqueue(timeline.backfill_followed, self.id, user.id)
+            live.after_commit(db.session, "follow", self.id, [user.id for user in new])
+        return new
+
+    def unfollow_many(self, users):
+        # unfollows every user in users that is followed and returns them,
+        # told by the rowcount of each delete like in follow_many()
+        from app import jobs, timeline
+
+        candidates = {user.id: user for user in users}
+        statement = followers.delete().where(
+            followers.c.follower_id == bindparam("follower_id"),
+            followers.c.followed_id == bindparam("followed_id"),
+        )
+        old = [
+            user
+            for user in candidates.values()
+            if db.session.execute(statement, {"follower_id": self.id, "followed_id": user.id}).rowcount
+        ]
+        if old:
+            self._update_follow_counters(old, -1)
+            follow_cache.delete(self.id)
+            for user in old:
+                jobs.enqueue(timeline.prune_unfollowed, self.id, user.id)
+            live.after_commit(db.session, "unfollow", self.id, [user.id for user in old])
+        return old
+
+    def _update_follow_counters(self, users, delta):
+        # counters are incremented by the database rather than in Python, so
+        # concurrent follows of the same user don't overwrite each other
+        User.query.filter(User.id.in_([user.id for user in users])).update(
+            {User.followers_count: User.followers_count + delta}, synchronize_session=False
+        )
+        User.query.filter_by(id=self.id).update(
+            {
+                User.following_count: User.following_count + delta * len(users),
+                User.suggestions_stale: User.suggestions_stale + 1,
+            },
+            synchronize_session=False,
+        )
+        for user in users:
+            db.session.expire(user, ["followers_count"])
+        db.session.expire(self, ["following_count", "suggestions_stale"])
+        user_cache.invalidate(self.id, *[user.id for user in users])
+
+    def followed_ids(self):
+        # frozenset with the ids of every followed user, loaded with a single
+        # scan of the primary key and cached until the user (un)follows someone
+        ids = follow_cache.get(self.id)
+        if ids is None:
+            query = select(followers.c.followed_id).where(followers.c.follower_id == self.id)
+            ids = frozenset(row[0] for row in db.session.execute(query))
+            follow_cache.set(self.id, ids)
+        return ids
 
     def is_following(self, user):
-        return self.followed.filter(followers.c.followed_id == user.id).count() > 0
+        ids = follow_cache.get(self.id)
+        if ids is not None:
+            return user.id in ids
+        query = exists().where(followers.c.follower_id == self.id, followers.c.followed_id == user.id)
+        return db.session.query(query).scalar()
+
+    def is_following_many(self, users):
+        # set with the ids of the users in users that are followed, meant for
+        # views that render many users at once
+        ids = [user.id for user in users]
+        if not ids:
+            return set()
+        cached = follow_cache.get(self.id)
+        if cached is not None:
+            return set(cached.intersection(ids))
+        query = (
+            select(followers.c.followed_id)
+            .where(followers.c.follower_id == self.id)
+            .where(followers.c.followed_id.in_(ids))
+        )
+        return {row[0] for row in db.session.execute(query)}
 
     def followed_posts(self):
         followed = Post.query.join(followers, followers.c.followed_id == Post.user_id).filter(
             followers.c.follower_id == self.id
         )
-        own = Post.query.filter(user_id=self.id)
+        own = Post.query.filter_by(user_id=self.id)
         return followed.union(own).order_by(Post.timestamp.desc())
 
+    def add_post(self, body):
+        from app import timeline
+
+        # the post needs an id before it can be pushed into the followers'
+        # timelines, so flush it right away instead of waiting for the commit
+        post = Post(body=body, author=self)
+        db.session.add(post)
+        db.session.flush()
+        User.query.filter_by(id=self.id).update(
+            {User.posts_count: User.posts_count + 1}, synchronize_session=False
+        )
+        db.session.expire(self, ["posts_count"])
+        user_cache.invalidate(self.id)
+        timeline.fan_out(post)
+        # pushed to the followers with an open home page, see app/live.py
+        live.after_commit(db.session, "post", self.id, live.post_data(post))
+        # and to the explore feed, see app/explore.py
+        live.after_commit(db.session, "add_post", ExplorePost.from_post(post))
+        return post
+
 
 class Post(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -80,10 +263,122 @@ class Post(db.Model):
     timestamp = db.Column(db.DateTime, index=True, default=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
 
+    # profile pages list the posts of one user newest first, this index lets
+    # the database seek straight to a page of them
+    __table_args__ = (db.Index("ix_post_user_id_timestamp", "user_id", "timestamp"),)
+
     def __repr__(self) -> str:
         return f"<Post {self.body}>"
 
 
+# posts older than the ARCHIVE_AFTER_DAYS horizon, moved out of the post table
+# by "flask archive run" so the indexes every page reads only grow with the
+# recent posts. Same columns and ids as the posts, see app/archive.py
+class ArchivedPost(db.Model):
+    __tablename__ = "post_archive"
+    id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    body = db.Column(db.String(140))
+    timestamp = db.Column(db.DateTime, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"))
+
+    author = db.relationship("User")
+
+    __table_args__ = (db.Index("ix_post_archive_user_id_timestamp", "user_id", "timestamp"),)
+
+    def __repr__(self) -> str:
+        return f"<ArchivedPost {self.body}>"
+
+
+def reconcile_counters():
+    # recompute the denormalized counters of every user with one UPDATE per
+    # counter, touching only the rows that are wrong, and return how many rows
+    # were fixed for each counter
+    count = select(db.func.count())
+    counts = {
+        User.followers_count: count.where(followers.c.followed_id == User.id).scalar_subquery(),
+        User.following_count: count.where(followers.c.follower_id == User.id).scalar_subquery(),
+        # archived posts are still posts of their author
+        User.posts_count: count.where(Post.user_id == User.id).scalar_subquery()
+        + count.where(ArchivedPost.user_id == User.id).scalar_subquery(),
+    }
+    fixed = {}
+    for column, expected in counts.items():
+        fixed[column.key] = User.query.filter(column != expected).update(
+            {column: expected}, synchronize_session=False
+        )
+    return fixed
+
+
+# materialized "inbox" of each user: one row per post that should show up on
+# the user's home page. Rows are pushed when a post is written (fan-out on
+# write), so reading the home page is a range scan over (user_id, timestamp)
+# instead of a join + union + sort over the whole followers graph
+class Timeline(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey("post.id"), primary_key=True)
+    # copy of Post.timestamp, so the inbox can be sorted and trimmed without
+    # touching the post table
+    timestamp = db.Column(db.DateTime, nullable=False)
+
+    __table_args__ = (db.Index("ix_timeline_user_id_timestamp", "user_id", "timestamp"),)
+
+    def __repr__(self) -> str:
+        return f"<Timeline {self.user_id} {self.post_id}>"
+
+
+# durable background jobs, each row is a call of the function at the import
+# path name with the JSON list args, run by "flask worker", see app/jobs.py
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    queue = db.Column(db.String(64), nullable=False)
+    name = db.Column(db.String(128), nullable=False)
+    args = db.Column(db.Text, nullable=False, default="[]")
+    # idempotency key, a job with the same key is only queued once
+    key = db.Column(db.String(128), unique=True)
+    state = db.Column(db.String(16), nullable=False, default="queued")
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False)
+    # when it can run next, in the future while it waits for a retry
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # the claim of the worker running it, which expires at locked_until
+    lock = db.Column(db.String(32))
+    locked_until = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    # traceback of the last failure
+    error = db.Column(db.Text)
+
+    # workers look for the next job of a queue that is ready to run
+    __table_args__ = (db.Index("ix_job_queue_state_run_at", "queue", "state", "run_at"),)
+
+    def __repr__(self) -> str:
+        return f"<Job {self.id} {self.name}>"
+
+
+# precomputed "who to follow" suggestions: suggested_id is the rank-th user
+# suggested to user_id, by number of mutuals, see app/suggestions.py
+class Suggestion(db.Model):
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    rank = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    suggested_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    # how many of the users user_id follows follow suggested_id
+    mutuals = db.Column(db.Integer, nullable=False)
+
+    def __repr__(self) -> str:
+        return f"<Suggestion {self.user_id} {self.rank} {self.suggested_id}>"
+
+
 @login.user_loader
 def load_user(id):
-    return User.query.get(int(id))
+    values = user_cache.get(int(id))
+    if values is not None:
+        # rebuild the user from the cached columns and attach it to the session
+        # as if it had been loaded by a query, without emitting one
+        user = User(**values)
+        make_transient_to_detached(user)
+        return db.session.merge(user, load=False)
+    user = User.query.get(int(id))
+    if user is not None:
+        values = {column.key: getattr(user, column.key) for column in User.__table__.columns}
+        user_cache.set(user.id, values)
+    return user
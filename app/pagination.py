@@ -0,0 +1,206 @@
+import base64
+import binascii
+import json
+from collections import namedtuple
+from datetime import datetime
+
+from flask import abort
+from sqlalchemy import and_, or_
+
+# keyset (a.k.a. cursor) pagination: instead of skipping OFFSET rows, which
+# makes the database walk over every skipped row, a page starts right after the
+# sort key of the last row seen, so any page costs one index seek plus the rows
+# in the page no matter how deep it is
+#
+# the sort key is a list of columns, e.g. (Post.timestamp, Post.id), always in
+# descending order (newest first) and ending with a unique column so that rows
+# with the same timestamp are neither repeated nor skipped
+
+Page = namedtuple("Page", ["items", "next_cursor", "prev_cursor"])
+
+NEXT = "n"
+PREV = "p"
+
+
+def _encode_value(value):
+    if isinstance(value, datetime):
+        return {"d": value.isoformat()}
+    return value
+
+
+def _decode_value(value):
+    if isinstance(value, dict):
+        return datetime.fromisoformat(value["d"])
+    return value
+
+
+def encode_cursor(direction, values):
+    # cursors are opaque to the clients, they should only pass them back
+    data = json.dumps([direction, [_encode_value(v) for v in values]], separators=(",", ":"))
+    return base64.urlsafe_b64encode(data.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        direction, values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        if direction not in (NEXT, PREV) or not isinstance(values, list):
+            raise ValueError(cursor)
+        return direction, [_decode_value(v) for v in values]
+    except (binascii.Error, UnicodeError, TypeError, KeyError, ValueError):
+        raise ValueError(f"Invalid cursor: {cursor!r}")
+
+
+def _beyond(columns, values, direction):
+    # row-value comparison (c1, c2) < (v1, v2) expanded into
+    # c1 < v1 OR (c1 = v1 AND c2 < v2), which every backend can match against
+    # a composite index
+    clauses = []
+    for i, (column, value) in enumerate(zip(columns, values)):
+        compare = column < value if direction == NEXT else column > value
+        equal = [c == v for c, v in zip(columns[:i], values[:i])]
+        clauses.append(and_(*equal, compare))
+    return or_(*clauses)
+
+
+def _default_key(columns):
+    names = [column.key for column in columns]
+    return lambda item: [getattr(item, name) for name in names]
+
+
+def parse_cursor(cursor, columns):
+    """Return the (direction, values) of cursor, (NEXT, None) without one.
+
+    Aborts with 400 if it's not a cursor of a list sorted by columns.
+    """
+    if not cursor:
+        return NEXT, None
+    try:
+        direction, values = decode_cursor(cursor)
+    except ValueError:
+        abort(400)
+    if len(values) != len(columns):
+        abort(400)
+    return direction, values
+
+
+def keyset_rows(query, columns, direction=NEXT, values=None, limit=None):
+    """Return up to limit rows of query past values, in the order of direction.
+
+    Newest first for NEXT, oldest first for PREV, from the start of the list
+    when values is None.
+    """
+    query = query.order_by(None)
+    if values is not None:
+        query = query.filter(_beyond(columns, values, direction))
+    if direction == NEXT:
+        query = query.order_by(*[column.desc() for column in columns])
+    else:
+        query = query.order_by(*[column.asc() for column in columns])
+    return query.limit(limit).all()
+
+
+def keyset_paginate(query, columns, cursor=None, per_page=25, key=None):
+    """Return a Page of query ordered by columns (descending) after cursor.
+
+    key extracts the values of columns from a result item, by default the
+    attributes with the same name as the columns.
+    """
+    key = key or _default_key(columns)
+    direction, values = parse_cursor(cursor, columns)
+    # fetch one extra row to know if there is anything past this page
+    rows = keyset_rows(query, columns, direction, values, per_page + 1)
+    return make_page(rows, direction, cursor, per_page, key)
+
+
+def chain_paginate(sources, cursor=None, per_page=25, key=None):
+    """Return a Page of the rows of sources, one after the other.
+
+    sources are (query, columns) pairs, newest first. Each one only lists its
+    rows older than the oldest row of the sources before it, so a source may
+    overlap the ones before it (e.g. the full list after a capped copy of its
+    newest rows). A source is only queried when a page reaches it.
+    """
+    key = key or _default_key(sources[0][1])
+    direction, values = parse_cursor(cursor, sources[0][1])
+    # fetch one extra row to know if there is anything past this page
+    limit = per_page + 1
+    rows = []
+    if direction == NEXT:
+        # a page that reaches the end of a source continues from its last
+        # row, its oldest one
+        for query, columns in sources:
+            after = key(rows[-1]) if rows else values
+            rows += keyset_rows(query, columns, NEXT, after, limit - len(rows))
+            if len(rows) == limit:
+                break
+    else:
+        # newer rows, from the source the cursor is in back to the first one.
+        # bounds[i] is the oldest row of sources[: i + 1]
+        bounds = []
+        for query, columns in sources:
+            oldest = keyset_rows(query, columns, PREV, None, 1)
+            bounds.append(key(oldest[0]) if oldest else bounds[-1] if bounds else None)
+            if oldest and values >= bounds[-1]:
+                break
+        for i in reversed(range(len(bounds))):
+            query, columns = sources[i]
+            if i and bounds[i - 1] is not None:
+                query = query.filter(_beyond(columns, bounds[i - 1], NEXT))
+            after = key(rows[-1]) if rows else values
+            rows += keyset_rows(query, columns, PREV, after, limit - len(rows))
+            if len(rows) == limit:
+                break
+    return make_page(rows, direction, cursor, per_page, key)
+
+
+def merge_paginate(sources, cursor=None, per_page=25, key=None):
+    """Return a Page of the rows of sources, merged in a single order.
+
+    sources are (query, columns) pairs sorted by the same kind of key, their
+    rows interleave unlike those of chain_paginate(), so every page reads
+    up to per_page + 1 rows of each one.
+    """
+    key = key or _default_key(sources[0][1])
+    direction, values = parse_cursor(cursor, sources[0][1])
+    rows = []
+    for query, columns in sources:
+        rows += keyset_rows(query, columns, direction, values, per_page + 1)
+    rows.sort(key=key, reverse=direction == NEXT)
+    return make_page(rows[: per_page + 1], direction, cursor, per_page, key)
+
+
+def keyset_chain(sources, batch_size, key=None):
+    """Yield every row of sources, newest first, like chain_paginate().
+
+    The rows are fetched batch_size at a time.
+    """
+    key = key or _default_key(sources[0][1])
+    last = None
+    for query, columns in sources:
+        query = query.order_by(None)
+        if last is not None:
+            query = query.filter(_beyond(columns, key(last), NEXT))
+        for row in query.order_by(*[column.desc() for column in columns]).yield_per(batch_size):
+            yield row
+            last = row
+
+
+def make_page(rows, direction, cursor, per_page, key):
+    """Return the Page of rows, fetched in the order of direction.
+
+    rows holds per_page + 1 items when there is anything past the page, for
+    pages of results that don't come from a query (e.g. app.explore).
+    """
+    items = list(rows[:per_page])
+    has_more = len(rows) > per_page
+    if direction == PREV:
+        items.reverse()
+
+    next_cursor = prev_cursor = None
+    if items:
+        if direction == PREV or has_more:
+            next_cursor = encode_cursor(NEXT, key(items[-1]))
+        if direction == NEXT and cursor or direction == PREV and has_more:
+            prev_cursor = encode_cursor(PREV, key(items[0]))
+    return Page(items, next_cursor, prev_cursor)
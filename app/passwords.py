@@ -0,0 +1,93 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from werkzeug.exceptions import TooManyRequests
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+# password hashing is deliberately slow CPU work, so instead of running it in
+# the request threads it runs in a pool of PASSWORD_HASH_WORKERS processes. At
+# most PASSWORD_HASH_QUEUE hashes wait for a free process, beyond that requests
+# are rejected with 429 Too Many Requests rather than piling up.
+#
+# the algorithm and its cost are configured with PASSWORD_HASH_METHOD, users
+# whose hash was made with other parameters are rehashed when they log in
+
+
+def hash_parameters(method, salt_length):
+    """Return the parameters of hashes made by method, to compare them.
+
+    werkzeug fills in the defaults of the method, e.g. "pbkdf2:sha256" hashes
+    are stored as "pbkdf2:sha256:<default iterations>".
+    """
+    parts = method.split(":")
+    if parts[0] == "pbkdf2":
+        # the iterations are optional, and compared as numbers
+        iterations = int(parts[2] or 0) if len(parts) > 2 else DEFAULT_PBKDF2_ITERATIONS
+        parts = parts[:2] + [iterations]
+    # plain passwords have no salt
+    return tuple(parts), salt_length if parts[0] != "plain" else 0
+
+
+class HasherBusy(TooManyRequests):
+    description = "Too many logins at the same time, please try again in a few seconds."
+
+
+class PasswordHasher(object):
+    def __init__(self, app=None):
+        self.method = None
+        self.salt_length = None
+        self.workers = 0
+        self._pool = None
+        self._pool_lock = threading.Lock()
+        self._slots = None
+        self.rejected = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.method = app.config["PASSWORD_HASH_METHOD"]
+        self.salt_length = app.config["PASSWORD_SALT_LENGTH"]
+        self.workers = app.config["PASSWORD_HASH_WORKERS"]
+        self.start_method = app.config["PASSWORD_HASH_START_METHOD"]
+        self._slots = threading.BoundedSemaphore(self.workers + app.config["PASSWORD_HASH_QUEUE"])
+        app.extensions["passwords"] = self
+
+    def _get_pool(self):
+        # created on first use, so processes that never hash (CLI commands,
+        # workers before their first login) don't start one
+        with self._pool_lock:
+            if self._pool is None:
+                context = multiprocessing.get_context(self.start_method)
+                self._pool = ProcessPoolExecutor(self.workers, mp_context=context)
+            return self._pool
+
+    def _run(self, function, *args):
+        if not self.workers:
+            return function(*args)
+        if not self._slots.acquire(blocking=False):
+            self.rejected += 1
+            raise HasherBusy()
+        try:
+            return self._get_pool().submit(function, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method, self.salt_length)
+
+    def verify(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        # werkzeug hashes look like "method$salt$hash"
+        method, _, rest = pwhash.partition("$")
+        salt = rest.partition("$")[0]
+        stored = hash_parameters(method, len(salt))
+        return stored != hash_parameters(self.method, self.salt_length)
+
+    def shutdown(self):
+        with self._pool_lock:
+            if self._pool is not None:
+                self._pool.shutdown()
+                self._pool = None
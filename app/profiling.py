@@ -0,0 +1,180 @@
+import atexit
+import heapq
+import json
+import os
+import threading
+import time
+from collections import Counter
+
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# opt-in SQL profiling, enabled with SQL_PROFILING. For every request it
+# records how many statements were executed, how long they took, the slowest
+# ones and the statements that were repeated (candidates for N+1 problems,
+# e.g. a lazy load inside a loop), then:
+#
+# * adds a Server-Timing header, which browsers show in their dev tools
+# * logs a JSON line with the details when SQL_PROFILING_LOG is set
+# * aggregates histograms per endpoint, which each process dumps to its own
+#   file in SQL_PROFILING_DIR, read by "flask profile report"
+
+# upper bounds of the histogram buckets, in milliseconds for the time and
+# statements for the counts
+TIME_BUCKETS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, float("inf")]
+COUNT_BUCKETS = [0, 1, 2, 3, 5, 10, 20, 50, 100, 200, 500, float("inf")]
+
+
+def _bucket(buckets, value):
+    for i, bound in enumerate(buckets):
+        if value <= bound:
+            return i
+    return len(buckets) - 1
+
+
+def _empty_stats():
+    return {
+        "requests": 0,
+        "queries": 0,
+        "time_ms": 0.0,
+        "time_histogram": [0] * len(TIME_BUCKETS),
+        "count_histogram": [0] * len(COUNT_BUCKETS),
+        "repeated": {},
+    }
+
+
+class SQLProfiler(object):
+    def __init__(self, app=None):
+        self.app = None
+        self.endpoints = {}
+        self._lock = threading.Lock()
+        self._since_dump = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions["sql_profiler"] = self
+        if not app.config["SQL_PROFILING"]:
+            return
+        # listening on the Engine class catches the engines Flask-SQLAlchemy
+        # creates lazily, statements outside of this app's requests are ignored
+        event.listen(Engine, "before_cursor_execute", self._before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", self._after_cursor_execute)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        atexit.register(self.dump)
+
+    def _start_request(self):
+        g.sql_profile = {"queries": 0, "time": 0.0, "statements": Counter(), "timings": []}
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault(("profiling_start", id(self)), []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info[("profiling_start", id(self))].pop()
+        if not has_request_context() or current_app._get_current_object() is not self.app:
+            return
+        if "sql_profile" not in g:
+            return
+        profile = g.sql_profile
+        profile["queries"] += 1
+        profile["time"] += elapsed
+        profile["statements"][statement] += 1
+        profile["timings"].append((elapsed, statement))
+
+    def _finish_request(self, response):
+        profile = g.pop("sql_profile", None)
+        if profile is None:
+            return response
+        endpoint = request.endpoint or "<unmatched>"
+        time_ms = profile["time"] * 1000
+        threshold = self.app.config["SQL_PROFILING_REPEAT_THRESHOLD"]
+        repeated = {
+            statement: count for statement, count in profile["statements"].items() if count >= threshold
+        }
+
+        server_timing = f'db;dur={time_ms:.2f};desc="{profile["queries"]} queries"'
+        if "Server-Timing" in response.headers:
+            server_timing = response.headers["Server-Timing"] + ", " + server_timing
+        response.headers["Server-Timing"] = server_timing
+
+        if self.app.config["SQL_PROFILING_LOG"]:
+            slowest = heapq.nlargest(self.app.config["SQL_PROFILING_SLOWEST"], profile["timings"])
+            line = {
+                "event": "sql_profile",
+                "endpoint": endpoint,
+                "method": request.method,
+                "path": request.path,
+                "status": response.status_code,
+                "queries": profile["queries"],
+                "db_ms": round(time_ms, 3),
+                "slowest": [
+                    {"ms": round(elapsed * 1000, 3), "statement": statement}
+                    for elapsed, statement in slowest
+                ],
+                "repeated": [{"count": count, "statement": s} for s, count in repeated.items()],
+            }
+            self.app.logger.info(json.dumps(line))
+
+        with self._lock:
+            stats = self.endpoints.setdefault(endpoint, _empty_stats())
+            stats["requests"] += 1
+            stats["queries"] += profile["queries"]
+            stats["time_ms"] += time_ms
+            stats["time_histogram"][_bucket(TIME_BUCKETS, time_ms)] += 1
+            stats["count_histogram"][_bucket(COUNT_BUCKETS, profile["queries"])] += 1
+            for statement, count in repeated.items():
+                stats["repeated"][statement] = max(stats["repeated"].get(statement, 0), count)
+            self._since_dump += 1
+            dump = self._since_dump >= self.app.config["SQL_PROFILING_DUMP_EVERY"]
+        if dump:
+            self.dump()
+        return response
+
+    def dump(self):
+        # every process writes its own file, replaced atomically
+        with self._lock:
+            self._since_dump = 0
+            data = json.dumps({"pid": os.getpid(), "endpoints": self.endpoints})
+        directory = self.app.config["SQL_PROFILING_DIR"]
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{os.getpid()}.json")
+        with open(path + ".tmp", "w") as f:
+            f.write(data)
+        os.replace(path + ".tmp", path)
+
+
+def load_stats(directory):
+    # merge the stats dumped by every process
+    merged = {}
+    if not os.path.isdir(directory):
+        return merged
+    for name in os.listdir(directory):
+        if not name.endswith(".json"):
+            continue
+        with open(os.path.join(directory, name)) as f:
+            endpoints = json.load(f)["endpoints"]
+        for endpoint, stats in endpoints.items():
+            total = merged.setdefault(endpoint, _empty_stats())
+            for key in ("requests", "queries", "time_ms"):
+                total[key] += stats[key]
+            for key in ("time_histogram", "count_histogram"):
+                total[key] = [a + b for a, b in zip(total[key], stats[key])]
+            for statement, count in stats["repeated"].items():
+                total["repeated"][statement] = max(total["repeated"].get(statement, 0), count)
+    return merged
+
+
+def histogram_percentile(buckets, histogram, p):
+    # upper bound of the bucket holding the p-th percentile
+    total = sum(histogram)
+    if not total:
+        return 0
+    seen = 0
+    for bound, count in zip(buckets, histogram):
+        seen += count
+        if seen >= total * p / 100:
+            return bound
+    return buckets[-1]
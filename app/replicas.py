@@ -0,0 +1,100 @@
+import itertools
+import time
+
+from flask import has_request_context, request, session as cookie_session
+from flask_sqlalchemy import SignallingSession, SQLAlchemy
+from sqlalchemy import event, orm
+from sqlalchemy.sql import Select
+from sqlalchemy.sql.dml import UpdateBase
+
+# read/write splitting: with read replicas configured in SQLALCHEMY_REPLICAS,
+# the SELECTs of GET and HEAD requests to views decorated with @read_only go
+# to the replicas (round robin), everything else goes to the primary:
+#
+# * statements that aren't plain SELECTs (INSERT, UPDATE, DELETE, raw SQL)
+# * every statement of a session after it flushed or wrote anything, so a
+#   transaction always reads its own writes
+# * every statement of a user's requests for REPLICA_STICKY_SECONDS after the
+#   user committed a write, so a redirect after a POST doesn't show a replica
+#   that hasn't caught up yet. The deadline is kept in the session cookie, so
+#   it holds whichever worker answers the next request
+#
+# each transaction reads from a single replica. The replicas are registered
+# as Flask-SQLAlchemy binds named replica0, replica1... keeping them in sync is
+# up to the database, migrations only run on the primary
+
+STICKY_KEY = "_db_primary_until"
+
+
+def read_only(view):
+    # marks a view whose GET and HEAD requests can read from a replica
+    view.read_only = True
+    return view
+
+
+class RoutingSession(SignallingSession):
+    def __init__(self, db, **options):
+        super(RoutingSession, self).__init__(db, **options)
+        self.db = db
+        self.wrote = False
+        # the replica used until the end of the transaction, so its reads are
+        # consistent with each other
+        self.replica = None
+        event.listen(self, "after_flush", self._after_write)
+        event.listen(self, "after_bulk_update", self._after_write)
+        event.listen(self, "after_bulk_delete", self._after_write)
+        event.listen(self, "after_commit", self._after_commit)
+        event.listen(self, "after_rollback", self._after_rollback)
+
+    def _after_write(self, *args):
+        self.wrote = True
+
+    def _after_commit(self, session):
+        if self.wrote and has_request_context():
+            sticky = self.app.config["REPLICA_STICKY_SECONDS"]
+            cookie_session[STICKY_KEY] = time.time() + sticky
+        self.wrote = False
+        self.replica = None
+
+    def _after_rollback(self, session):
+        self.wrote = False
+        self.replica = None
+
+    def _use_replica(self, clause):
+        if not self.app.config["SQLALCHEMY_REPLICAS"]:
+            return False
+        if self.wrote or self._flushing or not isinstance(clause, Select):
+            return False
+        if not has_request_context() or request.method not in ("GET", "HEAD"):
+            return False
+        view = self.app.view_functions.get(request.endpoint)
+        if not getattr(view, "read_only", False):
+            return False
+        return cookie_session.get(STICKY_KEY, 0) < time.time()
+
+    def get_bind(self, mapper=None, clause=None, **kwargs):
+        # Core INSERT, UPDATE and DELETE statements don't flush
+        if isinstance(clause, UpdateBase):
+            self.wrote = True
+        if self._use_replica(clause):
+            if self.replica is None:
+                self.replica = self.db.replica_engine(self.app)
+            return self.replica
+        return super(RoutingSession, self).get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    def init_app(self, app):
+        binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+        for i, uri in enumerate(app.config.get("SQLALCHEMY_REPLICAS") or []):
+            binds[f"replica{i}"] = uri
+        app.config["SQLALCHEMY_BINDS"] = binds
+        super(RoutingSQLAlchemy, self).init_app(app)
+        self._next_replica = itertools.count()
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def replica_engine(self, app):
+        replicas = len(app.config["SQLALCHEMY_REPLICAS"])
+        return self.get_engine(app, bind=f"replica{next(self._next_replica) % replicas}")
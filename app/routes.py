@@ -1,154 +0,0 @@
-from app import app, db
-from flask import render_template, flash, redirect, url_for, request
-from flask_login import current_user, login_user, logout_user, login_required
-from werkzeug.urls import url_parse
-from datetime import datetime
-
-from app.forms import EditProfileForm, EmptyForm, LoginForm, RegistrationForm
-from app.models import User
-
-
-@app.route("/")
-@app.route("/index")
-@login_required
-def index():
-    user = {"username": "Miguel"}
-    posts = [
-        {
-            "author": {"username": "John"},
-            "body": "Beautiful day in Portland!",
-        },
-        {"author": {"username": "Susan"}, "body": "The new Spider Man movie was amazing!"},
-    ]
-    return render_template("index.html", title="Home", posts=posts)
-
-
-@app.route("/login", methods=["GET", "POST"])
-def login():
-    # if an authenticated gets to the Login page by mistake, redirect to Home
-    if current_user.is_authenticated:
-        return redirect(url_for("index"))
-    form = LoginForm()
-    if form.validate_on_submit():
-        user = User.query.filter_by(username=form.username.data).first()
-        if user is None or not user.check_password(form.password.data):
-            flash("Invalid username or password")
-            return redirect(url_for("login"))
-        login_user(user, remember=form.remember_me.data)
-
-        # redirect user to next page, which is useful for redirecting users
-        # back to the login-required page that took them to the login page
-        next_page = request.args.get("next")
-        if not next_page or url_parse(next_page).netloc != "":
-            next_page = url_for("index")
-        return redirect(next_page)
-    return render_template("login.html", title="Login", form=form)
-
-    if form.validate_on_submit():
-        flash(
-            f"Login requested for user {form.username.data},\
-                remember_me={form.remember_me.data}"
-        )
-        return redirect(url_for("index"))
-    return render_template("login.html", title="Sign In", form=form)
-
-
-@app.route("/logout")
-def logout():
-    logout_user()
-    return redirect(url_for("index"))
-
-
-@app.route("/register", methods=["GET", "POST"])
-def register():
-    if current_user.is_authenticated:
-        return redirect(url_for("index"))
-    form = RegistrationForm()
-    if form.validate_on_submit():
-        # create User object using form data
-        user = User(username=form.username.data, email=form.email.data)
-        user.set_password(form.password.data)
-
-        # add and commit new User object to database
-        db.session.add(user)
-        db.session.commit()
-        flash("Contratulations, you are now a registered user!")
-        return redirect(url_for("login"))
-    return render_template("register.html", title="Register", form=form)
-
-
-@app.route("/edit_profile", methods=["GET", "POST"])
-@login_required
-def edit_profile():
-    form = EditProfileForm(current_user.username)
-    if form.validate_on_submit():
-        current_user.username = form.username.data
-        current_user.about_me = form.about_me.data
-        db.session.commit()
-        flash("Your changes have been saved")
-        return redirect(url_for("edit_profile"))  # reload same page
-    # when the browser first sends a GET request, populate the form fields
-    # with the user's current data
-    elif request.method == "GET":
-        form.username.data = current_user.username
-        form.about_me.data = current_user.about_me
-    return render_template("edit_profile.html", title="Edit profile", form=form)
-
-
-# to use URL parameters, include its name in between <> in the route string
-@app.route("/user/<username>")
-@login_required
-def user(username):
-    user = User.query.filter_by(username=username).first_or_404()
-    posts = [{"author": user, "body": "Test post 1"}, {"author": user, "body": "Test post 2"}]
-    form = EmptyForm()
-    return render_template("user.html", user=user, posts=posts, form=form)
-
-
-@app.before_request
-def before_request():
-    if current_user.is_authenticated:
-        current_user.last_seen = datetime.utcnow()
-        db.session.commit()
-
-
-@app.route("/follow/<username>", methods=["Post"])
-@login_required
-def follow(username):
-    form = EmptyForm()
-    # the only invalid form in this case is when the CSRF token is missing
-    # so we include this conditional for security reasons
-    if form.validate_on_submit():
-        user = User.query.filter_by(username=username).first()
-        if user is None:
-            flash(f"User {username} not found")
-            return redirect(url_for("index"))
-        if user == current_user:
-            flash("You cannot follow yourself!")
-            return redirect(url_for("user", username=username))
-        current_user.follow(user)
-        db.session.commit()
-        flash(f"You are now following {username}")
-        return redirect(url_for("user", username=username))
-    else:
-        return redirect(url_for("index"))
-
-
-@app.route("/unfollow/<username>", methods=["Post"])
-@login_required
-def unfollow(username):
-    form = EmptyForm()
-    if form.validate_on_submit():
-        user = User.query.filter_by(username=username).first()
-        if user is None:
-            flash(f"User {username} not found")
-            return redirect(url_for("index"))
-        if user == current_user:
-            flash("You cannot unfollow yourself!")
-            return redirect(url_for("user", username=username))
-        current_user.unfollow(user)
-        db.session.commit()
-        flash(f"You unfollowed {username}")
-        return redirect(url_for("user", username=username))
-    else:
-        return redirect(url_for("index"))
@@ -0,0 +1,102 @@
+import re
+
+from sqlalchemy import and_, column, func, inspect, literal_column, table
+from sqlalchemy.orm import selectinload
+
+from app import db
+from app.models import ArchivedPost, Post
+from app.pagination import Page, chain_paginate, merge_paginate
+
+# full text search over the posts. On SQLite it uses the post_fts FTS5 index
+# (see the "post full text search" migration), ranked with bm25 so the best
+# matches come first, other databases get a slower LIKE scan with the newest
+# matches first. Archived posts (see app/archive.py) are searched too: ranked
+# matches are merged with those of the post_archive_fts index, newest first
+# ones continue into the archive past the oldest hot match
+#
+# user input is never passed to MATCH as is, the FTS5 query syntax has
+# operators and would fail on stray quotes: every word becomes a quoted term,
+# all of them must match and the last one is also a prefix, so results show up
+# while the user is still typing a word
+
+MAX_TERMS = 10
+
+post_fts = table("post_fts", column("rowid"))
+post_archive_fts = table("post_archive_fts", column("rowid"))
+
+# (engine url, name) -> whether the database has the FTS table
+_fts_available = {}
+
+
+def terms(text):
+    return re.findall(r"\w+", (text or "").lower())[:MAX_TERMS]
+
+
+def fts_query(words):
+    quoted = [f'"{word}"' for word in words]
+    quoted[-1] += "*"
+    return " ".join(quoted)
+
+
+def fts_available(name="post_fts"):
+    engine = db.get_engine()
+    key = (str(engine.url), name)
+    if key not in _fts_available:
+        _fts_available[key] = engine.dialect.name == "sqlite" and inspect(engine).has_table(name)
+    return _fts_available[key]
+
+
+def _fts_source(model, index, words):
+    # bm25 is lower for better matches, negated it sorts descending like every
+    # other keyset paginated list, with the post id breaking ties
+    score = -func.bm25(literal_column(index.name))
+    query = (
+        db.session.query(model, score.label("score"))
+        .select_from(index)
+        .join(model, model.id == index.c.rowid)
+        .filter(literal_column(index.name).op("MATCH")(fts_query(words)))
+        .options(selectinload(model.author))
+    )
+    return query, [score, model.id]
+
+
+def _search_fts(words, cursor, per_page):
+    sources = [_fts_source(Post, post_fts, words)]
+    if fts_available(post_archive_fts.name):
+        sources.append(_fts_source(ArchivedPost, post_archive_fts, words))
+    page = merge_paginate(sources, cursor, per_page, key=lambda row: [row.score, row[0].id])
+    return page._replace(items=[row[0] for row in page.items])
+
+
+def _search_like(words, cursor, per_page):
+    patterns = [
+        "%" + word.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%" for word in words
+    ]
+    sources = []
+    for model in (Post, ArchivedPost):
+        query = model.query.filter(and_(*[model.body.ilike(p, escape="\\") for p in patterns]))
+        sources.append((query.options(selectinload(model.author)), [model.timestamp, model.id]))
+    return chain_paginate(sources, cursor, per_page)
+
+
+def search(text, cursor=None, per_page=25):
+    """Return a Page of the posts matching every word of text."""
+    words = terms(text)
+    if not words:
+        return Page([], None, None)
+    if fts_available():
+        return _search_fts(words, cursor, per_page)
+    return _search_like(words, cursor, per_page)
+
+
+def reindex():
+    # rebuilds the indexes from the post and post_archive tables, only needed
+    # if they got out of sync, e.g. after rows were changed with the triggers
+    # disabled
+    if not fts_available():
+        return False
+    db.session.execute(db.text("INSERT INTO post_fts(post_fts) VALUES ('rebuild')"))
+    if fts_available(post_archive_fts.name):
+        db.session.execute(db.text("INSERT INTO post_archive_fts(post_archive_fts) VALUES ('rebuild')"))
+    db.session.commit()
+    return True
@@ -0,0 +1,115 @@
+import bisect
+import itertools
+import random
+from datetime import datetime, timedelta
+
+from app import db, passwords, timeline
+from app.batching import chunks
+from app.models import Post, User, email_hash, followers, reconcile_counters
+
+# synthetic data for development and benchmarks. Popularity in social networks
+# is heavy tailed, so how many followers and posts each user gets is drawn from
+# Pareto distributions: most users have a handful, a few have a lot
+
+WORDS = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut "
+    "labore et dolore magna aliqua enim ad minim veniam quis nostrud exercitation ullamco laboris "
+    "nisi aliquip ex ea commodo consequat duis aute irure in reprehenderit voluptate velit esse "
+    "cillum eu fugiat nulla"
+).split()
+
+# every seeded user has this password
+PASSWORD = "password"
+
+
+def _insert(table, rows, chunk_size):
+    # Core executemany inserts, without building ORM objects
+    for chunk in chunks(rows, chunk_size):
+        db.session.execute(table.insert(), chunk)
+
+
+class _WeightedSampler(object):
+    # draws indexes with probability proportional to their weights in
+    # O(log n), by bisecting the cumulative weights
+    def __init__(self, weights, rng):
+        self.cumulative = list(itertools.accumulate(weights))
+        self.rng = rng
+
+    def __call__(self):
+        return bisect.bisect_left(self.cumulative, self.rng.random() * self.cumulative[-1])
+
+
+def seed(users=100, posts=1000, follows=10, days=30, alpha=1.2, chunk_size=1000, rng=None):
+    """Insert users, their posts and a power-law follow graph.
+
+    follows is the average number of users each new user follows, days is
+    how far in the past the posts go. Returns the number of rows inserted in
+    each table.
+    """
+    rng = rng or random.Random()
+    password_hash = passwords.hash(PASSWORD)
+    first_id = (db.session.query(db.func.max(User.id)).scalar() or 0) + 1
+    ids = list(range(first_id, first_id + users))
+    now = datetime.utcnow()
+
+    def user_rows():
+        for id in ids:
+            email = f"user{id}@example.com"
+            yield {
+                "id": id,
+                "username": f"user{id}",
+                "email": email,
+                "email_hash": email_hash(email),
+                "password_hash": password_hash,
+                "about_me": " ".join(rng.choices(WORDS, k=8)),
+                "last_seen": now - timedelta(seconds=rng.randrange(days * 86400)),
+                # the follows are inserted without going through User.follow()
+                "suggestions_stale": 1,
+            }
+
+    _insert(User.__table__, user_rows(), chunk_size)
+
+    # how many users follow each user and how much each user posts
+    popular = _WeightedSampler([rng.paretovariate(alpha) for _ in ids], rng)
+    active = _WeightedSampler([rng.paretovariate(alpha) for _ in ids], rng)
+
+    def follow_rows():
+        for id in ids:
+            # the number of users followed is exponential around the average
+            wanted = min(int(rng.expovariate(1 / follows)) if follows else 0, users - 1)
+            followed = set()
+            for _ in range(wanted * 3):
+                if len(followed) >= wanted:
+                    break
+                target = ids[popular()]
+                if target != id:
+                    followed.add(target)
+            for target in followed:
+                yield {"follower_id": id, "followed_id": target}
+
+    follow_count = 0
+
+    def counted(rows):
+        nonlocal follow_count
+        for row in rows:
+            follow_count += 1
+            yield row
+
+    _insert(followers, counted(follow_rows()), chunk_size)
+
+    def post_rows():
+        for _ in range(posts):
+            yield {
+                "body": " ".join(rng.choices(WORDS, k=rng.randint(3, 20)))[:140],
+                "timestamp": now - timedelta(seconds=rng.randrange(days * 86400)),
+                "user_id": ids[active()],
+            }
+
+    _insert(Post.__table__, post_rows(), chunk_size)
+    db.session.commit()
+
+    # denormalized data is derived in bulk once everything is in place
+    reconcile_counters()
+    db.session.commit()
+    timeline.rebuild_all()
+    return {"users": users, "followers": follow_count, "posts": posts}
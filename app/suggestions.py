@@ -0,0 +1,215 @@
+import heapq
+import itertools
+import multiprocessing
+import time
+from array import array
+from collections import Counter
+
+from flask import current_app
+from sqlalchemy import bindparam, exists, select
+
+from app import db
+from app.batching import chunks
+from app.models import Suggestion, User, followers
+
+# "who to follow": the users followed by the users someone follows (friends of
+# friends), ranked by how many of the users they follow follow them (mutuals).
+# Computed in batch by "flask suggestions refresh" and stored in the
+# suggestion table, so pages read them with one primary key range scan:
+#
+# * the follow graph is loaded into two flat arrays (compressed sparse rows):
+#   the ids followed by user i are targets[offsets[i]:offsets[i + 1]]. That is
+#   4 bytes per follow and 8 per user, instead of a Python object for each
+# * users are split in batches computed by a pool of SUGGESTIONS_WORKERS
+#   processes, which inherit the arrays when forked
+# * refreshes are incremental: following or unfollowing someone marks the
+#   follower as stale (User.suggestions_stale), and since its followers reach
+#   the users it follows in two hops, their suggestions are recomputed too.
+#   Stale users are marked fresh together with the last batch of suggestions
+#   stored, so a refresh that dies before leaves them stale for the next one
+#
+# suggestions may be a little out of date between refreshes, the ones the user
+# has followed since are filtered out when they are read
+
+
+def load_graph(chunk_size=10000):
+    """Return the (offsets, targets) arrays of the follow graph.
+
+    They are indexed by user id, ids are assigned in sequence so the gaps left
+    by deleted users only cost an empty row each.
+    """
+    max_id = db.session.query(db.func.max(User.id)).scalar() or 0
+    offsets = array("q", [0]) * (max_id + 2)
+    targets = array("i")
+    query = select(followers.c.follower_id, followers.c.followed_id).order_by(
+        followers.c.follower_id, followers.c.followed_id
+    )
+    result = db.session.execute(query, execution_options={"stream_results": True})
+    for rows in result.yield_per(chunk_size).partitions():
+        for follower_id, followed_id in rows:
+            offsets[follower_id + 1] += 1
+            targets.append(followed_id)
+    # degrees -> where the row of each user starts
+    for i in range(1, len(offsets)):
+        offsets[i] += offsets[i - 1]
+    db.session.rollback()
+    return offsets, targets
+
+
+def suggest(offsets, targets, user_id, count):
+    """Return the top count (suggested id, mutuals) pairs for user_id."""
+    if user_id + 1 >= len(offsets):
+        return []
+    followed = targets[offsets[user_id] : offsets[user_id + 1]]
+    mutuals = Counter()
+    for id in followed:
+        if id + 1 < len(offsets):
+            mutuals.update(targets[offsets[id] : offsets[id + 1]])
+    for id in itertools.chain(followed, [user_id]):
+        mutuals.pop(id, None)
+    # most mutuals first, the oldest users break ties
+    return heapq.nsmallest(count, mutuals.items(), key=lambda item: (-item[1], item[0]))
+
+
+# the graph of the worker processes, set by _init_worker()
+_graph = None
+
+
+def _init_worker(offsets, targets, count):
+    global _graph
+    _graph = (offsets, targets, count)
+
+
+def _suggest_batch(user_ids):
+    offsets, targets, count = _graph
+    return user_ids, [
+        {"user_id": user_id, "rank": rank, "suggested_id": suggested_id, "mutuals": mutuals}
+        for user_id in user_ids
+        for rank, (suggested_id, mutuals) in enumerate(suggest(offsets, targets, user_id, count), 1)
+    ]
+
+
+def _stale():
+    # {id: stale counter} of the stale users, read before the graph is loaded
+    query = select(User.id, User.suggestions_stale).where(User.suggestions_stale > 0)
+    stale = dict(db.session.execute(query).all())
+    db.session.rollback()
+    return stale
+
+
+def _mark_fresh(stale):
+    # only the users that didn't (un)follow anyone since they were read, a
+    # follow committed after that is missing from the graph, so its user
+    # stays stale for the next refresh
+    user = User.__table__
+    if stale:
+        db.session.execute(
+            user.update()
+            .where(user.c.id == bindparam("uid"))
+            .where(user.c.suggestions_stale == bindparam("seen"))
+            .values(suggestions_stale=0),
+            [{"uid": id, "seen": seen} for id, seen in stale.items()],
+        )
+
+
+def _affected(stale, batch_size):
+    # the stale users and their followers
+    ids = set(stale)
+    for chunk in chunks(stale, batch_size):
+        query = select(followers.c.follower_id).where(followers.c.followed_id.in_(chunk))
+        ids.update(row[0] for row in db.session.execute(query))
+    return sorted(ids)
+
+
+def _store(user_ids, rows, fresh=None):
+    # fresh is the {id: stale counter} of the users to mark fresh in the same
+    # transaction, given with the last batch
+    table = Suggestion.__table__
+    db.session.execute(table.delete().where(table.c.user_id.in_(user_ids)))
+    if rows:
+        db.session.execute(table.insert(), rows)
+    _mark_fresh(fresh)
+    db.session.commit()
+
+
+def refresh(full=False, workers=None, echo=None):
+    """Recompute the suggestions of the stale users, or of every user.
+
+    Returns how many users were stale and how many were recomputed.
+    """
+    echo = echo or (lambda message: None)
+    config = current_app.config
+    count = config["SUGGESTIONS_PER_USER"]
+    batch_size = config["SUGGESTIONS_BATCH_SIZE"]
+    workers = config["SUGGESTIONS_WORKERS"] if workers is None else workers
+
+    stale = _stale()
+    if full:
+        user_ids = [row[0] for row in db.session.execute(select(User.id).order_by(User.id))]
+    else:
+        user_ids = _affected(sorted(stale), batch_size)
+    if not user_ids:
+        db.session.rollback()
+        return {"stale": len(stale), "users": 0}
+
+    start = time.perf_counter()
+    offsets, targets = load_graph()
+    echo(f"Loaded {len(targets)} follows in {time.perf_counter() - start:.1f}s")
+
+    start = time.perf_counter()
+    batches = chunks(user_ids, batch_size)
+    remaining = -(-len(user_ids) // batch_size)
+    if workers > 1 and len(user_ids) > batch_size:
+        # forked workers share the pages of the arrays with this process,
+        # elsewhere they are pickled once per worker
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("fork" if "fork" in methods else None)
+        with context.Pool(workers, _init_worker, (offsets, targets, count)) as pool:
+            for batch, rows in pool.imap_unordered(_suggest_batch, batches):
+                remaining -= 1
+                _store(batch, rows, None if remaining else stale)
+    else:
+        _init_worker(offsets, targets, count)
+        for batch in batches:
+            remaining -= 1
+            _store(*_suggest_batch(batch), None if remaining else stale)
+    echo(f"Computed the suggestions of {len(user_ids)} users in {time.perf_counter() - start:.1f}s")
+    return {"stale": len(stale), "users": len(user_ids)}
+
+
+def for_user(user, count):
+    """Return up to count (User, mutuals) pairs suggested to user.
+
+    A single range scan of the primary key of the suggestion table, minus the
+    users followed since the last refresh.
+    """
+    followed = exists().where(
+        followers.c.follower_id == user.id, followers.c.followed_id == Suggestion.suggested_id
+    )
+    return (
+        db.session.query(User, Suggestion.mutuals)
+        .join(Suggestion, Suggestion.suggested_id == User.id)
+        .filter(Suggestion.user_id == user.id)
+        .filter(~followed)
+        .order_by(Suggestion.rank)
+        .limit(count)
+        .all()
+    )
+
+
+def version(user):
+    """Return a digest of the stored suggestions of user.
+
+    It changes whenever a refresh stores different ones, for the validators
+    of the pages showing them (see app/conditional.py). Same range scan as
+    for_user().
+    """
+    return (
+        db.session.query(
+            db.func.count(),
+            db.func.sum(Suggestion.rank * Suggestion.suggested_id),
+            db.func.sum(Suggestion.mutuals),
+        )
+        .filter(Suggestion.user_id == user.id)
+        .one()
+    )
@@ -0,0 +1,268 @@
+from flask import current_app
+from sqlalchemy import bindparam, exists, func, literal, select
+from sqlalchemy.orm import selectinload
+
+from app import archive, db, jobs
+from app.models import ArchivedPost, Post, Timeline, User, followers
+
+# the home timeline is a hybrid of two strategies:
+#
+# * push (fan-out on write): when a post is written, a row pointing to it is
+#   inserted in the inbox (Timeline table) of the author and, by a background
+#   job (see app/jobs.py), of every follower, so reading the home page only
+#   needs the reader's own inbox
+# * pull (fan-out on read): authors with more than TIMELINE_FANOUT_LIMIT
+#   followers would make every write touch a huge number of rows, so their
+#   posts are not pushed and are merged into the inbox when it is read
+#
+# inboxes are bounded to the TIMELINE_MAX_LENGTH most recent posts, older
+# entries are trimmed whenever new rows are pushed. Past the oldest post of the
+# inbox the home timeline is read with pull (pulled_timeline()), then from the
+# archive (archived_timeline()), see home_sources()
+
+timeline_table = Timeline.__table__
+
+
+def _max_length():
+    return current_app.config["TIMELINE_MAX_LENGTH"]
+
+
+def _pull_author_ids(candidates):
+    # among the user ids selected by candidates, return those with too many
+    # followers to have their posts pushed
+    limit = current_app.config["TIMELINE_FANOUT_LIMIT"]
+    query = select(User.id).where(User.id.in_(candidates)).where(User.followers_count > limit)
+    return [row[0] for row in db.session.execute(query)]
+
+
+def is_pull_author(user):
+    return bool(_pull_author_ids([user.id]))
+
+
+def _insert(rows):
+    # rows is a select of (user_id, post_id, timestamp) tuples
+    db.session.execute(timeline_table.insert().from_select(["user_id", "post_id", "timestamp"], rows))
+
+
+def _trim(user_ids):
+    # delete every inbox row older than the TIMELINE_MAX_LENGTH-th newest one.
+    # The cutoff of each inbox is looked up first, a single seek on
+    # (user_id, timestamp) per user; correlated in the DELETE it would be
+    # evaluated again for every row of the inbox
+    cutoff = (
+        select(timeline_table.c.timestamp)
+        .where(timeline_table.c.user_id == User.id)
+        .order_by(timeline_table.c.timestamp.desc())
+        .limit(1)
+        .offset(_max_length())
+        .scalar_subquery()
+    )
+    rows = db.session.execute(select(User.id, cutoff).where(User.id.in_(user_ids)))
+    cutoffs = [{"uid": id, "cutoff": timestamp} for id, timestamp in rows if timestamp is not None]
+    if cutoffs:
+        db.session.execute(
+            timeline_table.delete()
+            .where(timeline_table.c.user_id == bindparam("uid"))
+            .where(timeline_table.c.timestamp <= bindparam("cutoff")),
+            cutoffs,
+        )
+
+
+def fan_out(post):
+    # push a freshly flushed post into the inbox of its author and, unless the
+    # author is followed by too many users, queue a job pushing it into the
+    # inbox of every follower
+    author = post.author
+    db.session.execute(
+        timeline_table.insert().values(user_id=author.id, post_id=post.id, timestamp=post.timestamp)
+    )
+    _trim([author.id])
+    if not is_pull_author(author):
+        jobs.enqueue(push_to_followers, post.id, key=f"fan-out:{post.id}")
+
+
+@jobs.task("timeline")
+def push_to_followers(post_id):
+    post = Post.query.get(post_id)
+    if post is None:
+        return
+    already = exists().where(
+        timeline_table.c.user_id == followers.c.follower_id, timeline_table.c.post_id == post.id
+    )
+    rows = (
+        select(followers.c.follower_id, literal(post.id), literal(post.timestamp, db.DateTime))
+        .where(followers.c.followed_id == post.user_id)
+        .where(followers.c.follower_id != post.user_id)
+        # in case the job runs again
+        .where(~already)
+        .distinct()
+    )
+    _insert(rows)
+    _trim(select(followers.c.follower_id).where(followers.c.followed_id == post.user_id))
+
+
+def _is_following(user_id, followed_id):
+    query = exists().where(followers.c.follower_id == user_id, followers.c.followed_id == followed_id)
+    return db.session.query(query).scalar()
+
+
+def backfill(user, followed):
+    # copy the most recent posts of a newly followed user into the inbox, posts
+    # of pull authors don't need it since they are merged when reading
+    if is_pull_author(followed):
+        return
+    rows = (
+        select(literal(user.id), Post.id, Post.timestamp)
+        .where(Post.user_id == followed.id)
+        .where(~exists().where(timeline_table.c.user_id == user.id, timeline_table.c.post_id == Post.id))
+        .order_by(Post.timestamp.desc(), Post.id.desc())
+        .limit(_max_length())
+    )
+    _insert(rows)
+    _trim([user.id])
+
+
+@jobs.task("timeline")
+def backfill_followed(user_id, followed_id):
+    # backfill() as a job queued by User.follow_many(), the user may have
+    # unfollowed meanwhile
+    if _is_following(user_id, followed_id):
+        backfill(User.query.get(user_id), User.query.get(followed_id))
+
+
+def prune(user, unfollowed):
+    # remove the posts of a user that is no longer followed from the inbox
+    posts = select(Post.id).where(Post.user_id == unfollowed.id)
+    db.session.execute(
+        timeline_table.delete()
+        .where(timeline_table.c.user_id == user.id)
+        .where(timeline_table.c.post_id.in_(posts))
+    )
+
+
+@jobs.task("timeline")
+def prune_unfollowed(user_id, unfollowed_id):
+    # prune() as a job queued by User.unfollow_many(), the user may have
+    # followed again meanwhile
+    if not _is_following(user_id, unfollowed_id):
+        prune(User.query.get(user_id), User.query.get(unfollowed_id))
+
+
+def rebuild(user):
+    # recompute an inbox from scratch, used to repair timelines that went out
+    # of sync (e.g. after data was changed by hand or a pull author lost
+    # followers and went back to being pushed)
+    db.session.execute(timeline_table.delete().where(timeline_table.c.user_id == user.id))
+    followed = select(followers.c.followed_id).where(followers.c.follower_id == user.id)
+    pushed = followed
+    pulled = _pull_author_ids(followed)
+    if pulled:
+        pushed = pushed.where(followers.c.followed_id.not_in(pulled))
+    rows = (
+        select(literal(user.id), Post.id, Post.timestamp)
+        .where((Post.user_id == user.id) | Post.user_id.in_(pushed))
+        # by the order of the pages, so posts with the same timestamp as the
+        # oldest one kept are left out after it
+        .order_by(Post.timestamp.desc(), Post.id.desc())
+        .limit(_max_length())
+    )
+    _insert(rows)
+
+
+def rebuild_all(batch_size=500):
+    # rebuild every inbox, committing after each batch of users so a large
+    # rebuild doesn't hold a single huge transaction
+    count = 0
+    last_id = 0
+    while True:
+        users = User.query.filter(User.id > last_id).order_by(User.id).limit(batch_size).all()
+        if not users:
+            return count
+        for user in users:
+            rebuild(user)
+        db.session.commit()
+        count += len(users)
+        last_id = users[-1].id
+
+
+def _oldest(user):
+    # (timestamp, post id) of the oldest post of the inbox of user, None if
+    # it's empty
+    row = db.session.execute(
+        select(timeline_table.c.timestamp, timeline_table.c.post_id)
+        .where(timeline_table.c.user_id == user.id)
+        .order_by(timeline_table.c.timestamp, timeline_table.c.post_id)
+        .limit(1)
+    ).first()
+    return None if row is None else tuple(row)
+
+
+def home_timeline(user, posts=None):
+    # posts for the home page of user: its inbox plus, if it follows any pull
+    # author, the posts of those authors. posts is the query the rows are
+    # selected with, e.g. one loading only some columns of the posts; by
+    # default whole Post objects, whose authors are loaded with one extra query
+    # for the whole page instead of one per post
+    base = Post.query if posts is None else posts
+    query = base.join(Timeline, Timeline.post_id == Post.id).filter(Timeline.user_id == user.id)
+    followed = select(followers.c.followed_id).where(followers.c.follower_id == user.id)
+    pulled = _pull_author_ids(followed)
+    oldest = _oldest(user)
+    if pulled and oldest is not None:
+        # only the posts of the pull authors as new as the inbox: past its
+        # oldest post the posts of every author are read by pulled_timeline(),
+        # including the pushed ones trimmed from the inbox
+        timestamp, id = oldest
+        newer = (Post.timestamp > timestamp) | ((Post.timestamp == timestamp) & (Post.id >= id))
+        query = query.union(base.filter(Post.user_id.in_(pulled)).filter(newer))
+    if posts is None:
+        query = query.options(selectinload(Post.author))
+    return query.order_by(Post.timestamp.desc())
+
+
+def pulled_timeline(user, posts=None):
+    # the posts of user and of the users it follows, read from each author:
+    # where the home timeline continues past the oldest post of the inbox,
+    # and all of it while the inbox is empty (e.g. before it was rebuilt)
+    base = Post.query if posts is None else posts
+    followed = select(followers.c.followed_id).where(followers.c.follower_id == user.id)
+    query = base.filter((Post.user_id == user.id) | Post.user_id.in_(followed))
+    if posts is None:
+        query = query.options(selectinload(Post.author))
+    return query.order_by(Post.timestamp.desc())
+
+
+def archived_timeline(user, posts=None):
+    # the archived posts of user and of the users it follows, where the home
+    # timeline continues past its oldest hot post (see app/archive.py).
+    # Archived posts have no inbox rows, they are read from each author
+    base = ArchivedPost.query if posts is None else posts
+    followed = select(followers.c.followed_id).where(followers.c.follower_id == user.id)
+    query = base.filter((ArchivedPost.user_id == user.id) | ArchivedPost.user_id.in_(followed))
+    if posts is None:
+        query = query.options(selectinload(ArchivedPost.author))
+    return query.order_by(ArchivedPost.timestamp.desc())
+
+
+def home_sources(user, posts=None, archived=None):
+    # the (query, sort columns) pairs the home timeline of user is paginated
+    # from with chain_paginate(): the inbox, the pulled posts older than its
+    # oldest one and the archived posts. posts and archived are the queries
+    # the rows of the hot and the archived posts are selected with
+    return [
+        (home_timeline(user, posts), archive.HOT_COLUMNS),
+        (pulled_timeline(user, posts), archive.HOT_COLUMNS),
+        (archived_timeline(user, archived), archive.COLD_COLUMNS),
+    ]
+
+
+def latest(user):
+    # timestamp of the newest post in the home timeline of user, cheap enough
+    # to be used as a validator for conditional requests
+    newest = db.session.query(func.max(Timeline.timestamp)).filter_by(user_id=user.id).scalar()
+    followed = select(followers.c.followed_id).where(followers.c.follower_id == user.id)
+    pulled = _pull_author_ids(followed)
+    if pulled:
+        query = db.session.query(func.max(Post.timestamp)).filter(Post.user_id.in_(pulled))
+        newest = max([t for t in (newest, query.scalar()) if t is not None], default=None)
+    return newest
@@ -0,0 +1,2 @@
+# benchmarks are plain scripts, run them from the root of the repository with
+# "python -m benchmarks.<name> --help"
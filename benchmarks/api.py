@@ -0,0 +1,184 @@
+"""Throughput of the JSON API compared with the HTML pages it mirrors.
+
+Seeds a database and, through the Flask test client, measures:
+
+* pages: the same page of posts as HTML and as JSON (requests and posts per
+  second)
+* serialization: dicts built from ORM objects versus from the row tuples the
+  API selects, without HTTP in the way
+* streams: the longest lists (posts of the most prolific user, followers of
+  the most followed one) streamed as NDJSON versus loaded as ORM objects and
+  dumped as a single JSON document, with the peak memory of each
+
+    python -m benchmarks.api --users 2000 --posts 100000 --requests 200
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def timed(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+
+def peak_memory(function):
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(users, posts, requests):
+    # runs in a worker process whose DATABASE_URL points to an empty database
+    from flask_migrate import upgrade
+
+    from app import create_app, db
+    from app.api.rows import post_dict, post_rows
+    from app.models import Post, User
+    from app.seed import PASSWORD, seed
+
+    app = create_app()
+    app.config["WTF_CSRF_ENABLED"] = False
+    results = {}
+    with app.app_context():
+        upgrade(directory=os.path.join(ROOT, "migrations"))
+        seed(users=users, posts=posts, follows=20, rng=random.Random(0))
+        reader = User.query.order_by(User.following_count.desc()).first().username
+        author = User.query.order_by(User.posts_count.desc()).first()
+        famous = User.query.order_by(User.followers_count.desc()).first()
+        results["data"] = {
+            "author_posts": author.posts_count,
+            "famous_followers": famous.followers_count,
+        }
+        author, famous = author.username, famous.username
+
+        def orm_dicts():
+            rows = Post.query.filter(Post.user_id == User.id, User.username == author).all()
+            return [
+                {
+                    "id": post.id,
+                    "body": post.body,
+                    "timestamp": post.timestamp.isoformat() + "Z",
+                    "author": {"username": post.author.username, "avatar": post.author.avatar(36)},
+                }
+                for post in rows
+            ]
+
+        def row_dicts():
+            return [post_dict(row) for row in post_rows().filter(User.username == author)]
+
+        for name, function in (("orm", orm_dicts), ("rows", row_dicts)):
+            seconds, items = timed(function, 5)
+            db.session.remove()
+            results.setdefault("serialization", {})[name] = {
+                "posts_per_second": len(items) / seconds,
+                "ms": seconds * 1000,
+            }
+
+        def orm_document():
+            return json.dumps(orm_dicts())
+
+        results["streams"] = {"orm_json_peak_kb": peak_memory(orm_document) / 1024}
+        db.session.remove()
+
+    client = app.test_client()
+    client.post("/login", data={"username": reader, "password": PASSWORD})
+
+    pages = {
+        "timeline": ("/index", "/api/v1/timeline"),
+        "user_posts": (f"/user/{author}", f"/api/v1/users/{author}/posts"),
+    }
+    per_page = app.config["POSTS_PER_PAGE"]
+    results["pages"] = {}
+    for name, urls in pages.items():
+        for kind, url in zip(("html", "json"), urls):
+            seconds, response = timed(lambda: client.get(url), requests)
+            assert response.status_code == 200, (url, response.status_code)
+            results["pages"][f"{name} {kind}"] = {
+                "requests_per_second": 1 / seconds,
+                "posts_per_second": per_page / seconds,
+                "bytes": len(response.data),
+            }
+
+    streams = {
+        "user_posts": f"/api/v1/users/{author}/posts?format=ndjson",
+        "followers": f"/api/v1/users/{famous}/followers?format=ndjson",
+    }
+    for name, url in streams.items():
+        # the test client doesn't read streamed responses until asked to
+        seconds, data = timed(lambda: client.get(url).get_data(), 5)
+        lines = data.count(b"\n")
+        results["streams"][name] = {
+            "rows": lines,
+            "rows_per_second": lines / seconds,
+            "mb_per_second": len(data) / seconds / 2**20,
+            # the response is consumed chunk by chunk, as a server would send it
+            "peak_kb": peak_memory(lambda: sum(len(chunk) for chunk in client.get(url).response)) / 1024,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--users", type=int, default=1000, help="users to seed")
+    parser.add_argument("--posts", type=int, default=50000, help="posts to seed")
+    parser.add_argument("--requests", type=int, default=100, help="requests per page")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        json.dump(run(args.users, args.posts, args.requests), sys.stdout)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ)
+        env["DATABASE_URL"] = "sqlite:///" + os.path.join(directory, "bench.db")
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+        command = [sys.executable, "-m", "benchmarks.api", "--worker"]
+        command += ["--users", str(args.users), "--posts", str(args.posts)]
+        command += ["--requests", str(args.requests)]
+        output = subprocess.run(command, cwd=directory, env=env, check=True, stdout=subprocess.PIPE)
+        results = json.loads(output.stdout)
+
+    print(f"data: {results['data']}")
+    print(f"{'page':20} {'req/s':>8} {'posts/s':>9} {'KB':>8}")
+    for name, stats in results["pages"].items():
+        print(
+            f"{name:20} {stats['requests_per_second']:8.1f} {stats['posts_per_second']:9.0f} "
+            f"{stats['bytes'] / 1024:8.1f}"
+        )
+    print(f"{'serialization':20} {'posts/s':>9} {'ms':>8}")
+    for name, stats in results["serialization"].items():
+        print(f"{name:20} {stats['posts_per_second']:9.0f} {stats['ms']:8.1f}")
+    streams = results["streams"]
+    print(f"{'stream':20} {'rows':>8} {'rows/s':>9} {'MB/s':>8} {'peak KB':>9}")
+    for name in ("user_posts", "followers"):
+        stats = streams[name]
+        print(
+            f"{name:20} {stats['rows']:8} {stats['rows_per_second']:9.0f} "
+            f"{stats['mb_per_second']:8.1f} {stats['peak_kb']:9.0f}"
+        )
+    print(f"{'user_posts as ORM':20} {'':8} {'':9} {'':8} {streams['orm_json_peak_kb']:9.0f}")
+
+
+if __name__ == "__main__":
+    main()
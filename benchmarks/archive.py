@@ -0,0 +1,136 @@
+"""Hot table size and page latency before and after archiving the old posts.
+
+Seeds a database with posts spread over --days days, then measures the size
+of the post table (the hot tier, with its indexes) and the latency of:
+
+* profile: the first page of the posts of the users with the most posts
+* home: the first page of the home timeline of the users following the most
+* past boundary: the first profile page past the newest archived post, the
+  only pages that read the archive once the posts are archived
+
+before and after "flask archive run" moves the posts older than
+--older-than days to the archive, and again after a VACUUM gives the freed
+pages back.
+
+    python -m benchmarks.archive --posts 200000 --days 365 --older-than 30
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def timed(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def run(users, posts, days, older_than, requests):
+    # runs in a worker process whose DATABASE_URL points to an empty database
+    from flask_migrate import upgrade
+
+    from app import archive, create_app, db, timeline
+    from app.models import ArchivedPost, Post, User
+    from app.pagination import NEXT, encode_cursor
+    from app.seed import seed
+
+    app = create_app()
+    per_page = app.config["POSTS_PER_PAGE"]
+    results = {}
+    with app.app_context():
+        upgrade(directory=os.path.join(ROOT, "migrations"))
+        seed(users=users, posts=posts, follows=20, days=days, rng=random.Random(0))
+        authors = [u.id for u in User.query.order_by(User.posts_count.desc()).limit(10)]
+        readers = [u.id for u in User.query.order_by(User.following_count.desc()).limit(10)]
+        # a cursor in the middle of the archived posts
+        boundary = Post.query.order_by(Post.timestamp).offset(posts // 5).first()
+        past = encode_cursor(NEXT, [boundary.timestamp, boundary.id])
+        db.session.remove()
+
+        def profile(cursor=None):
+            for id in authors:
+                user = db.session.get(User, id)
+                archive.paginate(user.posts, ArchivedPost.query.filter_by(user_id=id), cursor, per_page)
+            db.session.remove()
+
+        def home():
+            for id in readers:
+                user = db.session.get(User, id)
+                archive.paginate(
+                    timeline.home_timeline(user), timeline.archived_timeline(user), None, per_page
+                )
+            db.session.remove()
+
+        def measure():
+            stats = archive.stats()
+            return {
+                "hot_posts": stats["hot"]["posts"],
+                "hot_bytes": stats["hot"]["bytes"],
+                "profile_ms": timed(profile, requests) * 1000 / len(authors),
+                "home_ms": timed(home, requests) * 1000 / len(readers),
+                "past_boundary_ms": timed(lambda: profile(past), requests) * 1000 / len(authors),
+            }
+
+        results["before"] = measure()
+        start = time.perf_counter()
+        results["moved"] = archive.archive(timedelta(days=older_than), pause=0)
+        results["seconds"] = time.perf_counter() - start
+        results["after"] = measure()
+        db.session.execute(db.text("VACUUM"))
+        results["after vacuum"] = measure()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--users", type=int, default=1000, help="users to seed")
+    parser.add_argument("--posts", type=int, default=100000, help="posts to seed")
+    parser.add_argument("--days", type=int, default=365, help="age in days of the oldest posts")
+    parser.add_argument("--older-than", type=float, default=30, help="age in days of the posts archived")
+    parser.add_argument("--requests", type=int, default=50, help="repetitions of each measure")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        results = run(args.users, args.posts, args.days, args.older_than, args.requests)
+        json.dump(results, sys.stdout)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ)
+        env["DATABASE_URL"] = "sqlite:///" + os.path.join(directory, "bench.db")
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+        command = [sys.executable, "-m", "benchmarks.archive", "--worker"]
+        command += ["--users", str(args.users), "--posts", str(args.posts), "--days", str(args.days)]
+        command += ["--older-than", str(args.older_than), "--requests", str(args.requests)]
+        output = subprocess.run(command, cwd=directory, env=env, check=True, stdout=subprocess.PIPE)
+        results = json.loads(output.stdout)
+
+    print(f"archived {results['moved']} posts in {results['seconds']:.1f}s")
+    print(f"{'':14} {'hot posts':>10} {'hot MiB':>8} {'profile ms':>11} {'home ms':>8} {'past ms':>8}")
+    for name in ("before", "after", "after vacuum"):
+        stats = results[name]
+        size = "-" if stats["hot_bytes"] is None else f"{stats['hot_bytes'] / 2**20:.1f}"
+        print(
+            f"{name:14} {stats['hot_posts']:10} {size:>8} {stats['profile_ms']:11.2f} "
+            f"{stats['home_ms']:8.2f} {stats['past_boundary_ms']:8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""Explore feed pages served from memory compared with the keyset query.
+
+Seeds a database and measures, for the first --pages pages of the explore
+feed:
+
+* pages: building each page from the in-memory buffer versus from the
+  keyset query it falls back to, without HTTP in the way, and the number of
+  queries each one runs
+* requests: the /explore page through the Flask test client, with the
+  buffer and with a buffer too small to hold any page
+
+    python -m benchmarks.explore --posts 200000 --pages 5
+"""
+
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def timed(function, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def run(users, posts, pages, requests):
+    # runs in a worker process whose DATABASE_URL points to an empty database
+    from flask_migrate import upgrade
+    from sqlalchemy import event
+    from sqlalchemy.orm import selectinload
+
+    from app import create_app, db, explore
+    from app.models import Post
+    from app.pagination import keyset_paginate
+    from app.seed import PASSWORD, seed
+
+    app = create_app()
+    app.config["WTF_CSRF_ENABLED"] = False
+    per_page = app.config["POSTS_PER_PAGE"]
+    results = {}
+    with app.app_context():
+        upgrade(directory=os.path.join(ROOT, "migrations"))
+        seed(users=users, posts=posts, follows=10, rng=random.Random(0))
+        queries = []
+        event.listen(db.engine, "before_cursor_execute", lambda *args: queries.append(args[2]))
+
+        def query_page(cursor):
+            query = Post.query.options(selectinload(Post.author))
+            return keyset_paginate(query, [Post.timestamp, Post.id], cursor, per_page)
+
+        def buffer_page(cursor):
+            return explore.page(cursor, per_page)
+
+        buffer_page(None)
+        for name, page in (("query", query_page), ("buffer", buffer_page)):
+
+            def walk():
+                cursor = None
+                for _ in range(pages):
+                    result = page(cursor)
+                    # what the template reads of every post
+                    [(post.author.username, post.author.avatar(36), post.body) for post in result.items]
+                    cursor = result.next_cursor
+                db.session.remove()
+
+            seconds = timed(walk, requests)
+            queries.clear()
+            walk()
+            results.setdefault("pages", {})[name] = {
+                "pages_per_second": pages / seconds,
+                "queries_per_page": len(queries) / pages,
+            }
+        results["stats"] = dict(explore.stats)
+
+    client = app.test_client()
+    client.post("/login", data={"username": "user1", "password": PASSWORD})
+    for name, size in (("buffer", app.config["EXPLORE_BUFFER_SIZE"]), ("query", 1)):
+        app.config["EXPLORE_BUFFER_SIZE"] = size
+        with app.app_context():
+            explore.load()
+        seconds = timed(lambda: client.get("/explore"), requests)
+        results.setdefault("requests", {})[name] = {"requests_per_second": 1 / seconds}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--users", type=int, default=1000, help="users to seed")
+    parser.add_argument("--posts", type=int, default=50000, help="posts to seed")
+    parser.add_argument("--pages", type=int, default=5, help="pages walked from the newest")
+    parser.add_argument("--requests", type=int, default=100, help="repetitions of each measure")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        json.dump(run(args.users, args.posts, args.pages, args.requests), sys.stdout)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ)
+        env["DATABASE_URL"] = "sqlite:///" + os.path.join(directory, "bench.db")
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+        command = [sys.executable, "-m", "benchmarks.explore", "--worker"]
+        command += ["--users", str(args.users), "--posts", str(args.posts)]
+        command += ["--pages", str(args.pages), "--requests", str(args.requests)]
+        output = subprocess.run(command, cwd=directory, env=env, check=True, stdout=subprocess.PIPE)
+        results = json.loads(output.stdout)
+
+    print(f"{'pages':20} {'pages/s':>9} {'queries':>8}")
+    for name, stats in results["pages"].items():
+        print(f"{name:20} {stats['pages_per_second']:9.0f} {stats['queries_per_page']:8.1f}")
+    print(f"{'/explore':20} {'req/s':>9}")
+    for name, stats in results["requests"].items():
+        print(f"{name:20} {stats['requests_per_second']:9.1f}")
+    print(f"buffer: {results['stats']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,193 @@
+"""Load test of the live updates (Server-Sent Events) of the home page.
+
+Serves the app with Werkzeug's threaded server in a worker process, opens
+--subscribers idle /stream connections spread over --users users that follow
+the same author, then has the author write --posts posts and measures how
+long each post takes to reach every subscriber, from the moment the form is
+submitted. Reports the memory and threads of the server with the
+subscribers connected.
+
+    python -m benchmarks.live --subscribers 1000 --posts 20
+"""
+
+import argparse
+import http.client
+import os
+import re
+import selectors
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.parse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))]
+
+
+def serve(port, users):
+    # runs in the worker process whose DATABASE_URL points to an empty database
+    import random
+
+    from flask_migrate import upgrade
+    from werkzeug.serving import make_server
+
+    from app import create_app, db
+    from app.models import User
+    from app.seed import seed
+
+    app = create_app()
+    app.config["WTF_CSRF_ENABLED"] = False
+    with app.app_context():
+        upgrade(directory=os.path.join(ROOT, "migrations"))
+        seed(users=users + 1, posts=0, follows=0, rng=random.Random(0))
+        author, *readers = User.query.order_by(User.id).all()
+        for reader in readers:
+            reader.follow(author)
+        db.session.commit()
+        print(author.username, " ".join(reader.username for reader in readers), flush=True)
+        db.session.remove()
+    server = make_server("127.0.0.1", port, app, threaded=True)
+    server.serve_forever()
+
+
+def login(port, username):
+    from app.seed import PASSWORD
+
+    connection = http.client.HTTPConnection("127.0.0.1", port)
+    body = urllib.parse.urlencode({"username": username, "password": PASSWORD})
+    headers = {"Content-Type": "application/x-www-form-urlencoded"}
+    connection.request("POST", "/login", body, headers)
+    response = connection.getresponse()
+    response.read()
+    cookie = response.getheader("Set-Cookie").split(";", 1)[0]
+    connection.close()
+    return cookie
+
+
+def subscribe(port, cookie):
+    sock = socket.create_connection(("127.0.0.1", port))
+    request = f"GET /stream HTTP/1.1\r\nHost: 127.0.0.1\r\nCookie: {cookie}\r\n\r\n"
+    sock.sendall(request.encode("ascii"))
+    data = b""
+    while b"retry:" not in data:
+        chunk = sock.recv(4096)
+        if not chunk:
+            raise RuntimeError(f"Stream refused: {data[:200]!r}")
+        data += chunk
+    sock.setblocking(False)
+    return sock
+
+
+def process_stats(pid):
+    with open(f"/proc/{pid}/status") as f:
+        status = dict(line.split(":", 1) for line in f)
+    return int(status["VmRSS"].split()[0]) / 1024, int(status["Threads"])
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--subscribers", type=int, default=500, help="open streams")
+    parser.add_argument("--users", type=int, default=50, help="users the streams are spread over")
+    parser.add_argument("--posts", type=int, default=20, help="posts written by the author")
+    parser.add_argument("--port", type=int, default=5077, help="port of the server")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.port, args.users)
+        return
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ)
+        env["DATABASE_URL"] = "sqlite:///" + os.path.join(directory, "live.db")
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+        env["LIVE_MAX_SUBSCRIBERS"] = str(args.subscribers)
+        command = [sys.executable, "-m", "benchmarks.live", "--serve", "--port", str(args.port)]
+        command += ["--users", str(args.users)]
+        server = subprocess.Popen(
+            command, cwd=directory, env=env, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True
+        )
+        try:
+            author, readers = server.stdout.readline().split(" ", 1)
+            readers = readers.split()
+            for _ in range(100):
+                try:
+                    socket.create_connection(("127.0.0.1", args.port)).close()
+                    break
+                except OSError:
+                    time.sleep(0.1)
+            rss_before, threads_before = process_stats(server.pid)
+
+            cookies = [login(args.port, username) for username in readers]
+            start = time.perf_counter()
+            streams = [subscribe(args.port, cookies[i % len(cookies)]) for i in range(args.subscribers)]
+            connect = time.perf_counter() - start
+            time.sleep(1)
+            rss, threads = process_stats(server.pid)
+            print(f"subscribers:        {len(streams)} connected in {connect:.1f}s")
+            print(f"server threads:     {threads_before} -> {threads}")
+            print(
+                f"server memory:      {rss_before:.0f} MB -> {rss:.0f} MB, "
+                f"{(rss - rss_before) * 1024 / len(streams):.0f} KB per subscriber"
+            )
+
+            selector = selectors.DefaultSelector()
+            for sock in streams:
+                selector.register(sock, selectors.EVENT_READ)
+            author_cookie = login(args.port, author)
+            connection = http.client.HTTPConnection("127.0.0.1", args.port)
+            latencies = []
+            spreads = []
+            answers = []
+            for i in range(args.posts):
+                body = urllib.parse.urlencode({"post": f"live post {i}"})
+                headers = {"Content-Type": "application/x-www-form-urlencoded", "Cookie": author_cookie}
+                waiting = set(streams)
+                start = time.perf_counter()
+                # the streams are read while the post is being answered, the
+                # events are sent as soon as it's committed
+                connection.request("POST", "/index", body, headers)
+                received = []
+                deadline = start + 10
+                while waiting and time.perf_counter() < deadline:
+                    for key, _ in selector.select(timeout=0.5):
+                        data = key.fileobj.recv(65536)
+                        if key.fileobj in waiting and re.search(rb"event: post", data):
+                            waiting.discard(key.fileobj)
+                            received.append(time.perf_counter() - start)
+                connection.getresponse().read()
+                answers.append(time.perf_counter() - start)
+                if waiting:
+                    print(f"post {i}: {len(waiting)} subscribers didn't receive it")
+                latencies += received
+                spreads.append(max(received) - min(received))
+                time.sleep(0.05)
+
+            latencies = [latency * 1000 for latency in latencies]
+            print(
+                f"delivery latency:   p50 {percentile(latencies, 50):.1f} ms, "
+                f"p99 {percentile(latencies, 99):.1f} ms, max {max(latencies):.1f} ms"
+            )
+            print(f"post answered in:   p50 {percentile(answers, 50) * 1000:.1f} ms")
+            print(
+                f"fan-out spread:     {statistics.mean(spreads) * 1000:.1f} ms between the first "
+                "and the last subscriber of a post"
+            )
+            for sock in streams:
+                sock.close()
+        finally:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
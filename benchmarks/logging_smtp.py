@@ -0,0 +1,118 @@
+"""Latency of logging errors with a slow mail server.
+
+Starts a local SMTP stub that takes --delay seconds to answer each
+connection and logs --errors exceptions through the old direct SMTPHandler
+and through the queued pipeline of app.logging_pipeline, reporting how long
+the logging call blocks the caller and how many emails were sent.
+
+    python -m benchmarks.logging_smtp --errors 50 --delay 0.2
+"""
+
+import argparse
+import logging
+import os
+import socketserver
+import statistics
+import tempfile
+import threading
+import time
+from logging.handlers import SMTPHandler
+
+from flask import Flask
+from flask.logging import default_handler
+
+from app.logging_pipeline import LogPipeline
+from config import Config
+
+
+class SlowSMTPHandler(socketserver.StreamRequestHandler):
+    # just enough of SMTP for smtplib to deliver a message
+    def handle(self):
+        time.sleep(self.server.delay)
+        self.wfile.write(b"220 stub\r\n")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command in (b"EHLO", b"HELO"):
+                self.wfile.write(b"250 stub\r\n")
+            elif command == b"DATA":
+                self.wfile.write(b"354 go ahead\r\n")
+                while self.rfile.readline() not in (b".\r\n", b""):
+                    pass
+                with self.server.lock:
+                    self.server.messages += 1
+                self.wfile.write(b"250 ok\r\n")
+            elif command == b"QUIT":
+                self.wfile.write(b"221 bye\r\n")
+                return
+            else:
+                self.wfile.write(b"250 ok\r\n")
+
+
+class SMTPStub(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, delay):
+        super(SMTPStub, self).__init__(("127.0.0.1", 0), SlowSMTPHandler)
+        self.delay = delay
+        self.messages = 0
+        self.lock = threading.Lock()
+
+
+def log_errors(logger, count):
+    latencies = []
+    for i in range(count):
+        try:
+            raise ValueError(f"benchmark error {i % 3}")
+        except ValueError:
+            start = time.perf_counter()
+            logger.exception("Exception on /index [GET]")
+            latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def report(name, latencies, messages):
+    print(
+        f"{name:10} mean {statistics.mean(latencies) * 1000:9.3f} ms   "
+        f"max {max(latencies) * 1000:9.3f} ms   emails {messages}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--errors", type=int, default=50, help="exceptions to log")
+    parser.add_argument("--delay", type=float, default=0.2, help="seconds the SMTP stub takes to answer")
+    args = parser.parse_args()
+
+    server = SMTPStub(args.delay)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+
+    # how app/__init__.py used to log, with the handler called by the request
+    logger = logging.getLogger("benchmark.direct")
+    logger.propagate = False
+    logger.addHandler(SMTPHandler((host, port), "no-reply@localhost", ["admin@localhost"], "Failure"))
+    report("direct", log_errors(logger, args.errors), server.messages)
+
+    server.messages = 0
+    with tempfile.TemporaryDirectory() as directory:
+        os.chdir(directory)  # the pipeline writes logs/microblog.log
+        app = Flask("benchmark")
+        app.config.from_object(Config)
+        app.config.update(MAIL_SERVER=host, MAIL_PORT=port, MAIL_USE_TLS=False)
+        pipeline = LogPipeline(app)
+        pipeline.start()
+        app.logger.removeHandler(default_handler)
+        latencies = log_errors(app.logger, args.errors)
+        pipeline.stop()
+        report("pipeline", latencies, server.messages)
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
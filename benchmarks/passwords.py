@@ -0,0 +1,105 @@
+"""Login throughput with inline and offloaded password hashing.
+
+Runs --logins logins through the /login route from --threads concurrent
+threads, first hashing in the request threads (PASSWORD_HASH_WORKERS=0, how
+logins used to work) and then in a pool of --workers processes, reporting
+logins per second and how many logins were shed with 429.
+
+    python -m benchmarks.passwords --threads 8 --workers 4 --logins 200
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_logins(threads, logins):
+    # runs in a worker process configured through the environment
+    import random
+
+    from flask_migrate import upgrade
+
+    from app import create_app, db
+    from app.models import User
+    from app.seed import PASSWORD, seed
+
+    app = create_app()
+    app.config["WTF_CSRF_ENABLED"] = False
+    with app.app_context():
+        upgrade(directory=os.path.join(ROOT, "migrations"))
+        seed(users=50, posts=0, follows=0, rng=random.Random(0))
+        usernames = [username for username, in db.session.query(User.username)]
+        db.session.remove()
+
+    counts = {"ok": 0, "rejected": 0}
+    lock = threading.Lock()
+
+    def worker(n):
+        client = app.test_client()
+        for i in range(n):
+            data = {"username": usernames[i % len(usernames)], "password": PASSWORD}
+            status = client.post("/login", data=data).status_code
+            client.get("/logout")
+            with lock:
+                counts["ok" if status == 302 else "rejected"] += 1
+
+    per_thread = [logins // threads + (1 if i < logins % threads else 0) for i in range(threads)]
+    pool = [threading.Thread(target=worker, args=(n,)) for n in per_thread]
+    start = time.perf_counter()
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return {
+        "logins_per_second": counts["ok"] / elapsed,
+        "rejected": counts["rejected"],
+        "seconds": elapsed,
+    }
+
+
+def run_mode(workers, args):
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ)
+        env["DATABASE_URL"] = "sqlite:///" + os.path.join(directory, "bench.db")
+        env["PASSWORD_HASH_WORKERS"] = str(workers)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+        command = [sys.executable, "-m", "benchmarks.passwords", "--worker"]
+        command += ["--threads", str(args.threads), "--logins", str(args.logins)]
+        output = subprocess.run(
+            command, cwd=directory, env=env, check=True, stdout=subprocess.PIPE
+        ).stdout
+        return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--threads", type=int, default=8, help="concurrent request threads")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="hashing processes")
+    parser.add_argument("--logins", type=int, default=200, help="total logins")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        json.dump(run_logins(args.threads, args.logins), sys.stdout)
+        return
+
+    for name, workers in (("inline", 0), (f"pool of {args.workers}", args.workers)):
+        result = run_mode(workers, args)
+        print(
+            f"{name:12} {result['logins_per_second']:8.1f} logins/s   "
+            f"{result['rejected']} rejected   {result['seconds']:.1f}s"
+        )
+
+
+if __name__ == "__main__":
+    main()
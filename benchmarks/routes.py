@@ -0,0 +1,216 @@
+"""Route level benchmarks.
+
+Seeds a fresh database at each data scale and drives the main routes through
+the Flask test client, reporting latency percentiles, queries per request and
+throughput. Each scale runs in its own process with its own SQLite file.
+
+    python -m benchmarks.routes --scales small,medium --json results.json
+    python -m benchmarks.routes --scales small --compare results.json
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCALES = {
+    "small": {"users": 100, "posts": 2000, "follows": 10},
+    "medium": {"users": 1000, "posts": 20000, "follows": 20},
+    "large": {"users": 10000, "posts": 200000, "follows": 30},
+}
+
+
+def percentile(values, p):
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))
+    return values[index]
+
+
+def summarize(latencies, queries):
+    return {
+        "requests": len(latencies),
+        "mean_ms": statistics.mean(latencies) * 1000,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p90_ms": percentile(latencies, 90) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "queries_per_request": statistics.mean(queries),
+        "throughput_rps": len(latencies) / sum(latencies),
+    }
+
+
+def measure(requests, make_request, query_count):
+    latencies = []
+    queries = []
+    for i in range(requests):
+        before = query_count[0]
+        start = time.perf_counter()
+        response = make_request(i)
+        latencies.append(time.perf_counter() - start)
+        queries.append(query_count[0] - before)
+        if response.status_code >= 400:
+            raise RuntimeError(f"{response.request.path} answered {response.status_code}")
+    return summarize(latencies, queries)
+
+
+def run_scale(scale, requests, rng):
+    # runs in a worker process whose DATABASE_URL points to an empty database
+    from flask_migrate import upgrade
+    from sqlalchemy import event
+
+    from app import create_app, db
+    from app.models import User
+    from app.seed import PASSWORD, WORDS, seed
+
+    app = create_app()
+    app.config["WTF_CSRF_ENABLED"] = False
+    with app.app_context():
+        upgrade(directory=os.path.join(ROOT, "migrations"))
+        counts = seed(**SCALES[scale], rng=rng)
+        query_count = [0]
+
+        def count_query(*args):
+            query_count[0] += 1
+
+        event.listen(db.engine, "before_cursor_execute", count_query)
+        usernames = [username for username, in db.session.query(User.username)]
+        # the most connected users are the most expensive home pages
+        readers = [
+            username
+            for username, in db.session.query(User.username)
+            .order_by(User.following_count.desc())
+            .limit(10)
+        ]
+        db.session.remove()
+
+    def logged_in(username):
+        client = app.test_client()
+        client.post("/login", data={"username": username, "password": PASSWORD})
+        return client
+
+    clients = [logged_in(username) for username in readers]
+    slow = max(5, requests // 10)
+    results = {}
+    results["index"] = measure(requests, lambda i: clients[i % len(clients)].get("/index"), query_count)
+    results["user"] = measure(
+        requests, lambda i: clients[i % len(clients)].get(f"/user/{rng.choice(usernames)}"), query_count
+    )
+
+    # seeded posts are made of the same few words, so every search term
+    # matches a large share of the posts: the worst case for ranking
+    results["search"] = measure(
+        requests,
+        lambda i: clients[i % len(clients)].get(f"/search?q={'+'.join(rng.sample(WORDS, 1 + i % 2))}"),
+        query_count,
+    )
+
+    targets = rng.sample(usernames, min(len(usernames), requests))
+
+    def follow_unfollow(i):
+        action = "follow" if i % 2 == 0 else "unfollow"
+        return clients[0].post(f"/{action}/{targets[(i // 2) % len(targets)]}")
+
+    results["follow_unfollow"] = measure(requests, follow_unfollow, query_count)
+    results["login"] = measure(
+        slow,
+        lambda i: app.test_client().post(
+            "/login", data={"username": rng.choice(usernames), "password": PASSWORD}
+        ),
+        query_count,
+    )
+    new_users = (f"bench{i}" for i in itertools.count())
+
+    def register(i):
+        username = next(new_users)
+        data = {"username": username, "email": f"{username}@example.com", "password": PASSWORD}
+        data["password2"] = PASSWORD
+        return app.test_client().post("/register", data=data)
+
+    results["register"] = measure(slow, register, query_count)
+    return {"data": counts, "endpoints": results}
+
+
+def run_worker(scale, requests, seed):
+    # each scale gets a fresh process, database and working directory (where
+    # the app may create its logs)
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ)
+        env["DATABASE_URL"] = "sqlite:///" + os.path.join(directory, "bench.db")
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+        command = [sys.executable, "-m", "benchmarks.routes", "--worker", scale]
+        command += ["--requests", str(requests), "--seed", str(seed)]
+        output = subprocess.run(
+            command, cwd=directory, env=env, check=True, stdout=subprocess.PIPE
+        ).stdout
+        return json.loads(output)
+
+
+def git_commit():
+    try:
+        command = ["git", "rev-parse", "--short", "HEAD"]
+        return (
+            subprocess.run(command, cwd=ROOT, stdout=subprocess.PIPE, check=True).stdout.decode().strip()
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def report(results, baseline=None):
+    print(
+        f"{'scale':8} {'endpoint':16} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} "
+        f"{'queries':>8} {'req/s':>8}"
+    )
+    for scale, result in results["scales"].items():
+        for endpoint, stats in result["endpoints"].items():
+            line = (
+                f"{scale:8} {endpoint:16} {stats['p50_ms']:9.2f} {stats['p90_ms']:9.2f} "
+                f"{stats['p99_ms']:9.2f} {stats['queries_per_request']:8.1f} "
+                f"{stats['throughput_rps']:8.1f}"
+            )
+            old = (baseline or {}).get("scales", {}).get(scale, {}).get("endpoints", {}).get(endpoint)
+            if old:
+                change = (stats["p50_ms"] - old["p50_ms"]) / old["p50_ms"] * 100
+                line += f"   p50 {change:+.1f}% vs {baseline.get('commit')}"
+            print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--scales", default="small", help=f"comma separated, from {', '.join(SCALES)}")
+    parser.add_argument("--requests", type=int, default=200, help="requests per endpoint")
+    parser.add_argument("--seed", type=int, default=0, help="random seed of the data and requests")
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", help="results file of a previous run to compare with")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        result = run_scale(args.worker, args.requests, random.Random(args.seed))
+        json.dump(result, sys.stdout)
+        return
+
+    results = {"commit": git_commit(), "python": platform.python_version(), "scales": {}}
+    for scale in args.scales.split(","):
+        results["scales"][scale] = run_worker(scale, args.requests, args.seed)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    report(results, baseline)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
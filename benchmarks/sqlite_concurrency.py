@@ -0,0 +1,149 @@
+"""Concurrent reads and writes on SQLite, with and without the engine tuning.
+
+Runs --readers threads reading home timelines and --writers threads posting
+for --seconds, first with SQLite's defaults (SQLITE_TUNING=0: rollback journal
+and a new connection per session) and then with the settings of app/engine.py
+(WAL, pragmas and a connection pool), reporting operations per second, latency
+percentiles and how many operations failed with "database is locked".
+
+    python -m benchmarks.sqlite_concurrency --readers 8 --writers 2 --seconds 10
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, max(0, round(p / 100 * len(values)) - 1))]
+
+
+def run_load(readers, writers, seconds):
+    # runs in a worker process configured through the environment
+    import random
+
+    from flask_migrate import upgrade
+    from sqlalchemy.exc import OperationalError
+
+    from app import create_app, db, engine_profile, timeline
+    from app.models import User
+    from app.seed import seed
+
+    app = create_app()
+
+    with app.app_context():
+        upgrade(directory=os.path.join(ROOT, "migrations"))
+        seed(users=500, posts=10000, follows=20, rng=random.Random(0))
+        user_ids = [id for id, in db.session.query(User.id)]
+        db.session.remove()
+
+    results = {"read": [], "write": []}
+    errors = {"read": 0, "write": 0}
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def read(rng):
+        user = db.session.get(User, rng.choice(user_ids))
+        timeline.home_timeline(user).limit(25).all()
+
+    def write(rng):
+        user = db.session.get(User, rng.choice(user_ids))
+        user.add_post(f"benchmark post {rng.random()}")
+        db.session.commit()
+
+    def worker(kind, operation, seed):
+        rng = random.Random(seed)
+        latencies = []
+        failed = 0
+        with app.app_context():
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    operation(rng)
+                    latencies.append(time.perf_counter() - start)
+                except OperationalError:
+                    # "database is locked"
+                    failed += 1
+                    db.session.rollback()
+                finally:
+                    db.session.remove()
+        with lock:
+            results[kind].extend(latencies)
+            errors[kind] += failed
+
+    threads = [threading.Thread(target=worker, args=("read", read, i)) for i in range(readers)]
+    threads += [
+        threading.Thread(target=worker, args=("write", write, -i)) for i in range(1, writers + 1)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    summary = {}
+    for kind, latencies in results.items():
+        summary[kind] = {
+            "ops_per_second": len(latencies) / seconds,
+            "p50_ms": percentile(latencies, 50) * 1000,
+            "p99_ms": percentile(latencies, 99) * 1000,
+            "errors": errors[kind],
+        }
+    with app.app_context():
+        summary["pool"] = engine_profile.stats()
+    return summary
+
+
+def run_mode(tuning, args):
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ)
+        env["DATABASE_URL"] = "sqlite:///" + os.path.join(directory, "bench.db")
+        env["SQLITE_TUNING"] = "1" if tuning else "0"
+        env["DATABASE_POOL_SIZE"] = str(args.readers + args.writers)
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+        command = [sys.executable, "-m", "benchmarks.sqlite_concurrency", "--worker"]
+        command += ["--readers", str(args.readers), "--writers", str(args.writers)]
+        command += ["--seconds", str(args.seconds)]
+        output = subprocess.run(
+            command, cwd=directory, env=env, check=True, stdout=subprocess.PIPE
+        ).stdout
+        return json.loads(output)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--readers", type=int, default=8, help="threads reading timelines")
+    parser.add_argument("--writers", type=int, default=2, help="threads posting")
+    parser.add_argument("--seconds", type=float, default=10, help="duration of each run")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        json.dump(run_load(args.readers, args.writers, args.seconds), sys.stdout)
+        return
+
+    print(f"{'profile':8} {'kind':6} {'ops/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'locked':>7}")
+    for name, tuning in (("default", False), ("tuned", True)):
+        result = run_mode(tuning, args)
+        for kind in ("read", "write"):
+            stats = result[kind]
+            print(
+                f"{name:8} {kind:6} {stats['ops_per_second']:8.1f} {stats['p50_ms']:8.2f} "
+                f"{stats['p99_ms']:8.2f} {stats['errors']:7}"
+            )
+        print(f"{name:8} pool   {result['pool']}")
+
+
+if __name__ == "__main__":
+    main()
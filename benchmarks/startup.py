@@ -0,0 +1,86 @@
+"""Startup time of the app and of the flask CLI.
+
+Runs each command --runs times in a fresh process and reports the median and
+the best wall time, plus the time create_app() takes once the modules are
+imported (the cost of every extra app in a process, e.g. one per test).
+
+    python -m benchmarks.startup --runs 10
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CREATE_APP = """
+import time
+from app import create_app
+create_app()
+start = time.perf_counter()
+for _ in range(20):
+    create_app()
+print((time.perf_counter() - start) / 20)
+"""
+
+COMMANDS = {
+    # what a WSGI server does when it loads the app
+    "import microblog": [sys.executable, "-c", "import microblog"],
+    "flask --help": [sys.executable, "-m", "flask", "--help"],
+    "flask routes": [sys.executable, "-m", "flask", "routes"],
+    "flask db current": [
+        sys.executable,
+        "-m",
+        "flask",
+        "db",
+        "current",
+        "-d",
+        os.path.join(ROOT, "migrations"),
+    ],
+}
+
+
+def run(command, directory, env):
+    start = time.perf_counter()
+    subprocess.run(
+        command, cwd=directory, env=env, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--runs", type=int, default=10, help="runs of each command")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        env = dict(os.environ)
+        env["DATABASE_URL"] = "sqlite:///" + os.path.join(directory, "startup.db")
+        env["FLASK_APP"] = os.path.join(ROOT, "microblog.py")
+        env["PYTHONPATH"] = os.pathsep.join(filter(None, [ROOT, env.get("PYTHONPATH")]))
+
+        print(f"{'command':20} {'median ms':>10} {'best ms':>10}")
+        for name, command in COMMANDS.items():
+            times = [run(command, directory, env) for _ in range(args.runs)]
+            print(f"{name:20} {statistics.median(times) * 1000:10.1f} {min(times) * 1000:10.1f}")
+
+        output = subprocess.run(
+            [sys.executable, "-c", CREATE_APP],
+            cwd=directory,
+            env=env,
+            check=True,
+            stdout=subprocess.PIPE,
+        ).stdout
+        print(f"{'create_app()':20} {float(output) * 1000:10.2f}")
+        # CLI commands and app creation shouldn't set up the production logs
+        print(f"logs directory created: {os.path.exists(os.path.join(directory, 'logs'))}")
+
+
+if __name__ == "__main__":
+    main()
@@ -10,6 +10,31 @@ class Config(object):
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # comma separated URLs of read replicas of the database, and for how many
+    # seconds a user only reads from the primary after writing to it, see
+    # app/replicas.py
+    SQLALCHEMY_REPLICAS = [
+        url for url in (os.environ.get("DATABASE_REPLICA_URLS") or "").split(",") if url
+    ]
+    REPLICA_STICKY_SECONDS = int(os.environ.get("REPLICA_STICKY_SECONDS") or 10)
+
+    # connections each worker process keeps open to the database (set the pool
+    # size to its number of threads), see app/engine.py
+    DATABASE_POOL_SIZE = int(os.environ.get("DATABASE_POOL_SIZE") or 5)
+    DATABASE_MAX_OVERFLOW = int(os.environ.get("DATABASE_MAX_OVERFLOW") or 10)
+    DATABASE_POOL_TIMEOUT = int(os.environ.get("DATABASE_POOL_TIMEOUT") or 30)
+    DATABASE_POOL_RECYCLE = int(os.environ.get("DATABASE_POOL_RECYCLE") or 3600)
+
+    # pragmas set on every SQLite connection, SQLITE_TUNING=0 keeps SQLite's
+    # defaults. The cache size is in KiB when negative, the mmap size in bytes
+    SQLITE_TUNING = os.environ.get("SQLITE_TUNING") != "0"
+    SQLITE_JOURNAL_MODE = os.environ.get("SQLITE_JOURNAL_MODE") or "WAL"
+    SQLITE_SYNCHRONOUS = os.environ.get("SQLITE_SYNCHRONOUS") or "NORMAL"
+    SQLITE_BUSY_TIMEOUT = int(os.environ.get("SQLITE_BUSY_TIMEOUT") or 5000)
+    SQLITE_CACHE_SIZE = int(os.environ.get("SQLITE_CACHE_SIZE") or -64000)
+    SQLITE_MMAP_SIZE = int(os.environ.get("SQLITE_MMAP_SIZE") or 256 * 1024 * 1024)
+    SQLITE_TEMP_STORE = os.environ.get("SQLITE_TEMP_STORE") or "MEMORY"
+
     # cofiguracao de envio de erros por email
     MAIL_SERVER = os.environ.get("MAIL_SERVER")
     MAIL_PORT = int(os.environ.get("MAIL_PORT") or 25)
@@ -17,3 +42,121 @@ class Config(object):
     MAIL_USERNAME = os.environ.get("MAIL_USERNAME")
     MAIL_PASSWORD = os.environ.get("MAIL_PASSWORD")
     ADMINS = ["pedro.saderazevedo@gmail.com"]
+
+    # password hashing: werkzeug method (algorithm and cost), salt length, how
+    # many processes hash in parallel (0 hashes in the request thread) and how
+    # many hashes may wait for a process before logins are rejected
+    PASSWORD_HASH_METHOD = os.environ.get("PASSWORD_HASH_METHOD") or "pbkdf2:sha256:260000"
+    PASSWORD_SALT_LENGTH = 16
+    PASSWORD_HASH_WORKERS = int(os.environ.get("PASSWORD_HASH_WORKERS") or os.cpu_count() or 1)
+    PASSWORD_HASH_QUEUE = int(os.environ.get("PASSWORD_HASH_QUEUE") or 32)
+    # processes are spawned rather than forked from a multithreaded server, so
+    # scripts using the app must guard their code with if __name__ == "__main__"
+    PASSWORD_HASH_START_METHOD = os.environ.get("PASSWORD_HASH_START_METHOD") or "spawn"
+
+    # logging pipeline: size of the queue between the request threads and the
+    # handlers, minimum seconds between error digest emails, SMTP timeout and
+    # size of each log file before it's rotated
+    LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE") or 10000)
+    LOG_MAIL_INTERVAL = int(os.environ.get("LOG_MAIL_INTERVAL") or 60)
+    LOG_MAIL_TIMEOUT = float(os.environ.get("LOG_MAIL_TIMEOUT") or 10)
+    LOG_MAX_BYTES = int(os.environ.get("LOG_MAX_BYTES") or 1024 * 1024)
+
+    # last_seen is updated at most once every LAST_SEEN_GRANULARITY seconds
+    # per user, and pending updates are written every LAST_SEEN_FLUSH_INTERVAL
+    LAST_SEEN_GRANULARITY = int(os.environ.get("LAST_SEEN_GRANULARITY") or 60)
+    LAST_SEEN_FLUSH_INTERVAL = int(os.environ.get("LAST_SEEN_FLUSH_INTERVAL") or 10)
+
+    # how many users have the ids they follow cached in each process, and for
+    # how many seconds
+    FOLLOW_CACHE_SIZE = int(os.environ.get("FOLLOW_CACHE_SIZE") or 10000)
+    FOLLOW_CACHE_TTL = int(os.environ.get("FOLLOW_CACHE_TTL") or 300)
+
+    # cache of the users loaded by Flask-Login, the backend is the import path
+    # of a class like app.cache.LRUCache (or app.cache.NullCache to disable it)
+    USER_CACHE_BACKEND = os.environ.get("USER_CACHE_BACKEND") or "app.cache.LRUCache"
+    USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE") or 10000)
+    USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL") or 60)
+
+    # cache of rendered posts, configured like the user cache
+    FRAGMENT_CACHE_BACKEND = os.environ.get("FRAGMENT_CACHE_BACKEND") or "app.cache.LRUCache"
+    FRAGMENT_CACHE_SIZE = int(os.environ.get("FRAGMENT_CACHE_SIZE") or 5000)
+    FRAGMENT_CACHE_TTL = int(os.environ.get("FRAGMENT_CACHE_TTL") or 3600)
+
+    # per request SQL profiling, see app/profiling.py. It adds a little overhead
+    # to every statement, so it's off unless SQL_PROFILING is set
+    SQL_PROFILING = os.environ.get("SQL_PROFILING") is not None
+    SQL_PROFILING_LOG = os.environ.get("SQL_PROFILING_LOG") is not None
+    SQL_PROFILING_DIR = os.environ.get("SQL_PROFILING_DIR") or os.path.join(
+        basedir, "logs", "sql_profile"
+    )
+    SQL_PROFILING_SLOWEST = 3
+    SQL_PROFILING_REPEAT_THRESHOLD = 3
+    SQL_PROFILING_DUMP_EVERY = 100
+
+    # page sizes of the keyset paginated lists
+    POSTS_PER_PAGE = 25
+    USERS_PER_PAGE = 50
+
+    # API clients choose their page size with ?per_page up to this limit, the
+    # streamed (NDJSON) lists are read and sent in batches of this many rows
+    API_MAX_PER_PAGE = int(os.environ.get("API_MAX_PER_PAGE") or 100)
+    API_STREAM_BATCH_SIZE = int(os.environ.get("API_STREAM_BATCH_SIZE") or 500)
+
+    # live updates of the home page, see app/live.py. Each open stream takes a
+    # thread of the server, so a process accepts at most LIVE_MAX_SUBSCRIBERS
+    # of them, each buffering at most LIVE_QUEUE_SIZE events for a slow client
+    # and sending a keepalive after LIVE_HEARTBEAT idle seconds
+    LIVE_MAX_SUBSCRIBERS = int(os.environ.get("LIVE_MAX_SUBSCRIBERS") or 1000)
+    LIVE_QUEUE_SIZE = int(os.environ.get("LIVE_QUEUE_SIZE") or 100)
+    LIVE_HEARTBEAT = int(os.environ.get("LIVE_HEARTBEAT") or 15)
+
+    # home timelines keep at most this many posts per user, and posts from
+    # users with more followers than the fan-out limit are merged in when the
+    # timeline is read instead of being copied to every follower
+    TIMELINE_MAX_LENGTH = int(os.environ.get("TIMELINE_MAX_LENGTH") or 800)
+    TIMELINE_FANOUT_LIMIT = int(os.environ.get("TIMELINE_FANOUT_LIMIT") or 5000)
+
+    # Bloom filters of the usernames and emails in use, sized for this many
+    # users with this false positive rate and rebuilt from the database every
+    # IDENTITY_FILTER_REFRESH seconds, see app/bloom.py
+    IDENTITY_FILTER_CAPACITY = int(os.environ.get("IDENTITY_FILTER_CAPACITY") or 100000)
+    IDENTITY_FILTER_ERROR_RATE = float(os.environ.get("IDENTITY_FILTER_ERROR_RATE") or 0.01)
+    IDENTITY_FILTER_REFRESH = int(os.environ.get("IDENTITY_FILTER_REFRESH") or 3600)
+
+    # follow suggestions, see app/suggestions.py: this many are stored per user
+    # and SUGGESTIONS_SHOWN of them are shown, they are computed in batches of
+    # SUGGESTIONS_BATCH_SIZE users by SUGGESTIONS_WORKERS processes
+    SUGGESTIONS_PER_USER = int(os.environ.get("SUGGESTIONS_PER_USER") or 20)
+    SUGGESTIONS_SHOWN = int(os.environ.get("SUGGESTIONS_SHOWN") or 5)
+    SUGGESTIONS_BATCH_SIZE = int(os.environ.get("SUGGESTIONS_BATCH_SIZE") or 1000)
+    SUGGESTIONS_WORKERS = int(os.environ.get("SUGGESTIONS_WORKERS") or os.cpu_count() or 1)
+
+    # the explore page serves its first pages from the EXPLORE_BUFFER_SIZE
+    # newest posts kept in memory, reloaded every EXPLORE_REFRESH seconds to
+    # get the posts written by other processes, see app/explore.py
+    EXPLORE_BUFFER_SIZE = int(os.environ.get("EXPLORE_BUFFER_SIZE") or 1000)
+    EXPLORE_REFRESH = int(os.environ.get("EXPLORE_REFRESH") or 10)
+
+    # background jobs, see app/jobs.py. JOB_QUEUES are the queues "flask worker"
+    # runs, each with the number of its jobs that may run at the same time.
+    # Jobs are retried with an exponential backoff starting at
+    # JOB_RETRY_BACKOFF seconds, are considered dead after JOB_TIMEOUT seconds
+    # and are deleted JOB_RETENTION seconds after they are done. JOB_EAGER
+    # (1 or 0) runs them when they are queued, without a worker, by default
+    # only in debug mode and tests, where usually no worker runs
+    JOB_QUEUES = os.environ.get("JOB_QUEUES") or "default:2,timeline:2"
+    JOB_EAGER = os.environ.get("JOB_EAGER")
+    JOB_MAX_ATTEMPTS = int(os.environ.get("JOB_MAX_ATTEMPTS") or 5)
+    JOB_RETRY_BACKOFF = float(os.environ.get("JOB_RETRY_BACKOFF") or 10)
+    JOB_RETRY_MAX_DELAY = float(os.environ.get("JOB_RETRY_MAX_DELAY") or 3600)
+    JOB_TIMEOUT = int(os.environ.get("JOB_TIMEOUT") or 300)
+    JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL") or 1)
+    JOB_RETENTION = int(os.environ.get("JOB_RETENTION") or 7 * 86400)
+
+    # posts older than ARCHIVE_AFTER_DAYS are moved to the archive table by
+    # "flask archive run", ARCHIVE_BATCH_SIZE at a time with a pause of
+    # ARCHIVE_PAUSE seconds between batches, see app/archive.py
+    ARCHIVE_AFTER_DAYS = float(os.environ.get("ARCHIVE_AFTER_DAYS") or 365)
+    ARCHIVE_BATCH_SIZE = int(os.environ.get("ARCHIVE_BATCH_SIZE") or 1000)
+    ARCHIVE_PAUSE = float(os.environ.get("ARCHIVE_PAUSE") or 0.1)
@@ -1,10 +1,12 @@
-from app import app, db
+from app import create_app, db, engine_profile, last_seen, user_cache
 from app.models import User, Post
 
+app = create_app()
+
 @app.shell_context_processor
 def make_shell_context():
     # run "flask shell" in a terminal to get a python interpreter pre loaded
     # with definitions related to the context of your Flask project (the ones
     # defined below
-    return {'db': db, 'User': User, 'Post': Post}
-
+    return {'db': db, 'User': User, 'Post': Post, 'last_seen': last_seen,
+            'user_cache': user_cache, 'engine_profile': engine_profile}
@@ -0,0 +1,60 @@
+"""post full text search
+
+Revision ID: 6d2f0b8c1a57
+Revises: a95d7b2c6e14
+Create Date: 2026-10-18 18:52:10.417203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6d2f0b8c1a57'
+down_revision = 'a95d7b2c6e14'
+branch_labels = None
+depends_on = None
+
+
+# external content FTS5 table: the index refers to the rows of post instead of
+# storing a copy of every body, and the triggers keep it in sync with any
+# insert, update or delete, whether it comes from the ORM or not
+TRIGGERS = [
+    """
+    CREATE TRIGGER post_fts_insert AFTER INSERT ON post BEGIN
+        INSERT INTO post_fts(rowid, body) VALUES (new.id, new.body);
+    END
+    """,
+    """
+    CREATE TRIGGER post_fts_delete AFTER DELETE ON post BEGIN
+        INSERT INTO post_fts(post_fts, rowid, body) VALUES ('delete', old.id, old.body);
+    END
+    """,
+    """
+    CREATE TRIGGER post_fts_update AFTER UPDATE OF body ON post BEGIN
+        INSERT INTO post_fts(post_fts, rowid, body) VALUES ('delete', old.id, old.body);
+        INSERT INTO post_fts(rowid, body) VALUES (new.id, new.body);
+    END
+    """,
+]
+
+
+def upgrade():
+    # only SQLite has FTS5, other databases use the LIKE fallback of app/search.py
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute(
+        "CREATE VIRTUAL TABLE post_fts USING fts5("
+        "body, content='post', content_rowid='id', prefix='2 3')"
+    )
+    for trigger in TRIGGERS:
+        op.execute(trigger)
+    op.execute("INSERT INTO post_fts(post_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for name in ('post_fts_insert', 'post_fts_delete', 'post_fts_update'):
+        op.execute(f'DROP TRIGGER IF EXISTS {name}')
+    op.execute('DROP TABLE IF EXISTS post_fts')
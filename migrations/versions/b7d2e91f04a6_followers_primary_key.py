@@ -0,0 +1,52 @@
+"""followers primary key
+
+Revision ID: b7d2e91f04a6
+Revises: 8a4e0c7f5b13
+Create Date: 2026-10-18 13:05:27.841390
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d2e91f04a6'
+down_revision = '8a4e0c7f5b13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # SQLite can't add a primary key to an existing table, so the table is
+    # copied into a new one, dropping duplicated and incomplete rows
+    op.create_table('_followers_new',
+    sa.Column('follower_id', sa.Integer(), nullable=False),
+    sa.Column('followed_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['followed_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['follower_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('follower_id', 'followed_id')
+    )
+    op.execute(
+        'INSERT INTO _followers_new (follower_id, followed_id) '
+        'SELECT DISTINCT follower_id, followed_id FROM followers '
+        'WHERE follower_id IS NOT NULL AND followed_id IS NOT NULL'
+    )
+    op.drop_table('followers')
+    op.rename_table('_followers_new', 'followers')
+    op.create_index('ix_followers_followed_id', 'followers', ['followed_id', 'follower_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_followers_followed_id', table_name='followers')
+    op.create_table('_followers_old',
+    sa.Column('follower_id', sa.Integer(), nullable=True),
+    sa.Column('followed_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['followed_id'], ['user.id'], ),
+    sa.ForeignKeyConstraint(['follower_id'], ['user.id'], )
+    )
+    op.execute(
+        'INSERT INTO _followers_old (follower_id, followed_id) '
+        'SELECT follower_id, followed_id FROM followers'
+    )
+    op.drop_table('followers')
+    op.rename_table('_followers_old', 'followers')
@@ -0,0 +1,60 @@
+"""post archive full text search
+
+Revision ID: c4a8e2f61b93
+Revises: 7f1c3e8b5d42
+Create Date: 2026-10-19 10:04:37.618290
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4a8e2f61b93'
+down_revision = '7f1c3e8b5d42'
+branch_labels = None
+depends_on = None
+
+
+# the same external content FTS5 table and triggers as post_fts, for the
+# archived posts
+TRIGGERS = [
+    """
+    CREATE TRIGGER post_archive_fts_insert AFTER INSERT ON post_archive BEGIN
+        INSERT INTO post_archive_fts(rowid, body) VALUES (new.id, new.body);
+    END
+    """,
+    """
+    CREATE TRIGGER post_archive_fts_delete AFTER DELETE ON post_archive BEGIN
+        INSERT INTO post_archive_fts(post_archive_fts, rowid, body) VALUES ('delete', old.id, old.body);
+    END
+    """,
+    """
+    CREATE TRIGGER post_archive_fts_update AFTER UPDATE OF body ON post_archive BEGIN
+        INSERT INTO post_archive_fts(post_archive_fts, rowid, body) VALUES ('delete', old.id, old.body);
+        INSERT INTO post_archive_fts(rowid, body) VALUES (new.id, new.body);
+    END
+    """,
+]
+
+
+def upgrade():
+    # only SQLite has FTS5, other databases use the LIKE fallback of app/search.py
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    op.execute(
+        "CREATE VIRTUAL TABLE post_archive_fts USING fts5("
+        "body, content='post_archive', content_rowid='id', prefix='2 3')"
+    )
+    for trigger in TRIGGERS:
+        op.execute(trigger)
+    # the posts archived so far
+    op.execute("INSERT INTO post_archive_fts(post_archive_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    for name in ('post_archive_fts_insert', 'post_archive_fts_delete', 'post_archive_fts_update'):
+        op.execute(f'DROP TRIGGER IF EXISTS {name}')
+    op.execute('DROP TABLE IF EXISTS post_archive_fts')
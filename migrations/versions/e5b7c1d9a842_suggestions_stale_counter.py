@@ -0,0 +1,39 @@
+"""suggestions stale counter
+
+Revision ID: e5b7c1d9a842
+Revises: c4a8e2f61b93
+Create Date: 2026-10-19 16:22:08.413905
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b7c1d9a842'
+down_revision = 'c4a8e2f61b93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # counts the (un)follows since the suggestions were computed instead of
+    # flagging them, so a refresh can tell if the user changed meanwhile.
+    # A stale user (true) starts at 1
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('suggestions_stale',
+               existing_type=sa.Boolean(),
+               type_=sa.Integer(),
+               server_default='0',
+               existing_nullable=False,
+               postgresql_using='suggestions_stale::integer')
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.alter_column('suggestions_stale',
+               existing_type=sa.Integer(),
+               type_=sa.Boolean(),
+               server_default=sa.false(),
+               existing_nullable=False,
+               postgresql_using='suggestions_stale > 0')
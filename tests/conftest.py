@@ -0,0 +1,60 @@
+import os
+
+import pytest
+from flask_migrate import upgrade
+
+from app import create_app, db, explore
+from app.models import User
+from config import Config
+
+MIGRATIONS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations")
+
+
+class TestConfig(Config):
+    TESTING = True
+    WTF_CSRF_ENABLED = False
+    PASSWORD_HASH_WORKERS = 0
+
+
+@pytest.fixture
+def config():
+    # overridden by the tests that need other settings when the app is created
+    return {}
+
+
+def make_config(tmp_path, config):
+    uri = "sqlite:///" + str(tmp_path / "test.db")
+    return type("Config", (TestConfig,), {"SQLALCHEMY_DATABASE_URI": uri, **config})
+
+
+@pytest.fixture
+def app(tmp_path, config):
+    app = create_app(make_config(tmp_path, config))
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+        explore.stop()
+
+
+@pytest.fixture
+def migrated(tmp_path, config):
+    # with the schema of the migrations, e.g. the full text search tables
+    app = create_app(make_config(tmp_path, config))
+    with app.app_context():
+        upgrade(directory=MIGRATIONS)
+        yield app
+        db.session.remove()
+        explore.stop()
+
+
+@pytest.fixture
+def client(app):
+    # logged in as susan
+    user = User(username="susan", email="susan@example.com")
+    user.set_password("cat")
+    db.session.add(user)
+    db.session.commit()
+    client = app.test_client()
+    client.post("/login", data={"username": "susan", "password": "cat"})
+    return client
@@ -0,0 +1,62 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from flask import current_app
+
+from app import db
+from app.models import Post, User
+
+
+@pytest.fixture
+def posts(client):
+    user = User.query.filter_by(username="susan").first()
+    now = datetime.utcnow()
+    for i in range(7):
+        db.session.add(Post(body=f"post {i}", author=user, timestamp=now - timedelta(minutes=i)))
+    db.session.commit()
+    current_app.config["API_STREAM_BATCH_SIZE"] = 3
+    return [f"post {i}" for i in range(7)]
+
+
+def test_anonymous_requests_are_refused(app):
+    response = app.test_client().get("/api/v1/users/susan")
+    assert response.status_code == 401
+    assert response.get_json() == {"error": "Unauthorized"}
+
+
+def test_errors_are_json(client):
+    response = client.get("/api/v1/users/nobody")
+    assert response.status_code == 404 and response.get_json()["error"] == "Not Found"
+    response = client.get("/api/v1/nothing/here")
+    assert response.status_code == 404 and response.get_json()["error"] == "Not Found"
+
+
+def test_user(client, posts):
+    data = client.get("/api/v1/users/susan").get_json()
+    assert data["username"] == "susan"
+    assert data["is_following"] is False
+    assert data["_links"]["posts"] == "/api/v1/users/susan/posts"
+
+
+def test_lists_are_paged_with_cursors(client, posts):
+    bodies, url = [], "/api/v1/users/susan/posts?per_page=3"
+    while url:
+        data = client.get(url).get_json()
+        bodies += [post["body"] for post in data["items"]]
+        url = data["_links"].get("next")
+    assert bodies == posts
+
+
+def test_lists_are_streamed_as_ndjson(client, posts):
+    for kwargs in (
+        {"headers": {"Accept": "application/x-ndjson"}},
+        {"query_string": {"format": "ndjson"}},
+    ):
+        response = client.get("/api/v1/users/susan/posts", **kwargs)
+        assert response.mimetype == "application/x-ndjson"
+        # sent in batches of API_STREAM_BATCH_SIZE lines
+        chunks = [chunk.decode() for chunk in response.iter_encoded()]
+        assert [chunk.count("\n") for chunk in chunks] == [3, 3, 1]
+        lines = "".join(chunks).splitlines()
+        assert [json.loads(line)["body"] for line in lines] == posts
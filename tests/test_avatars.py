@@ -0,0 +1,45 @@
+from sqlalchemy import event
+
+from app import db
+from app.models import User, avatar_url, avatar_urls, email_hash
+
+
+def test_email_hash_follows_the_email(app):
+    user = User(username="susan", email="Susan@Example.com")
+    assert user.email_hash == email_hash("susan@example.com")
+    db.session.add(user)
+    db.session.commit()
+    version = user.version
+    user.email = "susan@example.org"
+    assert user.email_hash == email_hash("susan@example.org")
+    assert user.version == version + 1
+    assert user.avatar(36) == avatar_url(user.email_hash, 36)
+
+
+def test_avatar_urls_of_a_page(client):
+    john = User(username="john", email="john@example.com")
+    db.session.add(john)
+    db.session.commit()
+    susan = User.query.filter_by(username="susan").first()
+    susan.follow(john)
+    for i in range(5):
+        susan.add_post(f"susan {i}")
+        john.add_post(f"john {i}")
+    db.session.commit()
+    posts = susan.followed_posts().all()
+    assert avatar_urls(posts, 36) == {susan.id: susan.avatar(36), john.id: john.avatar(36)}
+
+    # the authors of the home page are loaded by a single query
+    statements = []
+
+    def record(conn, cursor, statement, *args):
+        statements.append(statement)
+
+    event.listen(db.engine, "before_cursor_execute", record)
+    try:
+        response = client.get("/index")
+    finally:
+        event.remove(db.engine, "before_cursor_execute", record)
+    assert john.email_hash.encode() in response.data
+    authors = [s for s in statements if "user.email_hash AS" in s and "WHERE user.id IN (?" in s]
+    assert len(authors) == 1
@@ -0,0 +1,52 @@
+import threading
+
+from app import db, identities
+from app.bloom import BloomFilter
+from app.models import User
+
+
+def test_bloom_filter_has_no_false_negatives():
+    bloom = BloomFilter(1000, 0.01)
+    for i in range(1000):
+        bloom.add(f"user{i}")
+    assert all(f"user{i}" in bloom for i in range(1000))
+    false_positives = sum(f"other{i}" in bloom for i in range(10000))
+    assert false_positives < 300
+
+
+def add_user(username):
+    db.session.add(User(username=username, email=f"{username}@example.com"))
+    db.session.commit()
+
+
+def test_checks_query_until_the_filters_are_built(app, monkeypatch):
+    add_user("susan")
+    release = threading.Event()
+    build = identities.build
+
+    def slow_build():
+        release.wait(5)
+        build()
+
+    monkeypatch.setattr(identities, "build", slow_build)
+    # the build runs in the background, meanwhile every value may exist
+    assert identities.might_exist("john", "john@example.com") == {"username", "email"}
+    # a user registered during the build is kept by it
+    add_user("mary")
+    identities.add("mary", "mary@example.com")
+    release.set()
+    identities._builder.join(5)
+    assert identities.might_exist("john", "john@example.com") == set()
+    assert identities.might_exist("susan", "mary@example.com") == {"username", "email"}
+
+
+def test_registration_rejects_a_taken_username(app):
+    add_user("susan")
+    identities.build()
+    client = app.test_client()
+    data = {"username": "susan", "email": "new@example.com", "password": "a", "password2": "a"}
+    response = client.post("/register", data=data)
+    assert b"This username is already taken" in response.data
+    data["username"] = "john"
+    assert client.post("/register", data=data).status_code == 302
+    assert identities.might_exist("john") == {"username"}
@@ -0,0 +1,45 @@
+from datetime import datetime, timedelta
+
+from app import db
+from app.models import User
+
+
+def add_follower(username):
+    susan = User.query.filter_by(username="susan").first()
+    other = User(username=username, email=f"{username}@example.com")
+    db.session.add(other)
+    db.session.commit()
+    other.follow(susan)
+    db.session.commit()
+
+
+def test_unchanged_page_is_not_modified(client):
+    response = client.get("/user/susan")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    response = client.get("/user/susan", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+
+
+def test_new_follower_changes_the_etag(client):
+    add_follower("john")
+    etag = client.get("/user/susan").headers["ETag"]
+    add_follower("mary")
+    response = client.get("/user/susan", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert b"2 followers" in response.data
+
+
+def test_if_modified_since_is_ignored(client):
+    # the date of the newest post doesn't cover the counters of the page
+    client.post("/index", data={"post": "hello"})
+    response = client.get("/user/susan")
+    assert "Last-Modified" not in response.headers
+    add_follower("john")
+    since = datetime.utcnow() + timedelta(days=1)
+    response = client.get(
+        "/user/susan", headers={"If-Modified-Since": since.strftime("%a, %d %b %Y %H:%M:%S GMT")}
+    )
+    assert response.status_code == 200
+    assert b"1 followers" in response.data
@@ -0,0 +1,51 @@
+from app import db
+from app.models import Post, User
+
+
+def add_users(*names):
+    users = [User(username=name, email=f"{name}@example.com") for name in names]
+    db.session.add_all(users)
+    db.session.commit()
+    return users
+
+
+def counters(user):
+    db.session.refresh(user)
+    return user.followers_count, user.following_count, user.posts_count
+
+
+def test_counters_follow_the_writes(app):
+    susan, john, mary = add_users("susan", "john", "mary")
+    susan.follow_many([john, mary])
+    john.follow(mary)
+    susan.add_post("hello")
+    db.session.commit()
+    assert counters(susan) == (0, 2, 1)
+    assert counters(mary) == (2, 0, 0)
+    susan.unfollow(mary)
+    db.session.commit()
+    assert counters(susan) == (0, 1, 1)
+    assert counters(mary) == (1, 0, 0)
+
+
+def test_reconcile_fixes_the_counters_that_drifted(app):
+    susan, john = add_users("susan", "john")
+    susan.follow(john)
+    # a post written without add_post()
+    db.session.add(Post(body="hello", author=john))
+    User.query.filter_by(id=susan.id).update({User.following_count: 5})
+    db.session.commit()
+    result = app.test_cli_runner().invoke(args=["counters", "reconcile"])
+    assert "following_count: fixed 1 users" in result.output
+    assert "posts_count: fixed 1 users" in result.output
+    assert counters(susan) == (0, 1, 0)
+    assert counters(john) == (1, 0, 1)
+
+
+def test_profile_shows_the_counters(client):
+    susan = User.query.filter_by(username="susan").first()
+    (john,) = add_users("john")
+    john.follow(susan)
+    db.session.commit()
+    response = client.get("/user/susan")
+    assert b"1 followers" in response.data and b"0 following" in response.data
@@ -0,0 +1,42 @@
+import pytest
+from sqlalchemy.pool import QueuePool
+
+from app import db
+from app.engine import engine_options
+
+
+def pragma(name):
+    return db.session.execute(db.text(f"PRAGMA {name}")).scalar()
+
+
+def test_sqlite_connections_are_tuned_and_pooled(app):
+    assert pragma("journal_mode") == "wal"
+    assert pragma("synchronous") == 1  # NORMAL
+    assert pragma("busy_timeout") == 5000
+    assert pragma("cache_size") == -64000
+    assert pragma("temp_store") == 2  # MEMORY
+    assert isinstance(db.engine.pool, QueuePool)
+
+
+def test_connections_are_returned_to_the_pool(app):
+    engine_profile = app.extensions["engine_profile"]
+    for i in range(5):
+        # like the end of a request
+        pragma("user_version")
+        db.session.remove()
+    stats = engine_profile.stats()
+    assert stats["connects"] == 1
+    assert stats["checkouts"] >= 5 and stats["checked_out"] == 0
+
+
+@pytest.mark.parametrize("config", [{"SQLITE_TUNING": False}])
+def test_tuning_can_be_turned_off(app):
+    assert pragma("journal_mode") == "delete"
+    assert not isinstance(db.engine.pool, QueuePool)
+
+
+def test_in_memory_databases_keep_their_single_connection(app):
+    config = dict(app.config, SQLALCHEMY_DATABASE_URI="sqlite://")
+    assert engine_options(config) == {}
+    config["SQLALCHEMY_DATABASE_URI"] = "postgresql://localhost/microblog"
+    assert engine_options(config)["pool_pre_ping"]
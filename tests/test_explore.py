@@ -0,0 +1,71 @@
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db, explore
+from app.models import Post, User
+from app.pagination import keyset_paginate
+
+
+@pytest.fixture
+def feed(app):
+    # 30 posts, the newest 10 in the buffer
+    app.config["EXPLORE_BUFFER_SIZE"] = 10
+    user = User(username="susan", email="susan@example.com")
+    db.session.add(user)
+    now = datetime.utcnow()
+    for i in range(30):
+        db.session.add(Post(body=f"post {i}", author=user, timestamp=now - timedelta(minutes=i)))
+    db.session.commit()
+    return explore._get_current_object()
+
+
+def walk(feed, per_page=4):
+    ids, cursor = [], None
+    while True:
+        page = feed.page(cursor, per_page)
+        ids += [post.id for post in page.items]
+        if not page.next_cursor:
+            return ids
+        cursor = page.next_cursor
+
+
+def test_pages_continue_past_the_buffer(feed):
+    expected = [
+        post.id for post in keyset_paginate(Post.query, [Post.timestamp, Post.id], None, 30).items
+    ]
+    assert walk(feed) == expected
+    # the two first pages come from the buffer, the others from the database
+    assert feed.stats["hits"] == 2 and feed.stats["misses"] == 6
+
+
+def test_new_posts_are_added_once_committed(feed):
+    walk(feed)
+    user = User.query.first()
+    post = user.add_post("hello")
+    assert feed.page(None, 1).items[0].id != post.id
+    db.session.commit()
+    assert feed.page(None, 1).items[0].id == post.id
+
+
+def test_concurrent_pages_are_all_counted(feed):
+    feed.page()
+
+    def read():
+        for _ in range(200):
+            feed.page(None, 2)
+
+    threads = [threading.Thread(target=read) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert feed.stats["hits"] + feed.stats["misses"] == 801
+
+
+def test_stop_ends_the_refresher(feed):
+    feed.page()
+    assert feed._refresher.is_alive()
+    feed.stop()
+    assert not feed._refresher.is_alive()
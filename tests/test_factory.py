@@ -0,0 +1,50 @@
+import os
+import subprocess
+import sys
+
+from flask import current_app
+
+from app import create_app, db, user_cache
+from app.models import User
+from tests.conftest import make_config
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_apps_keep_their_own_state(app, tmp_path):
+    db.session.add(User(username="susan", email="susan@example.com"))
+    db.session.commit()
+    # sessions are per thread, not per app
+    db.session.remove()
+    (tmp_path / "other").mkdir()
+    other = create_app(make_config(tmp_path / "other", {"USERS_PER_PAGE": 1}))
+    with other.app_context():
+        db.create_all()
+        assert current_app.config["USERS_PER_PAGE"] == 1
+        assert User.query.count() == 0
+        assert user_cache._get_current_object() is other.extensions["user_cache"]
+        db.session.remove()
+    assert User.query.count() == 1
+    assert user_cache._get_current_object() is app.extensions["user_cache"]
+
+
+def test_db_commands_load_the_migrations(app):
+    result = app.test_cli_runner().invoke(args=["db", "--help"])
+    assert result.exit_code == 0
+    assert "upgrade" in result.output
+
+
+def test_startup_skips_the_migrations_and_the_log_pipeline(tmp_path):
+    # in a new process, the test run has loaded everything already
+    code = (
+        "import sys\n"
+        "from microblog import app\n"
+        "app.cli.main(['--help'], standalone_mode=False)\n"
+        "print([m for m in ('alembic', 'flask_migrate') if m in sys.modules])\n"
+    )
+    env = dict(os.environ, PYTHONPATH=ROOT, FLASK_APP="microblog.py")
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, cwd=tmp_path, env=env, check=True
+    )
+    assert result.stdout.splitlines()[-1] == "[]"
+    assert not (tmp_path / "logs").exists()
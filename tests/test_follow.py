@@ -0,0 +1,59 @@
+from app import db
+from app.models import User, followers
+
+
+def add_user(username):
+    user = User(username=username, email=f"{username}@example.com")
+    db.session.add(user)
+    db.session.commit()
+    return user
+
+
+def counters(user):
+    db.session.refresh(user)
+    return user.followers_count, user.following_count
+
+
+def test_follow_followed_by_another_process(client):
+    # the follow cache of this process says susan doesn't follow john, who
+    # she followed through another one meanwhile
+    susan = User.query.filter_by(username="susan").first()
+    john = add_user("john")
+    assert susan.followed_ids() == frozenset()
+    db.session.execute(followers.insert().values(follower_id=susan.id, followed_id=john.id))
+    User.query.filter_by(id=john.id).update({User.followers_count: 1})
+    db.session.commit()
+
+    response = client.post("/follow/john")
+    assert response.status_code == 302
+    assert counters(john) == (1, 0)
+    assert not susan.follow(john)
+
+
+def test_follow_unfollowed_by_another_process(client):
+    susan = User.query.filter_by(username="susan").first()
+    john = add_user("john")
+    assert susan.follow(john)
+    db.session.commit()
+    assert susan.followed_ids() == {john.id}
+    # unfollowed by another process
+    db.session.execute(followers.delete())
+    User.query.update({User.followers_count: 0, User.following_count: 0})
+    db.session.commit()
+
+    assert not susan.unfollow(john)
+    client.post("/follow/john")
+    assert counters(john) == (1, 0)
+    assert db.session.query(followers).count() == 1
+
+
+def test_follow_many_counts_each_new_follow_once(app):
+    susan, john, mary = add_user("susan"), add_user("john"), add_user("mary")
+    assert susan.follow_many([john]) == [john]
+    assert susan.follow_many([john, mary, susan]) == [mary]
+    db.session.commit()
+    assert counters(susan) == (0, 2)
+    assert susan.unfollow_many([john, mary, john]) == [john, mary]
+    db.session.commit()
+    assert counters(susan) == (0, 0)
+    assert counters(john) == (0, 0)
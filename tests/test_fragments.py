@@ -0,0 +1,37 @@
+from app import db, fragments
+from app.cache import NullCache
+from app.models import User
+
+
+def counts():
+    return fragments.hits, fragments.misses
+
+
+def test_post_fragments_are_cached_by_author_version(client):
+    susan = User.query.filter_by(username="susan").first()
+    for i in range(3):
+        susan.add_post(f"post {i}")
+    db.session.commit()
+    response = client.get("/user/susan")
+    assert "X-Fragment-Cache" in response.headers
+    assert counts() == (0, 3)
+    response = client.get("/user/susan")
+    assert counts() == (3, 3)
+    assert all(f"post {i}".encode() in response.data for i in range(3))
+    assert fragments.hit_ratio == 0.5
+
+    # a new username is a new version of the profile, rendered again
+    client.post("/edit_profile", data={"username": "susanna", "about_me": ""})
+    response = client.get("/user/susanna")
+    assert counts() == (3, 6)
+    assert b"susanna" in response.data
+
+
+def test_null_backend_renders_every_time(client):
+    fragments.backend = NullCache()
+    susan = User.query.filter_by(username="susan").first()
+    susan.add_post("hello")
+    db.session.commit()
+    client.get("/user/susan")
+    client.get("/user/susan")
+    assert counts() == (0, 2)
@@ -0,0 +1,145 @@
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db, jobs
+from app.models import Job, User
+
+calls = []
+
+
+@jobs.task("test")
+def record(value):
+    calls.append(value)
+
+
+@jobs.task("test", max_attempts=2)
+def fail(value):
+    raise ValueError(value)
+
+
+@jobs.task("test")
+def add_user(username):
+    db.session.add(User(username=username, email=f"{username}@example.com"))
+
+
+running = {"now": 0, "peak": 0}
+running_lock = threading.Lock()
+
+
+@jobs.task("test")
+def slow(value):
+    with running_lock:
+        running["now"] += 1
+        running["peak"] = max(running["peak"], running["now"])
+    time.sleep(0.05)
+    with running_lock:
+        running["now"] -= 1
+
+
+@pytest.fixture
+def queued(app):
+    # jobs wait for a worker, like in production
+    app.config["JOB_EAGER"] = False
+    calls.clear()
+    running.update(now=0, peak=0)
+    return app
+
+
+def enqueue(function, *args, **kwargs):
+    job = jobs.enqueue(function, *args, **kwargs)
+    db.session.commit()
+    return job.id
+
+
+def test_eager_by_default_in_tests(app):
+    calls.clear()
+    assert jobs.enqueue(record, 1) is None
+    assert calls == [1]
+
+
+def test_eager_key_runs_once_per_transaction(app):
+    calls.clear()
+    jobs.enqueue(record, 1, key="once")
+    jobs.enqueue(record, 2, key="once")
+    assert calls == [1]
+    db.session.commit()
+    jobs.enqueue(record, 3, key="once")
+    assert calls == [1, 3]
+
+
+def test_perform_runs_and_finishes_the_job(queued):
+    id = enqueue(record, 7)
+    job = jobs.claim("test", 1)
+    assert job.id == id and job.state == jobs.RUNNING and job.attempts == 1
+    assert jobs.perform(job)
+    assert calls == [7]
+    job = db.session.get(Job, id)
+    assert job.state == jobs.DONE and job.lock is None and job.finished_at is not None
+
+
+def test_key_queues_a_job_once(queued):
+    assert enqueue(record, 1, key="once") == enqueue(record, 2, key="once")
+    assert Job.query.count() == 1
+
+
+def test_failed_job_is_retried_then_fails(queued):
+    id = enqueue(fail, "boom")
+    assert not jobs.perform(jobs.claim("test", 1))
+    job = db.session.get(Job, id)
+    assert job.state == jobs.QUEUED and job.attempts == 1 and "boom" in job.error
+    # not claimed again before its backoff is over
+    assert job.run_at > datetime.utcnow()
+    assert jobs.claim("test", 1) is None
+
+    job.run_at = datetime.utcnow()
+    db.session.commit()
+    assert not jobs.perform(jobs.claim("test", 1))
+    job = db.session.get(Job, id)
+    assert job.state == jobs.FAILED and job.attempts == 2
+
+
+def test_claim_respects_the_limit(queued):
+    ids = [enqueue(record, i) for i in range(3)]
+    first, second = jobs.claim("test", 2), jobs.claim("test", 2)
+    assert {first.id, second.id} == set(ids[:2])
+    assert jobs.claim("test", 2) is None
+    assert jobs.perform(first)
+    assert jobs.claim("test", 2).id == ids[2]
+
+
+def test_expired_claim_is_taken_over(queued):
+    id = enqueue(add_user, "john")
+    stale = jobs.claim("test", 1)
+    # as seen by the worker whose claim expires
+    db.session.expunge(stale)
+    db.session.query(Job).filter_by(id=id).update({Job.locked_until: datetime.utcnow() - timedelta(1)})
+    db.session.commit()
+
+    job = jobs.claim("test", 1)
+    assert job.id == id and job.attempts == 2 and job.lock != stale.lock
+    lock = job.lock
+    # the worker that lost its claim can't mark the job done nor commit its
+    # work, which is left to the new claim
+    assert not jobs.perform(stale)
+    assert User.query.filter_by(username="john").count() == 0
+    job = db.session.get(Job, id)
+    assert job.state == jobs.RUNNING and job.lock == lock
+    assert jobs.perform(job)
+    assert User.query.filter_by(username="john").count() == 1
+
+
+def test_workers_never_exceed_the_limit(queued):
+    # two worker processes, as far as the queue can tell, with two threads each
+    ids = [enqueue(slow, i) for i in range(8)]
+    workers = [jobs.Worker(queued, {"test": 2}, burst=True) for _ in range(2)]
+    threads = [threading.Thread(target=worker.run) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sum(worker.stats["done"] for worker in workers) == 8
+    assert running["peak"] <= 2
+    assert {job.state for job in Job.query.filter(Job.id.in_(ids))} == {jobs.DONE}
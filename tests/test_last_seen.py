@@ -0,0 +1,59 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db, last_seen
+from app.models import User
+
+
+@pytest.fixture
+def users(app):
+    users = [User(username=name, email=f"{name}@example.com") for name in ("susan", "john")]
+    db.session.add_all(users)
+    db.session.commit()
+    return [user.id for user in users]
+
+
+def seen(user_id):
+    # flush() ends the session of the app context, reload the user
+    return db.session.get(User, user_id).last_seen
+
+
+def test_touches_are_written_in_one_batch(users):
+    susan, john = users
+    now = datetime.utcnow()
+    last_seen.touch(susan, now)
+    last_seen.touch(john, now)
+    # within LAST_SEEN_GRANULARITY of the previous one
+    last_seen.touch(susan, now + timedelta(seconds=1))
+    assert seen(susan) != now
+    assert last_seen.flush() == 2
+    assert seen(susan) == now and seen(john) == now
+    assert last_seen.stats == {"touches": 3, "coalesced": 1, "written": 2, "flushes": 1}
+    assert last_seen.flush() == 0
+
+
+def test_requests_touch_without_committing(client):
+    susan = User.query.filter_by(username="susan").first().id
+    before = seen(susan)
+    client.get("/index")
+    assert seen(susan) == before
+    last_seen.flush()
+    assert seen(susan) > before
+
+
+def test_failed_flush_is_retried(users, monkeypatch):
+    susan = users[0]
+    now = datetime.utcnow()
+    last_seen.touch(susan, now)
+    engine = db.get_engine()
+
+    def broken():
+        raise RuntimeError("database is gone")
+
+    monkeypatch.setattr(engine, "begin", broken)
+    with pytest.raises(RuntimeError):
+        last_seen.flush()
+    monkeypatch.undo()
+    assert last_seen.flush() == 1
+    assert seen(susan) == now
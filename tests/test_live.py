@@ -0,0 +1,23 @@
+from app import hub
+
+
+def test_head_doesnt_subscribe(client):
+    assert client.head("/stream").status_code == 405
+    assert hub.stats["subscribers"] == 0
+
+
+def test_unread_stream_unsubscribes_on_close(app):
+    subscriber = hub.subscribe(1, [2])
+    body = hub.stream(subscriber)
+    assert hub.stats["subscribers"] == 1
+    # the client went away before the first chunk
+    body.close()
+    assert hub.stats["subscribers"] == 0
+    assert subscriber.closed
+
+
+def test_read_stream_unsubscribes_on_close(client):
+    response = client.get("/stream", buffered=False)
+    assert next(response.response).startswith(b"retry:")
+    response.close()
+    assert hub.stats["subscribers"] == 0
@@ -0,0 +1,73 @@
+import logging
+import queue
+import time
+from logging.handlers import SMTPHandler
+
+import pytest
+
+from app.logging_pipeline import DigestSMTPHandler, DroppingQueueHandler, LogPipeline
+
+
+def error(message, lineno=1):
+    return logging.makeLogRecord(
+        {
+            "msg": message,
+            "levelno": logging.ERROR,
+            "levelname": "ERROR",
+            "pathname": "app.py",
+            "lineno": lineno,
+        }
+    )
+
+
+def test_full_queue_drops_records():
+    handler = DroppingQueueHandler(queue.Queue(2))
+    for i in range(5):
+        handler.handle(error(f"error {i}"))
+    assert handler.queue.qsize() == 2
+    assert handler.dropped == 3
+
+
+def test_errors_are_sent_in_one_digest(monkeypatch):
+    sent = []
+    monkeypatch.setattr(SMTPHandler, "emit", lambda self, record: sent.append(record.getMessage()))
+    handler = DigestSMTPHandler(
+        mailhost="localhost",
+        fromaddr="no-reply@localhost",
+        toaddrs=["admin"],
+        subject="x",
+        interval=3600,
+    )
+    # as if a digest was just sent, so the timer waits for the interval
+    handler.last_sent = time.monotonic()
+    for i in range(3):
+        handler.emit(error("boom"))
+    handler.emit(error("other", lineno=2))
+    handler.flush()
+    assert len(sent) == 1
+    assert sent[0].startswith("2 distinct errors, 4 occurrences")
+    assert "--- 3x ERROR in app.py:1" in sent[0] and "--- 1x ERROR in app.py:2" in sent[0]
+    handler.flush()
+    assert len(sent) == 1
+
+
+@pytest.fixture
+def pipeline(app, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    pipeline = LogPipeline(app)
+    yield pipeline
+    pipeline.stop()
+    if pipeline.queue_handler is not None:
+        app.logger.removeHandler(pipeline.queue_handler)
+
+
+def test_pipeline_starts_with_the_first_request(app, pipeline, tmp_path):
+    assert pipeline.listener is None
+    app.test_client().get("/login")
+    app.test_client().get("/login")
+    assert pipeline.listener is not None
+    app.logger.warning("written by the listener")
+    pipeline.stop()
+    log = (tmp_path / "logs" / "microblog.log").read_text()
+    assert log.count("Microblog startup") == 1
+    assert "written by the listener" in log
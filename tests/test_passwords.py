@@ -0,0 +1,72 @@
+import pytest
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, generate_password_hash
+
+from app import db
+from app.models import User
+from app.passwords import HasherBusy, PasswordHasher, hash_parameters
+
+
+def hasher(app, method, salt_length=16, **config):
+    app.config.update(PASSWORD_HASH_METHOD=method, PASSWORD_SALT_LENGTH=salt_length, **config)
+    return PasswordHasher(app)
+
+
+def test_defaults_of_the_method_are_filled_in():
+    expected = (("pbkdf2", "sha256", DEFAULT_PBKDF2_ITERATIONS), 16)
+    assert hash_parameters("pbkdf2:sha256", 16) == expected
+    assert hash_parameters(f"pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}", 16) == expected
+    assert hash_parameters("pbkdf2:sha256:1000", 16) == (("pbkdf2", "sha256", 1000), 16)
+
+
+@pytest.mark.parametrize(
+    "method, salt_length, rehash",
+    [
+        ("pbkdf2:sha256", 16, False),
+        ("pbkdf2:sha256:1000", 16, True),
+        ("pbkdf2:sha512", 16, True),
+        ("pbkdf2:sha256", 8, True),
+    ],
+)
+def test_needs_rehash(app, method, salt_length, rehash):
+    # as stored by werkzeug: "pbkdf2:sha256:<default iterations>$<salt>$<hash>"
+    pwhash = generate_password_hash("cat", "pbkdf2:sha256", 16)
+    assert hasher(app, method, salt_length).needs_rehash(pwhash) == rehash
+
+
+def test_login_rehashes_only_hashes_with_other_parameters(app):
+    passwords = hasher(app, "pbkdf2:sha256")
+    user = User(username="susan", email="susan@example.com")
+    user.set_password("cat")
+    db.session.add(user)
+    db.session.commit()
+    pwhash = user.password_hash
+    client = app.test_client()
+    client.post("/login", data={"username": "susan", "password": "cat"})
+    db.session.refresh(user)
+    assert user.password_hash == pwhash
+
+    client.get("/logout")
+    passwords.method = "pbkdf2:sha256:1000"
+    client.post("/login", data={"username": "susan", "password": "cat"})
+    db.session.refresh(user)
+    assert user.password_hash.startswith("pbkdf2:sha256:1000$")
+
+
+def test_hashes_in_the_pool(app):
+    passwords = hasher(
+        app, "pbkdf2:sha256:1000", PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_START_METHOD="fork"
+    )
+    try:
+        pwhash = passwords.hash("cat")
+        assert passwords.verify(pwhash, "cat") and not passwords.verify(pwhash, "dog")
+    finally:
+        passwords.shutdown()
+
+
+def test_full_queue_is_rejected(app):
+    passwords = hasher(app, "pbkdf2:sha256:1000", PASSWORD_HASH_WORKERS=1, PASSWORD_HASH_QUEUE=0)
+    # the only slot is taken
+    assert passwords._slots.acquire(blocking=False)
+    with pytest.raises(HasherBusy):
+        passwords.hash("cat")
+    assert passwords.rejected == 1
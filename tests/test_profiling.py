@@ -0,0 +1,45 @@
+import json
+import logging
+
+import pytest
+
+from app import profiling, sql_profiler
+
+
+@pytest.fixture
+def config(tmp_path):
+    return {
+        "SQL_PROFILING": True,
+        "SQL_PROFILING_LOG": True,
+        "SQL_PROFILING_DIR": str(tmp_path / "profiles"),
+        "SQL_PROFILING_DUMP_EVERY": 2,
+    }
+
+
+def test_requests_are_profiled(client, app, caplog):
+    with caplog.at_level(logging.INFO, logger=app.logger.name):
+        response = client.get("/user/susan")
+    dur, desc = response.headers["Server-Timing"].split(";")[1:]
+    assert dur.startswith("dur=") and desc.endswith(' queries"')
+    line = json.loads([r.getMessage() for r in caplog.records if "sql_profile" in r.getMessage()][-1])
+    assert line["endpoint"] == "main.user" and line["status"] == 200
+    assert line["queries"] == int(desc.split('"')[1].split()[0]) > 0
+    assert line["slowest"]
+
+
+def test_stats_are_dumped_and_reported(client, app):
+    # the login of the client fixture was the first request
+    client.get("/index")
+    stats = profiling.load_stats(app.config["SQL_PROFILING_DIR"])
+    assert stats["auth.login"]["requests"] == 1 and stats["main.index"]["requests"] == 1
+    assert sum(stats["main.index"]["count_histogram"]) == 1
+    client.get("/index")
+    sql_profiler.dump()
+    result = app.test_cli_runner().invoke(args=["profile", "report", "--sort", "requests"])
+    assert result.exit_code == 0, result.output
+    assert result.output.splitlines()[1].split()[:2] == ["main.index", "2"]
+
+
+def test_report_without_profiles(app):
+    result = app.test_cli_runner().invoke(args=["profile", "report"])
+    assert result.exit_code != 0 and "No profile recorded yet" in result.output
@@ -0,0 +1,62 @@
+import pytest
+
+from app import db
+from app.models import Post, User
+from app.replicas import STICKY_KEY
+
+
+@pytest.fixture
+def config(tmp_path):
+    return {"SQLALCHEMY_REPLICAS": ["sqlite:///" + str(tmp_path / "replica.db")]}
+
+
+@pytest.fixture
+def replicated(app):
+    # susan on the primary, copied to a replica that won't see later writes
+    user = User(username="susan", email="susan@example.com")
+    user.set_password("cat")
+    db.session.add(user)
+    db.session.commit()
+    primary = db.engine.raw_connection()
+    replica = db.get_engine(app, bind="replica0").raw_connection()
+    primary.backup(replica.connection)
+    primary.close()
+    replica.close()
+    db.session.add(User(username="john", email="john@example.com"))
+    db.session.commit()
+    return app
+
+
+def usernames():
+    return sorted(user.username for user in User.query)
+
+
+def test_read_only_views_read_from_the_replica(replicated):
+    with replicated.test_request_context("/user/susan"):
+        assert usernames() == ["susan"]
+    with replicated.test_request_context("/user/susan", method="POST"):
+        assert usernames() == ["john", "susan"]
+    with replicated.test_request_context("/edit_profile"):
+        assert usernames() == ["john", "susan"]
+
+
+def test_session_reads_its_own_writes(replicated):
+    with replicated.test_request_context("/user/susan"):
+        db.session.add(User(username="david", email="david@example.com"))
+        db.session.flush()
+        assert usernames() == ["david", "john", "susan"]
+        db.session.rollback()
+        assert usernames() == ["susan"]
+
+
+def test_user_reads_the_primary_after_a_write(replicated):
+    client = replicated.test_client()
+    client.post("/login", data={"username": "susan", "password": "cat"})
+    client.post("/index", data={"post": "fresh from the primary"})
+    response = client.get("/user/susan")
+    assert b"fresh from the primary" in response.data
+    with client.session_transaction() as session:
+        assert STICKY_KEY in session
+        del session[STICKY_KEY]
+    response = client.get("/user/susan")
+    assert b"fresh from the primary" not in response.data
@@ -0,0 +1,102 @@
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app import archive, db, search
+from app.models import Post, User
+
+
+def add_posts():
+    user = User(username="susan", email="susan@example.com")
+    db.session.add(user)
+    now = datetime.utcnow()
+    for i in range(40):
+        body = f"apple {i}" if i % 2 else f"pear {i}"
+        db.session.add(Post(body=body, author=user, timestamp=now - timedelta(days=i)))
+    db.session.commit()
+    current_app.config["ARCHIVE_PAUSE"] = 0
+    # half of the apples are archived
+    archive.archive(timedelta(days=20))
+
+
+def search_all(text, per_page=3):
+    # the bodies of every page from the first, and of every page back from
+    # the last one
+    bodies, cursor = [], None
+    while True:
+        page = search.search(text, cursor, per_page)
+        bodies += [post.body for post in page.items]
+        if not page.next_cursor:
+            break
+        cursor = page.next_cursor
+    back, cursor = [post.body for post in page.items], page.prev_cursor
+    while cursor:
+        page = search.search(text, cursor, per_page)
+        back = [post.body for post in page.items] + back
+        cursor = page.prev_cursor
+    return bodies, back
+
+
+def test_like_search_finds_archived_posts(app):
+    add_posts()
+    assert not search.fts_available()
+    bodies, back = search_all("apple")
+    assert bodies == [f"apple {i}" for i in range(1, 40, 2)]
+    assert back == bodies
+
+
+def test_fts_search_finds_archived_posts(migrated):
+    add_posts()
+    assert search.fts_available() and search.fts_available("post_archive_fts")
+    bodies, back = search_all("apple")
+    assert sorted(bodies) == sorted(f"apple {i}" for i in range(1, 40, 2))
+    assert back == bodies
+    # prefix matches, all of them archived
+    assert sorted(search_all("pear 3")[0]) == [f"pear {i}" for i in range(30, 40, 2)]
+
+
+def test_fts_ranks_the_best_matches_first(migrated):
+    user = User(username="susan", email="susan@example.com")
+    db.session.add_all(
+        [
+            Post(body="a fox in a long post about many other things", author=user),
+            Post(body="fox fox fox", author=user),
+            Post(body="no match here", author=user),
+        ]
+    )
+    db.session.commit()
+    assert [post.body for post in search.search("fox").items] == [
+        "fox fox fox",
+        "a fox in a long post about many other things",
+    ]
+
+
+def test_fts_index_follows_edits_and_deletes(migrated):
+    user = User(username="susan", email="susan@example.com")
+    post = Post(body="old words", author=user)
+    db.session.add(post)
+    db.session.commit()
+    post.body = "new words"
+    db.session.commit()
+    assert search.search("old").items == []
+    assert search.search("new").items == [post]
+    db.session.delete(post)
+    db.session.commit()
+    assert search.search("words").items == []
+    assert search.reindex()
+
+
+def test_search_page_escapes_the_query_syntax(migrated):
+    user = User(username="susan", email="susan@example.com")
+    user.set_password("cat")
+    db.session.add(Post(body='she said "hello" NEAR the door', author=user))
+    db.session.commit()
+    client = migrated.test_client()
+    client.post("/login", data={"username": "susan", "password": "cat"})
+    for q in ['"hello', "hello NEAR", "door)*", "hel"]:
+        response = client.get("/search", query_string={"q": q})
+        assert response.status_code == 200
+        assert b"the door" in response.data, q
+    response = client.get("/search", query_string={"q": "window"})
+    assert b"No posts found" in response.data
+    assert client.get("/search").status_code == 302
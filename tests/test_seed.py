@@ -0,0 +1,39 @@
+import random
+
+from sqlalchemy import func
+
+from app import db
+from app.models import Post, Timeline, User, followers, reconcile_counters
+from app.seed import PASSWORD, seed
+
+
+def test_seed_is_reproducible_and_consistent(app):
+    counts = seed(users=50, posts=300, follows=5, rng=random.Random(1))
+    assert counts["users"] == User.query.count() == 50
+    assert counts["posts"] == Post.query.count() == 300
+    assert counts["followers"] == db.session.query(followers).count() > 0
+    # no self follows, the counters match the rows and the inboxes are built
+    assert (
+        db.session.query(followers).filter(followers.c.follower_id == followers.c.followed_id).count()
+        == 0
+    )
+    assert reconcile_counters() == {"followers_count": 0, "following_count": 0, "posts_count": 0}
+    assert Timeline.query.count() > 0
+    assert User.query.first().check_password(PASSWORD)
+    # popularity is heavy tailed
+    top = db.session.query(func.max(User.followers_count)).scalar()
+    assert top > 3 * counts["followers"] / counts["users"]
+
+    bodies = [post.body for post in Post.query.order_by(Post.id)]
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+    seed(users=50, posts=300, follows=5, rng=random.Random(1))
+    assert [post.body for post in Post.query.order_by(Post.id)] == bodies
+
+
+def test_seed_command(app):
+    result = app.test_cli_runner().invoke(args=["seed", "--users", "10", "--posts", "20"])
+    assert result.exit_code == 0, result.output
+    assert "Created 10 users" in result.output
+    assert Post.query.count() == 20
@@ -0,0 +1,92 @@
+import pytest
+
+from app import db, suggestions
+from app.models import Suggestion, User
+
+
+@pytest.mark.parametrize("path", ["/index", "/user/susan"])
+def test_refreshed_suggestions_change_the_etag(client, path):
+    susan = User.query.filter_by(username="susan").first()
+    other = User(username="john", email="john@example.com")
+    db.session.add(other)
+    db.session.commit()
+    etag = client.get(path).headers["ETag"]
+    assert client.get(path, headers={"If-None-Match": etag}).status_code == 304
+
+    db.session.add(Suggestion(user_id=susan.id, rank=1, suggested_id=other.id, mutuals=3))
+    db.session.commit()
+    response = client.get(path, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert b"john" in response.data
+
+
+@pytest.fixture
+def graph(app):
+    # a follows b, who follows c: c is suggested to a
+    users = [User(username=name, email=f"{name}@example.com") for name in "abc"]
+    db.session.add_all(users)
+    db.session.commit()
+    a, b, c = users
+    a.follow(b)
+    b.follow(c)
+    db.session.commit()
+    return a, b, c
+
+
+def suggested(user):
+    return [
+        s.suggested_id for s in Suggestion.query.filter_by(user_id=user.id).order_by(Suggestion.rank)
+    ]
+
+
+def stale(user):
+    db.session.refresh(user)
+    return user.suggestions_stale
+
+
+def test_refresh_marks_the_users_fresh(graph):
+    a, b, c = graph
+    assert stale(a) and stale(b)
+    assert suggestions.refresh(workers=1) == {"stale": 2, "users": 2}
+    assert suggested(a) == [c.id]
+    assert not stale(a) and not stale(b)
+    assert suggestions.refresh(workers=1) == {"stale": 0, "users": 0}
+
+
+def test_failed_refresh_leaves_the_users_stale(app, graph, monkeypatch):
+    a, b, c = graph
+    app.config["SUGGESTIONS_BATCH_SIZE"] = 1
+    store = suggestions._store
+
+    def crash_on_the_last_batch(user_ids, rows, fresh=None):
+        if fresh is not None:
+            raise RuntimeError("crashed")
+        store(user_ids, rows, fresh)
+
+    monkeypatch.setattr(suggestions, "_store", crash_on_the_last_batch)
+    with pytest.raises(RuntimeError):
+        suggestions.refresh(workers=1)
+    db.session.rollback()
+    assert stale(a) and stale(b)
+    monkeypatch.undo()
+    suggestions.refresh(workers=1)
+    assert suggested(a) == [c.id]
+    assert not stale(a) and not stale(b)
+
+
+def test_follow_during_refresh_stays_stale(graph, monkeypatch):
+    a, b, c = graph
+    load_graph = suggestions.load_graph
+
+    def follow_then_load_graph():
+        # a follows c once the refresh read the stale users
+        a.follow(c)
+        db.session.commit()
+        return load_graph()
+
+    monkeypatch.setattr(suggestions, "load_graph", follow_then_load_graph)
+    suggestions.refresh(workers=1)
+    assert stale(a) and not stale(b)
+    monkeypatch.undo()
+    suggestions.refresh(workers=1)
+    assert suggested(a) == [] and not stale(a)
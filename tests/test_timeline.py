@@ -0,0 +1,124 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import archive, db, timeline
+from app.models import ArchivedPost, Post, User, followers, reconcile_counters
+from app.pagination import chain_paginate, keyset_chain
+
+
+@pytest.fixture
+def reader(app):
+    # a reader following two of three authors, with posts spread over 20
+    # days and an inbox capped well below them
+    app.config["TIMELINE_MAX_LENGTH"] = 5
+    users = [User(username=name, email=f"{name}@example.com") for name in ("reader", "a", "b", "c")]
+    db.session.add_all(users)
+    db.session.flush()
+    reader = users[0]
+    db.session.execute(
+        followers.insert(), [{"follower_id": reader.id, "followed_id": u.id} for u in users[1:3]]
+    )
+    now = datetime.utcnow()
+    for i in range(80):
+        # every other pair of posts has the same timestamp
+        timestamp = now - timedelta(hours=6 * (i // 2))
+        db.session.add(Post(body=f"post {i}", author=users[i % 4], timestamp=timestamp))
+    db.session.commit()
+    timeline.rebuild_all()
+    return reader
+
+
+def expected(user):
+    # every post of the user and of the users it follows, hot or archived
+    followed = {user.id} | {
+        row.followed_id
+        for row in db.session.execute(followers.select().where(followers.c.follower_id == user.id))
+    }
+    posts = [(p.timestamp, p.id) for p in Post.query.filter(Post.user_id.in_(followed))]
+    posts += [(p.timestamp, p.id) for p in ArchivedPost.query.filter(ArchivedPost.user_id.in_(followed))]
+    return [id for timestamp, id in sorted(posts, reverse=True)]
+
+
+def walk(user, per_page=4):
+    # the ids of every page from the newest, then of every page back from
+    # the oldest one
+    ids, pages, cursor = [], [], None
+    while True:
+        page = chain_paginate(timeline.home_sources(user), cursor, per_page)
+        ids += [post.id for post in page.items]
+        pages.append(page)
+        if not page.next_cursor:
+            break
+        cursor = page.next_cursor
+    back, cursor = [], pages[-1].prev_cursor
+    while cursor:
+        page = chain_paginate(timeline.home_sources(user), cursor, per_page)
+        back = [post.id for post in page.items] + back
+        cursor = page.prev_cursor
+    return ids, [post.id for post in pages[-1].items], back
+
+
+def check(user):
+    ids, last, back = walk(user)
+    assert ids == expected(user)
+    assert back + last == ids
+    assert [row.id for row in keyset_chain(timeline.home_sources(user), 3)] == ids
+
+
+def test_pages_past_the_inbox(reader):
+    assert len(timeline.home_timeline(reader).all()) == 5
+    check(reader)
+
+
+def test_pages_into_the_archive(app, reader):
+    app.config["ARCHIVE_PAUSE"] = 0
+    assert archive.archive(timedelta(days=5), batch_size=7) > 0
+    assert ArchivedPost.query.count() and Post.query.count()
+    check(reader)
+
+
+def test_empty_inbox_reads_pull(reader):
+    db.session.execute(timeline.timeline_table.delete())
+    db.session.commit()
+    check(reader)
+
+
+@pytest.fixture
+def celebrity_fan(app):
+    # a reader following two pushed authors and one pull author, whose posts
+    # reach far past the inbox, with new posts of everyone written through
+    # add_post() trimming the pushed ones from the inbox
+    app.config["TIMELINE_MAX_LENGTH"] = 10
+    app.config["TIMELINE_FANOUT_LIMIT"] = 3
+    names = ["reader", "a", "b", "celebrity"] + [f"fan{i}" for i in range(4)]
+    users = {name: User(username=name, email=f"{name}@example.com") for name in names}
+    db.session.add_all(users.values())
+    db.session.flush()
+    follows = [("reader", "a"), ("reader", "b"), ("reader", "celebrity")]
+    follows += [(f"fan{i}", "celebrity") for i in range(4)]
+    db.session.execute(
+        followers.insert(),
+        [{"follower_id": users[f].id, "followed_id": users[t].id} for f, t in follows],
+    )
+    authors = [users[name] for name in ("reader", "a", "b", "celebrity")]
+    now = datetime.utcnow()
+    for i in range(60):
+        timestamp = now - timedelta(days=30, hours=3 * (i // 2))
+        db.session.add(Post(body=f"old {i}", author=authors[i % 4], timestamp=timestamp))
+    db.session.commit()
+    reconcile_counters()
+    db.session.commit()
+    timeline.rebuild_all()
+    for i in range(30):
+        authors[i % 4].add_post(f"new {i}")
+        db.session.commit()
+    return users["reader"]
+
+
+def test_pages_pushed_posts_past_the_posts_of_pull_authors(celebrity_fan):
+    assert timeline.is_pull_author(User.query.filter_by(username="celebrity").one())
+    assert len(timeline.home_timeline(celebrity_fan).all()) < len(expected(celebrity_fan))
+    ids, last, back = walk(celebrity_fan)
+    assert len(ids) == len(set(ids))
+    check(celebrity_fan)
@@ -0,0 +1,33 @@
+from app import db, user_cache
+from app.models import User, load_user
+
+
+def test_users_are_loaded_from_the_cache(client):
+    id = User.query.filter_by(username="susan").first().id
+    load_user(str(id))
+    hits = user_cache.hits
+    # changed behind the back of the cache, e.g. by another process
+    User.query.filter_by(id=id).update({User.about_me: "changed"})
+    db.session.commit()
+    db.session.expunge_all()
+    assert load_user(str(id)).about_me is None
+    assert user_cache.hits == hits + 1
+
+
+def test_profile_changes_invalidate_the_cache(client):
+    client.get("/index")
+    client.post("/edit_profile", data={"username": "susan", "about_me": "hi there"})
+    db.session.expunge_all()
+    susan = User.query.filter_by(username="susan").first()
+    assert load_user(str(susan.id)).about_me == "hi there"
+    assert b"hi there" in client.get("/user/susan").data
+
+
+def test_null_backend_never_caches(app):
+    app.config["USER_CACHE_BACKEND"] = "app.cache.NullCache"
+    user_cache.init_app(app)
+    db.session.add(User(username="susan", email="susan@example.com"))
+    db.session.commit()
+    load_user("1")
+    load_user("1")
+    assert user_cache.hits == 0 and user_cache.misses == 2